@@ -3,33 +3,128 @@ Main entry point for the HPC Queue Analyser application.
 
 This script:
 - Loads and validates config file for defining analysis groups
-- Retrieves capacity and queue data
-- Builds analysis groups
-- Launches the TUI app
+- Retrieves capacity and queue data (optionally in chunks, within a memory budget)
+- Optionally retrieves priority factors and fairshare, ranking pending jobs within partitions
+- Optionally resolves indeterminate GPU types of running jobs with scontrol
+- Optionally estimates pending job start times
+- Builds analysis groups (optionally in parallel worker processes)
+- Optionally saves the result to a snapshot file, or starts from one instead of querying Slurm
+- Optionally retrieves job history for wait-time percentiles
+- Launches the TUI app (optionally refreshing periodically and tracking job throughput),
+  with a job index for drill-down and search
 """
 
 from src.config_loader import load_yaml, validate_cfg
 from src.queue import get_queue_data
+from src.budget import get_queue_data_within_budget
 from src.capacities import get_capacities
-from src.analysis_group_builder import build_analysis_group_pairs
+from src.analysis_group_builder import build_analysis_group_pairs, compare_build_modes
+from src.forecast import add_start_estimates
+from src.history import get_job_history, compute_wait_time_percentiles
 from src.app import HPCQueueAnalyserApp
-from src.cli_printer import print_analysis_group_block
+from src.transitions import ThroughputTracker
+from src.job_index import JobIndex
+from src.capacity_helpers import get_gpu_types
+from src.scontrol import resolve_indeterminate_gpus, gpu_attribution_df
+from src.snapshot import read_snapshot, write_snapshot, snapshot_ages, stale_snapshot_files
+from src.fetch import set_fetch_policy, fetch_stats_df, stale_snapshots
+from src.cli_printer import (
+    print_analysis_group_block, print_history_block, print_build_benchmark, print_fetch_block,
+    print_snapshot_block,
+)
 import sys
 import argparse
 
 
-def run_stage(name, func, *args):
+def run_stage(name, func, *args, exit_on_error=True):
     """
     Runs a named stage with error handling.
-    Exits the program if the function raises an exception.
+    Exits the program if the function raises an exception (or re-raises it
+    with the stage name when exit_on_error is False, e.g. during a refresh).
     """
     try:
         return func(*args)
     except Exception as e:
+        if not exit_on_error:
+            raise RuntimeError(f"Failed to {name}: {e}") from e
         print(f"Failed to {name}: {e}")
         sys.exit(1)
 
 
+def load_snapshot(args, config, exit_on_error=True, workers=None):
+    """
+    Retrieve capacity and queue data and build the analysis groups for one snapshot of the cluster
+    (or read them from a snapshot file with --snapshot). Groups are built by `workers` processes
+    (default: --workers).
+    """
+    if args.snapshot:
+        return run_stage("read snapshot file", read_snapshot, args.snapshot, exit_on_error=exit_on_error)
+
+    # Load capacities and queue data (queue needs capacity data for GPU assignment)
+    nodes_df, node_partitions_df = run_stage(
+        "retrieve capacity data", get_capacities, exit_on_error=exit_on_error
+    )
+    pending_sums = None
+    if args.max_memory:
+        # Parse squeue output in chunks, reducing pending jobs to per-group aggregates as it goes
+        queue_df, pending_sums = run_stage(
+            "retrieve queue data", get_queue_data_within_budget, nodes_df, node_partitions_df, config,
+            args.max_memory, not args.collapse_arrays, exit_on_error=exit_on_error,
+        )
+    else:
+        queue_df = run_stage(
+            "retrieve queue data", get_queue_data, nodes_df, node_partitions_df, not args.collapse_arrays,
+            args.priority, exit_on_error=exit_on_error,
+        )
+
+    # Attribute indeterminate GPUs of running jobs to GPU types from scontrol's per-node GRES
+    if args.resolve_gpus:
+        queue_df = run_stage(
+            "resolve indeterminate GPUs", resolve_indeterminate_gpus, queue_df, get_gpu_types(nodes_df),
+            exit_on_error=exit_on_error,
+        )
+
+    # Estimate start times of pending jobs (adds an est_start column to the queue)
+    if args.forecast:
+        queue_df = run_stage(
+            "estimate pending job start times", add_start_estimates, queue_df, nodes_df, node_partitions_df,
+            exit_on_error=exit_on_error,
+        )
+
+    # Build analysis groups (correspond to tabs in the app)
+    analysis_group_pairs = run_stage(
+        "build analysis group pairs",
+        build_analysis_group_pairs,
+        queue_df,
+        nodes_df,
+        node_partitions_df,
+        config,
+        args.workers if workers is None else workers,
+        pending_sums,
+        exit_on_error=exit_on_error,
+    )
+
+    # Save the snapshot for other processes to start from (see --snapshot)
+    if args.save_snapshot:
+        run_stage(
+            "write snapshot file", write_snapshot, args.save_snapshot,
+            nodes_df, node_partitions_df, queue_df, analysis_group_pairs,
+            exit_on_error=exit_on_error,
+        )
+
+    return nodes_df, node_partitions_df, queue_df, analysis_group_pairs
+
+
+def load_app_snapshot(args, config):
+    """
+    Load a snapshot for the app: the queue, its analysis groups and a job index for drill-down.
+    Refreshes run in a Textual worker thread, and forking a process pool from a thread can deadlock
+    the child on a lock held by another thread, so refreshed groups are built serially.
+    """
+    nodes_df, _, queue_df, analysis_group_pairs = load_snapshot(args, config, exit_on_error=False, workers=1)
+    return queue_df, analysis_group_pairs, JobIndex(queue_df, get_gpu_types(nodes_df))
+
+
 if __name__ == "__main__":
 
     # Parse command line arguments
@@ -39,32 +134,162 @@ if __name__ == "__main__":
         action="store_true",
         help="Run in CLI mode (print summary tables) instead of launching the TUI app",
     )
+    parser.add_argument(
+        "--collapse-arrays",
+        action="store_true",
+        help="Keep pending job arrays collapsed (one weighted row per array) instead of one row per task",
+    )
+    parser.add_argument(
+        "--resolve-gpus",
+        action="store_true",
+        help="Look up running jobs with indeterminate GPU types with 'scontrol -d show job' (cached per job)",
+    )
+    parser.add_argument(
+        "--priority",
+        action="store_true",
+        help="Also fetch priority factors (sprio) and fairshare (sshare), and rank pending jobs within partitions",
+    )
+    parser.add_argument(
+        "--forecast",
+        action="store_true",
+        help="Estimate when pending jobs will start by simulating the scheduler",
+    )
+    parser.add_argument(
+        "--history-days",
+        type=int,
+        default=None,
+        metavar="DAYS",
+        help="Also report wait-time percentiles for jobs that ended in the last DAYS days (uses sacct)",
+    )
+    parser.add_argument(
+        "--max-memory",
+        type=float,
+        default=None,
+        metavar="MB",
+        help="Parse squeue output in chunks of about MB megabytes, reducing pending jobs to per-group "
+             "totals as it goes (for very large queues; medians are then within 1%%)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        metavar="N",
+        help="Build analysis groups in N worker processes (useful for configs with many groups)",
+    )
+    parser.add_argument(
+        "--build-benchmark",
+        action="store_true",
+        help="Time serial vs. parallel (--workers) analysis group builds and print the speedup",
+    )
+    parser.add_argument(
+        "--refresh",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Reload the queue every SECONDS seconds in the TUI and show job throughput between refreshes",
+    )
+    parser.add_argument(
+        "--snapshot",
+        default=None,
+        metavar="PATH",
+        help="Start from a snapshot file written with --save-snapshot instead of querying Slurm "
+             "(re-read on every --refresh)",
+    )
+    parser.add_argument(
+        "--save-snapshot",
+        default=None,
+        metavar="PATH",
+        help="Write the loaded snapshot (queue, capacities and analysis groups) to PATH, on every --refresh",
+    )
+    parser.add_argument(
+        "--fetch-timeout",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Kill a Slurm command (sinfo/squeue/sacct) that runs longer than this (default 30)",
+    )
+    parser.add_argument(
+        "--fetch-retries",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Retry a failed Slurm command up to N times with exponential backoff (default 2)",
+    )
+    parser.add_argument(
+        "--fetch-max-age",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Fail instead of showing the last good output of a failed Slurm command older than this (default 3600)",
+    )
     args = parser.parse_args()
+    if args.max_memory:
+        # These need every pending job (or job ID) individually
+        for flag in ["priority", "forecast", "resolve_gpus"]:
+            if getattr(args, flag):
+                parser.error(f"--{flag.replace('_', '-')} cannot be combined with --max-memory")
+    if args.snapshot:
+        # These change how a snapshot is loaded from Slurm, and a snapshot file is already loaded
+        for flag in ["priority", "forecast", "resolve_gpus", "max_memory", "collapse_arrays", "save_snapshot"]:
+            if getattr(args, flag):
+                parser.error(f"--{flag.replace('_', '-')} cannot be combined with --snapshot")
+    run_stage(
+        "set fetch policy", set_fetch_policy, args.fetch_timeout, args.fetch_retries, None, args.fetch_max_age,
+    )
 
     # Load and validate configuration YAML file
     config = run_stage("load config file", load_yaml)
     run_stage("validate configuration file", validate_cfg, config)
 
-    # Load capacities and queue data (queue needs capacity data for GPU assignment)
-    capacities_df = run_stage("retrieve capacity data", get_capacities)
-    queue_df = run_stage("retrieve queue data", get_queue_data, capacities_df)
+    # Load capacities, queue data and analysis groups (refreshed periodically with --refresh)
+    nodes_df, node_partitions_df, queue_df, analysis_group_pairs = load_snapshot(args, config)
 
-    # Build analysis groups (correspond to tabs in the app)
-    analysis_group_pairs = run_stage(
-        "build analysis group pairs",
-        build_analysis_group_pairs,
-        queue_df,
-        capacities_df,
-        config,
-    )
+    if args.build_benchmark:
+        build_times_df = run_stage(
+            "benchmark analysis group builds", compare_build_modes,
+            queue_df, nodes_df, node_partitions_df, config, args.workers,
+        )
+        print_build_benchmark(build_times_df)
+
+    # Historical wait times from sacct (optional, past windows are cached on disk)
+    wait_time_dfs = None
+    if args.history_days:
+        history_df = run_stage(
+            "retrieve job history", get_job_history, args.history_days, nodes_df, node_partitions_df
+        )
+        wait_time_dfs = (
+            compute_wait_time_percentiles(history_df, "partition"),
+            compute_wait_time_percentiles(history_df[history_df["gpu"] > 0], "gpu_type"),
+        )
 
     if args.cli:
         # CLI mode: print summaries and allocations
         for running_group, pending_group in analysis_group_pairs:
             print_analysis_group_block(running_group, pending_group)
+        if wait_time_dfs is not None:
+            print_history_block(*wait_time_dfs)
+        if args.snapshot:
+            print_snapshot_block(snapshot_ages(), stale_snapshot_files())
+        else:
+            print_fetch_block(fetch_stats_df(), stale_snapshots(), gpu_attribution_df())
     else:
+        # Throughput is measured between refreshes, starting from the snapshot loaded above
+        # (it follows job IDs, and --max-memory doesn't keep pending jobs)
+        throughput_tracker = None
+        if args.refresh and not args.max_memory:
+            throughput_tracker = ThroughputTracker()
+            throughput_tracker.update(queue_df, analysis_group_pairs)
+
+        # Index the jobs for drill-down and search
+        job_index = run_stage("build job index", JobIndex, queue_df, get_gpu_types(nodes_df))
+
         # Launch the app
-        run_stage(
-            "execute HPC queue analysis app",
-            HPCQueueAnalyserApp(analysis_group_pairs).run,
+        app = HPCQueueAnalyserApp(
+            analysis_group_pairs,
+            wait_time_dfs,
+            refresh_interval=args.refresh,
+            load_snapshot=lambda: load_app_snapshot(args, config),
+            throughput_tracker=throughput_tracker,
+            job_index=job_index,
         )
+        run_stage("execute HPC queue analysis app", app.run)
@@ -5,43 +5,299 @@ HPC job queue and associated capacity data.
 Each AnalysisGroup instance represents one analysis group (e.g. a partition,
 GPU type, or user subset) and provides:
 
-- summary statistics (users, jobs, median pending time)
+- summary statistics (users, jobs, median, p90 and p99 pending time)
 - resource allocation vs. capacity
 - breakdowns by user and partition
 - pending time analysis by partition and reason
+- mergeable pending time sketches for the whole group and per partition and
+  reason (see src/sketch.py), from which the p90/p99 figures are read
+- estimated start times by partition (when the queue has been forecast)
+- priority factors, fairshare and best partition rank per user (when sprio
+  and sshare data were fetched)
+- per-node allocation and a fragmentation score per resource (when given a
+  NodeAllocationMatrix for the group's nodes)
 
 These precomputed DataFrames are used by both the CLI and TUI layers to
-render tables and visualisations of cluster utilisation.
+render tables and visualisations of cluster utilisation. The summary,
+allocation, user and partition figures of many groups can be computed at once
+with aggregate_groups (one groupby over all their rows) and handed to each
+group, rather than aggregated group by group.
+
+Each queue row carries a `tasks` weight (the number of array tasks it stands
+for), so counts, resource sums and pending-time medians are identical whether
+job arrays were expanded into one row per task or left collapsed.
 """
 
+import numpy as np
 import pandas as pd
 
+from src.priority import FACTOR_COLUMNS
+from src.sketch import QuantileSketch, sketch_by_group
+
+# Attributes derived from the queue slice, left out of detached_state()
+QUEUE_ATTRIBUTES = {"queue", "weighted_resources"}
+
+
+def weighted_median(values: pd.Series, weights: pd.Series):
+    """
+    Median of values where each value is repeated `weight` times.
+
+    Matches pandas' median on the expanded data: NaN/NaT values are skipped and,
+    for an even total weight, the two middle values are averaged.
+    """
+    valid = values.notna()
+    values, weights = values[valid], weights[valid]
+    if values.empty:
+        return values.median()
+
+    order = np.argsort(values.to_numpy(), kind="stable")
+    sorted_values = values.iloc[order]
+    cumulative = np.cumsum(weights.to_numpy()[order])
+    total = cumulative[-1]
+
+    # Positions of the two middle elements in the expanded (sorted) data
+    lower = sorted_values.iloc[np.searchsorted(cumulative, (total - 1) // 2, side="right")]
+    upper = sorted_values.iloc[np.searchsorted(cumulative, total // 2, side="right")]
+    return lower + (upper - lower) / 2
+
+def sketch_times(sketch: QuantileSketch, qs: list[float]) -> list[pd.Timedelta]:
+    """Read quantiles of a pending time sketch (in seconds) as timedeltas rounded down to the second."""
+    return [pd.Timedelta(seconds=value).floor("s") if not np.isnan(value) else pd.NaT
+            for value in sketch.quantiles(qs)]
+
+def _split_by_group(table: pd.DataFrame, n_groups: int) -> list[pd.DataFrame]:
+    """Split a table indexed by (group code, *keys) into one table per group code, with the keys as first columns."""
+    parts = {code: part.droplevel(0).reset_index() for code, part in table.groupby(level=0, sort=False)}
+    empty = table.iloc[:0].droplevel(0).reset_index()
+    return [parts.get(code, empty) for code in range(n_groups)]
+
+def _split_sketches(sketches: dict, n_groups: int) -> list[dict]:
+    """Split sketches keyed by (group code, *keys) into one dict per group code, keyed by the remaining keys."""
+    split = [{} for _ in range(n_groups)]
+    for (code, *keys), sketch in sketches.items():
+        split[code][tuple(keys)] = sketch
+    return split
+
+def sum_groups(queue: pd.DataFrame, codes: np.ndarray, resources: list[str]) -> dict:
+    """
+    Return the mergeable aggregates of several groups, where `codes` gives the group of each queue row:
+    - totals, users, partitions: jobs and resource sums per group, (group, user) and (group, partition)
+    - reasons: the same sums over pending rows per (group, partition, reason), and their best rank
+      (when the queue is ranked)
+    - sketches, reason_sketches: pending time sketches per group and per (group, partition, reason)
+
+    Aggregates of disjoint rows (e.g. chunks of the queue) are combined with merge_group_sums.
+    """
+    sums = queue[resources].mul(queue["tasks"], axis=0).assign(jobs=queue["tasks"]).loc[:, ["jobs", *resources]]
+    pending = (queue["state"] == "PENDING").to_numpy()
+    times = pd.DataFrame({"group": codes, "partition": queue["partition"].to_numpy(),
+                          "reason": queue["reason"].to_numpy(), "pending_time": queue["pending_time"].to_numpy(),
+                          "tasks": queue["tasks"].to_numpy()})
+    reason_keys = [codes[pending], times["partition"].to_numpy()[pending], times["reason"].to_numpy()[pending]]
+
+    reasons = sums[pending].groupby(reason_keys).sum().rename_axis(["group", "partition", "reason"])
+    if "rank" in queue.columns:
+        reasons = reasons.assign(rank=queue["rank"][pending].groupby(reason_keys).min().to_numpy())
+
+    return {
+        "totals": sums.groupby(codes).sum().rename_axis("group"),
+        "users": sums.groupby([codes, queue["user"].to_numpy()]).sum().rename_axis(["group", "user"]),
+        "partitions": sums.groupby([codes, times["partition"].to_numpy()]).sum().rename_axis(["group", "partition"]),
+        "reasons": reasons,
+        "sketches": sketch_by_group(times, ["group"], "pending_time", "tasks"),
+        "reason_sketches": sketch_by_group(times[pending], ["group", "partition", "reason"], "pending_time", "tasks"),
+    }
+
+def merge_group_sums(sums: dict, other: dict) -> dict:
+    """Combine the aggregates of sum_groups over two disjoint sets of rows (the sketches of `sums` are updated)."""
+    def add(table, other_table, how="sum"):
+        combined = pd.concat([table, other_table])
+        return combined.groupby(level=list(range(combined.index.nlevels))).agg(how)
+
+    def merge_sketches(sketches, other_sketches):
+        for key, sketch in other_sketches.items():
+            sketches[key] = sketches[key].merge(sketch) if key in sketches else sketch
+        return sketches
+
+    reasons = add(sums["reasons"].drop(columns="rank", errors="ignore"),
+                  other["reasons"].drop(columns="rank", errors="ignore"))
+    if "rank" in sums["reasons"].columns:
+        reasons = reasons.assign(rank=add(sums["reasons"]["rank"], other["reasons"]["rank"], "min"))
+
+    return {
+        **{key: add(sums[key], other[key]) for key in ["totals", "users", "partitions"]},
+        "reasons": reasons,
+        **{key: merge_sketches(sums[key], other[key]) for key in ["sketches", "reason_sketches"]},
+    }
+
+def _allocation_summary(sums: pd.DataFrame, capacities: pd.DataFrame) -> pd.DataFrame:
+    """
+    Format jobs and resource sums indexed by (group code, key) as allocation summary rows, with
+    percentages of each group's capacity and the GPU types the group has listed as "type: count".
+    """
+    cap = capacities.iloc[sums.index.get_level_values(0)].set_axis(sums.index)
+    gpu_cols = [res for res in capacities.columns if res not in {"cpu", "mem_gb"}]
+
+    df = sums.round().astype(int)
+    text = pd.Series("", index=df.index, dtype=object)
+    for gpu in gpu_cols:
+        label = text.where(text == "", text + ", ") + f"{gpu}: " + df[gpu].astype(str)
+        text = text.mask((df[gpu] > 0) & (cap[gpu] != 0), label)
+
+    return (df
+            .assign(**{f"{res} %": df[res].div(cap[res]).mul(100).round().astype(int) for res in ["cpu", "mem_gb"]})
+            .assign(gpu=text.mask(text == "", "—"))
+            .loc[:, ["jobs", "cpu", "cpu %", "mem_gb", "mem_gb %", "gpu"]])
+
+def _pending_time_summary(reasons: pd.DataFrame, medians: pd.Series, reason_sketches: dict) -> pd.DataFrame:
+    """
+    Format sums per (group code, partition, reason) as pending time rows: jobs, median and p90/p99
+    pending time, best rank (when ranked) and rounded resource sums, with the Priority and Resources
+    reasons first within each group.
+    """
+    resources = [col for col in reasons.columns if col not in {"jobs", "rank"}]
+    tails = pd.DataFrame([sketch_times(reason_sketches.get(key, QuantileSketch()), [0.9, 0.99])
+                          for key in reasons.index],
+                         index=reasons.index, columns=["p90 pending time", "p99 pending time"],
+                         dtype="timedelta64[ns]")
+
+    df = pd.concat([
+        reasons[["jobs"]].astype(int),
+        medians.reindex(reasons.index).astype("timedelta64[ns]").dt.floor("s").rename("median pending time"),
+        tails,
+        *([reasons["rank"].astype("Int64").rename("best rank")] if "rank" in reasons.columns else []),
+        reasons[resources].round().astype(int),
+    ], axis=1)
+
+    # Prioritize key reasons
+    later = ~df.index.get_level_values("reason").isin({"Priority", "Resources"})
+    order = np.lexsort((later, df.index.get_level_values("group")))
+    return df.iloc[order]
+
+def format_group_sums(sums: dict, capacities: pd.DataFrame, medians: pd.Series | None = None,
+                      reason_medians: pd.Series | None = None) -> list[dict]:
+    """
+    Turn the aggregates of sum_groups into each group's tables, where `capacities` has one row per
+    group (its index positions are the codes). Medians are exact when given (indexed by group, and by
+    (group, partition, reason)), and otherwise read from the sketches, within their relative accuracy.
+
+    Each group gets a dict of:
+    - jobs, resources: job count and resource sums
+    - users, partitions: allocation summary per user and per partition
+    - median, sketch: median pending time and pending time sketch
+    - pending_times, pending_time_sketches: pending time summary and sketches per (partition, reason)
+    """
+    n_groups = len(capacities)
+    totals = sums["totals"].reindex(range(n_groups), fill_value=0)
+    sketches = [sums["sketches"].get((code,), QuantileSketch()) for code in range(n_groups)]
+    if medians is None:
+        medians = pd.Series(pd.to_timedelta([sketch.median() for sketch in sketches], unit="s"))
+    if reason_medians is None:
+        reason_medians = pd.Series(pd.to_timedelta([sums["reason_sketches"].get(key, QuantileSketch()).median()
+                                                    for key in sums["reasons"].index], unit="s"),
+                                   index=sums["reasons"].index)
+
+    medians = medians.reindex(range(n_groups))
+    users, partitions = [_split_by_group(_allocation_summary(sums[key], capacities), n_groups)
+                         for key in ["users", "partitions"]]
+    pending_times = _split_by_group(_pending_time_summary(sums["reasons"], reason_medians, sums["reason_sketches"]),
+                                    n_groups)
+    reason_sketches = _split_sketches(sums["reason_sketches"], n_groups)
+
+    return [{"jobs": totals["jobs"].iat[code], "resources": totals.iloc[code].drop("jobs"),
+             "users": users[code], "partitions": partitions[code],
+             "median": medians.iat[code], "sketch": sketches[code],
+             "pending_times": pending_times[code], "pending_time_sketches": reason_sketches[code]}
+            for code in range(n_groups)]
+
+def aggregate_groups(queue: pd.DataFrame, codes: np.ndarray, capacities: pd.DataFrame) -> list[dict]:
+    """
+    Compute the tables of several groups at once (see format_group_sums), where `codes` gives the group
+    of each queue row. Each table comes from one groupby over all rows and is then split per group;
+    medians are exact.
+    """
+    sums = sum_groups(queue, codes, list(capacities.columns))
+
+    pending_time, tasks = queue["pending_time"], queue["tasks"]
+    positions = pd.Series(codes).groupby(codes).indices
+    medians = pd.Series([weighted_median(pending_time.iloc[pos], tasks.iloc[pos]) for pos in positions.values()],
+                        index=list(positions), dtype="timedelta64[ns]")
+
+    # Row positions of each (group, partition, reason) of pending rows, in the order of sums["reasons"]
+    pending = np.flatnonzero((queue["state"] == "PENDING").to_numpy())
+    reason_positions = (pd.Series(pending)
+                        .groupby([codes[pending], queue["partition"].to_numpy()[pending],
+                                  queue["reason"].to_numpy()[pending]]).indices)
+    reason_medians = pd.Series([weighted_median(pending_time.iloc[pending[reason_positions[key]]],
+                                                tasks.iloc[pending[reason_positions[key]]])
+                                for key in sums["reasons"].index],
+                               index=sums["reasons"].index, dtype="timedelta64[ns]")
+    return format_group_sums(sums, capacities, medians, reason_medians)
+
 class AnalysisGroup:
-    def __init__(self,name,queue,capacity):
+    def __init__(self,name,queue,capacity,node_matrix=None,aggregates=None):
+        """
+        `aggregates` are the group's entry of aggregate_groups() when it was computed for several
+        groups at once (e.g. the groups of a template); otherwise it is computed from the queue slice.
+        """
         self.name = name
-        self.queue = queue
         self.capacity = capacity[capacity != 0]
         self.resource_list = list(self.capacity.index)
-    
-        self.summary_stats_df = self._compute_summary_stats_df()
-        self.allocation_df = self._compute_allocation_df()
-        self.grpby_user_df = self._compute_user_allocation_df()
-        self.grpby_partition_df = self._compute_partition_allocation_df()
-        self.pending_time_df = self._compute_pending_time_df()
-
-    def _compute_summary_stats_df(self) -> pd.DataFrame:
-        nunique_users = self.queue['user'].nunique()
-        nunique_jobs = self.queue['jobid'].nunique()
-        median = self.queue["pending_time"].median()
+        self.attach_queue(queue)
+        if aggregates is None:
+            aggregates = aggregate_groups(self.queue, np.zeros(len(self.queue), dtype=int),
+                                          self.capacity.to_frame().T)[0]
+
+        self.pending_time_sketch = aggregates["sketch"]
+        self.pending_time_sketches = aggregates["pending_time_sketches"]
+
+        self.summary_stats_df = self._compute_summary_stats_df(aggregates)
+        self.allocation_df = self._compute_allocation_df(aggregates["resources"])
+        self.grpby_user_df = aggregates["users"]
+        self.grpby_partition_df = aggregates["partitions"]
+        self.pending_time_df = self._compute_pending_time_df(aggregates["pending_times"])
+        self.start_estimate_df = self._compute_start_estimate_df()
+        self.priority_by_user_df = self._compute_priority_by_user_df()
+        self.node_allocation_df = self._compute_node_allocation_df(node_matrix)
+        self.fragmentation_df = self._compute_fragmentation_df(node_matrix)
+
+    def attach_queue(self, queue: pd.DataFrame):
+        """Set the group's queue slice (e.g. after the group was built in another process)."""
+        self.queue = queue
+
+        # Resource totals per row (per-task request multiplied by number of array tasks)
+        self.weighted_resources = self.queue[self.resource_list].mul(self.queue["tasks"], axis=0)
+
+    def detached_state(self) -> dict:
+        """
+        Return the group's attributes without its queue slice, which is by far the largest one.
+        Used to send a group to another process or file that can re-attach the slice from its own
+        copy of the queue (see from_state).
+        """
+        return {k: v for k, v in self.__dict__.items() if k not in QUEUE_ATTRIBUTES}
+
+    @classmethod
+    def from_state(cls, state: dict, queue: pd.DataFrame) -> "AnalysisGroup":
+        """Rebuild a group from detached_state() and its queue slice."""
+        group = cls.__new__(cls)
+        group.__dict__.update(state)
+        group.attach_queue(queue)
+        return group
+
+    def _compute_summary_stats_df(self, aggregates: dict) -> pd.DataFrame:
+        nunique_users = len(aggregates["users"])
+        nunique_jobs = aggregates["jobs"]
+        median = aggregates["median"]
         median_pending_time = "N/A" if pd.isna(median) else median.floor("s")
+        p90, p99 = [("N/A" if pd.isna(t) else t) for t in sketch_times(self.pending_time_sketch, [0.9, 0.99])]
 
         return pd.DataFrame({
-            "Metric": ["Users", "Jobs", "Pending Time (Median)"],
-            "Value": [nunique_users, nunique_jobs, median_pending_time]
+            "Metric": ["Users", "Jobs", "Pending Time (Median)", "Pending Time (p90)", "Pending Time (p99)"],
+            "Value": [nunique_users, nunique_jobs, median_pending_time, p90, p99]
         })
     
-    def _compute_allocation_df(self) -> pd.DataFrame:
-        allocation = self.queue[self.resource_list].sum().round().astype(int)
+    def _compute_allocation_df(self, resources: pd.Series) -> pd.DataFrame:
+        allocation = resources[self.resource_list].round().astype(int)
         capacity = self.capacity.round().astype(int)
         allocation_pc = allocation.div(capacity).mul(100).round().astype(int)
 
@@ -52,66 +308,96 @@ class AnalysisGroup:
             "Allocation %": allocation_pc.values
         })
 
-    def _compute_user_allocation_df(self):
-        return self.compute_allocation_summary_df("user")
-
-    def _compute_partition_allocation_df(self):
-        return self.compute_allocation_summary_df("partition")
-
-    def compute_allocation_summary_df(self, groupby_col: str) -> pd.DataFrame:
-        """Compute resource allocation summary grouped by a given column (e.g. 'user', 'partition')."""
-
-        agg_dict = {
-            "jobs": ("jobid", "count"),
-            **{res: (res, "sum") for res in self.resource_list}
-        }
-
-        cap = self.capacity.loc[self.resource_list]
-        gpu_cols = [res for res in self.resource_list if res not in {"cpu", "mem_gb"}]
-
-        def summarize_gpus(row):
-            used = {gpu: row[gpu] for gpu in gpu_cols if row[gpu] > 0}
-            return ", ".join(f"{gpu}: {count}" for gpu, count in used.items()) if used else "—"
-
-        return (
-            self.queue
-            .groupby(groupby_col)
-            .agg(**agg_dict)
-            .pipe(lambda df: df.assign(**{res: df[res].round().astype(int) for res in self.resource_list}))
-            .pipe(lambda df: df.assign(
-                **{f"{res} %": df[res].div(cap[res]).mul(100).round().astype(int) for res in ["cpu", "mem_gb"]}
-            ))
-            .assign(gpu=lambda df: df.apply(summarize_gpus, axis=1))
-            .drop(columns=gpu_cols)
-            .reset_index()
-            .loc[:, [groupby_col, "jobs", "cpu", "cpu %", "mem_gb", "mem_gb %", "gpu"]]
-        )
-
-    def _compute_pending_time_df(self) -> pd.DataFrame:
-        """Compute job counts, median pending time, and median resource requests grouped by partition and reason."""
-
-        df = self.queue.copy()
-        df = df[df["state"] == "PENDING"]
-
-        # Group and aggregate
-        agg_dict = {
-            "jobs": ("jobid", "count"),
-            "median pending time": ("pending_time", "median"),
-            **{res: (res, "sum") for res in self.resource_list}
-        }
-
-        grouped = df.groupby(["partition", "reason"]).agg(**agg_dict)
-
-        # Format time and round resources
-        grouped["median pending time"] = grouped["median pending time"].dt.floor("s")
-        for res in self.resource_list:
-            grouped[res] = grouped[res].round().astype(int)
-
-        grouped = grouped.reset_index()
-
-        # Prioritize key reasons
-        priority_reasons = {"Priority", "Resources"}
-        top = grouped[grouped["reason"].isin(priority_reasons)]
-        bottom = grouped[~grouped["reason"].isin(priority_reasons)]
-
-        return pd.concat([top, bottom], ignore_index=True)
+    def _compute_pending_time_df(self, pending_times: pd.DataFrame) -> pd.DataFrame:
+        """Select the group's resources from the job counts, pending times and resource sums per partition and reason."""
+        columns = ["partition", "reason", "jobs", "median pending time", "p90 pending time", "p99 pending time"]
+        if "best rank" in pending_times.columns:
+            columns.append("best rank")
+        return pending_times.loc[:, columns + self.resource_list]
+
+    def _compute_start_estimate_df(self) -> pd.DataFrame:
+        """
+        Compute job counts and estimated time until start of pending jobs grouped by partition.
+
+        Jobs with GPUs of unknown type are not estimated, and are counted separately from
+        jobs that do not start within the forecast horizon.
+        """
+        columns = ["partition", "jobs", "median est. start", "latest est. start", "not within horizon",
+                   "unknown GPU type"]
+        if "est_start" not in self.queue.columns:
+            return pd.DataFrame(columns=columns)
+
+        pending = self.queue["state"] == "PENDING"
+        df = self.queue.loc[pending, ["partition", "tasks", "est_start"]]
+        unknown_gpu = (self.queue.loc[pending, "indeterminate_gpu"] > 0
+                       if "indeterminate_gpu" in self.queue.columns else pd.Series(False, index=df.index))
+        df["unknown"] = df["tasks"].where(unknown_gpu, 0)
+        df["unscheduled"] = df["tasks"].where(df["est_start"].isna() & ~unknown_gpu, 0)
+
+        groups = df.groupby("partition")
+        grouped = groups.agg(**{
+            "jobs": ("tasks", "sum"),
+            "latest est. start": ("est_start", "max"),
+            "not within horizon": ("unscheduled", "sum"),
+            "unknown GPU type": ("unknown", "sum"),
+        })
+        grouped["median est. start"] = pd.Series(
+            [weighted_median(g["est_start"], g["tasks"]) for _, g in groups],
+            index=grouped.index, dtype="timedelta64[ns]").dt.floor("s")
+
+        return grouped.reset_index().loc[:, columns]
+
+    def _compute_priority_by_user_df(self) -> pd.DataFrame:
+        """Compute pending jobs, best partition rank, median priority factors and fairshare per user."""
+        if "rank" not in self.queue.columns:
+            return pd.DataFrame(columns=["user"])
+
+        pending = self.queue[self.queue["state"] == "PENDING"]
+        medians = ["priority"] + [col for col in FACTOR_COLUMNS if col in pending.columns]
+
+        groups = pending.groupby("user")
+        grouped = groups.agg(**{
+            "jobs": ("tasks", "sum"),
+            "best rank": ("rank", "min"),
+            "fairshare_factor": ("fairshare_factor", "first"),
+            "effective_usage": ("effective_usage", "first"),
+        })
+        for col in reversed(medians):
+            grouped.insert(2, f"median {col}" if col == "priority" else col, pd.Series(
+                [weighted_median(g[col], g["tasks"]) for _, g in groups], index=grouped.index))
+
+        integer_cols = ["best rank", "median priority", *medians[1:]]
+        grouped[integer_cols] = grouped[integer_cols].round().astype("Int64")
+        return grouped.sort_values("best rank").reset_index()
+
+    def _node_resources(self, node_matrix) -> list[int]:
+        """Column positions in the node matrix of this group's resources."""
+        return [node_matrix.resources.index(res) for res in self.resource_list if res in node_matrix.resources]
+
+    def _compute_node_allocation_df(self, node_matrix) -> pd.DataFrame:
+        """Compute allocation % per node (rows) and resource (columns) of running jobs."""
+        if node_matrix is None:
+            return pd.DataFrame(columns=["node"])
+
+        cols = self._node_resources(node_matrix)
+        df = pd.DataFrame(node_matrix.allocation_pc()[:, cols],
+                          columns=[node_matrix.resources[i] for i in cols])
+        df.insert(0, "node", node_matrix.nodes)
+        return df
+
+    def _compute_fragmentation_df(self, node_matrix) -> pd.DataFrame:
+        """Compute free capacity, and the share of it on partially allocated nodes, per resource."""
+        columns = ["Resource", "Free", "Free on idle nodes", "Fragmentation %"]
+        if node_matrix is None:
+            return pd.DataFrame(columns=columns)
+
+        cols = self._node_resources(node_matrix)
+        free = np.clip(node_matrix.capacity - node_matrix.allocated, 0, None)[:, cols]
+        idle = (node_matrix.allocated[:, cols] == 0)
+
+        return pd.DataFrame({
+            "Resource": [node_matrix.resources[i] for i in cols],
+            "Free": free.sum(axis=0).round().astype(int),
+            "Free on idle nodes": (free * idle).sum(axis=0).round().astype(int),
+            "Fragmentation %": (node_matrix.fragmentation()[cols] * 100).round().astype(int),
+        })
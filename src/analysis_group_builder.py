@@ -1,9 +1,31 @@
 """
 Builds analysis groups from queue and capacity data using configurable filters.
+
+Config entries are first expanded into groups. A `group_by` template entry
+gives one group per partition or GPU type: the rows of all its groups come
+from one grouping pass, and are gathered into one frame ordered by group and
+state, so each group's running and pending rows are contiguous slices of it.
+The capacities, and the summary, allocation, user and partition aggregates of
+all the template's groups, are then each computed with one groupby over that
+frame and split per group.
+
+The remaining tables of each group are computed from its own queue slice,
+serially or fanned out over a pool of forked worker processes, with the groups
+of a template spread over the workers like any others. Workers inherit the
+queue, capacity and node allocation data from the parent process through fork
+(copy-on-write, so the frames are never pickled); each worker only sends back
+the group's computed tables plus the row positions of its queue slice, which
+the parent re-attaches from its own copy of the queue.
 """
 
+import multiprocessing
+import time
+
+import numpy as np
 import pandas as pd
-from src.analysis_group import AnalysisGroup
+from src.analysis_group import AnalysisGroup, aggregate_groups, format_group_sums, sum_groups
+from src.capacity_helpers import get_gpu_types
+from src.node_matrix import NodeAllocationMatrix
 
 
 def _apply_partition_filter(df, partitions):
@@ -53,58 +75,329 @@ def _apply_custom_filter(df, mask_expr, context_name):
         return pd.Series(True, index=df.index)
 
 
-def build_analysis_group_pairs(queue: pd.DataFrame, capacity: pd.DataFrame, config: dict):
+def _partition_node_mask(nodes_df, node_partitions_df, partitions, mask_expr):
+    """
+    Return a node mask selecting nodes with at least one partition row that passes the
+    partition filter and custom capacity mask (evaluated on per (node, partition) rows).
+    """
+    if (not partitions or partitions == "*") and (not mask_expr or mask_expr == "*"):
+        return np.ones(len(nodes_df), dtype=bool)
+
+    if mask_expr and mask_expr != "*":
+        # Custom masks may refer to any capacity column, so they see the joined per-partition view
+        rows = (nodes_df.iloc[node_partitions_df["node_id"]]
+                .reset_index(drop=True)
+                .assign(partition=node_partitions_df["partition"].astype(str).to_numpy()))
+    else:
+        rows = node_partitions_df
+
+    row_mask = (_apply_partition_filter(rows, partitions)
+                & _apply_custom_filter(rows, mask_expr, "capacity")).to_numpy(dtype=bool)
+
+    node_mask = np.zeros(len(nodes_df), dtype=bool)
+    node_mask[node_partitions_df["node_id"].to_numpy()[row_mask]] = True
+    return node_mask
+
+
+def _entry_masks(queue: pd.DataFrame, nodes_df: pd.DataFrame, node_partitions_df: pd.DataFrame, criteria: dict):
+    """Return the queue row mask and node mask selected by a config entry's criteria."""
+    qmask = (
+        _apply_partition_filter(queue, criteria.get("partitions"))
+        & _apply_user_filter(queue, criteria.get("users"))
+        & _apply_gpu_filter(queue, criteria.get("gpu_types"))
+        & _apply_node_filter(queue, criteria.get("nodes"))
+        & _apply_custom_filter(queue, criteria.get("custom_queue_mask"), "queue")
+    )
+
+    node_mask = (
+        (_apply_gpu_filter(nodes_df, criteria.get("gpu_types"))
+         & _apply_node_filter(nodes_df, criteria.get("nodes"))).to_numpy(dtype=bool)
+        & _partition_node_mask(nodes_df, node_partitions_df, criteria.get("partitions"),
+                               criteria.get("custom_capacity_mask"))
+    )
+    return qmask.to_numpy(dtype=bool), node_mask
+
+
+def _group_by_partition(queue, nodes_df, node_partitions_df, qpos, node_ids):
+    """Split queue row positions and node ids by partition (a job is in every partition it was submitted to)."""
+    if "partition_list" in queue.columns:
+        # Jobs missing from the short squeue output (e.g. ended between the two calls) have no list
+        lists = [lst if isinstance(lst, list) else [] for lst in queue["partition_list"].to_numpy()[qpos]]
+        lengths = np.fromiter(map(len, lists), dtype=int, count=len(lists))
+        job_pos = np.repeat(qpos, lengths)
+        job_partitions = np.concatenate(lists) if len(job_pos) else np.array([], dtype=object)
+    else:
+        job_pos, job_partitions = qpos, queue["partition"].to_numpy()[qpos]
+
+    selected = np.zeros(len(nodes_df), dtype=bool)
+    selected[node_ids] = True
+    bridge = node_partitions_df[selected[node_partitions_df["node_id"].to_numpy()]]
+    bridge_ids = bridge["node_id"].to_numpy()
+
+    queue_groups = pd.Series(job_pos).groupby(job_partitions).indices
+    node_groups = pd.Series(bridge_ids).groupby(bridge["partition"].astype(str).to_numpy()).indices
+
+    return {
+        partition: (job_pos[queue_groups[partition]] if partition in queue_groups else np.array([], dtype=int),
+                    np.sort(bridge_ids[rows]))
+        for partition, rows in sorted(node_groups.items())
+    }
+
+
+def _group_by_gpu_type(queue, nodes_df, node_partitions_df, qpos, node_ids):
+    """Split queue row positions and node ids by GPU type (rows with a non-zero count of that type)."""
+    gpu_types = get_gpu_types(nodes_df)
+    q_rows, q_cols = np.nonzero(queue[gpu_types].to_numpy()[qpos] > 0)
+    c_rows, c_cols = np.nonzero(nodes_df[gpu_types].to_numpy()[node_ids] > 0)
+
+    # np.nonzero returns row-major order, so a stable sort by column keeps rows ascending per GPU type
+    q_order, c_order = np.argsort(q_cols, kind="stable"), np.argsort(c_cols, kind="stable")
+    q_split = np.split(qpos[q_rows[q_order]], np.searchsorted(q_cols[q_order], np.arange(1, len(gpu_types))))
+    c_split = np.split(node_ids[c_rows[c_order]], np.searchsorted(c_cols[c_order], np.arange(1, len(gpu_types))))
+
+    return {gpu: (q, c) for gpu, q, c in zip(gpu_types, q_split, c_split) if len(c)}
+
+
+GROUP_BY_SPLITTERS = {
+    "partition": _group_by_partition,
+    "gpu_type": _group_by_gpu_type,
+}
+
+
+def _template_groups(queue: pd.DataFrame, nodes_df: pd.DataFrame, groups: dict) -> list[dict]:
+    """
+    Return the capacity, and the running and pending rows and aggregates, of each group of a template.
+
+    The rows of all groups are gathered once, ordered by (group, state), so each group's running and
+    pending rows are contiguous slices; capacities and aggregates each take one groupby over all groups.
+    """
+    n = len(groups)
+    qpos = [q for q, _ in groups.values()]
+    node_ids = [c for _, c in groups.values()]
+
+    capacity_columns = nodes_df.columns.drop("node")
+    capacities = (nodes_df[capacity_columns].take(np.concatenate(node_ids))
+                  .groupby(np.repeat(np.arange(n), [len(c) for c in node_ids]))
+                  .sum()
+                  .reindex(range(n), fill_value=0))
+
+    # Group code 2 * group for running rows and 2 * group + 1 for pending rows; other states are dropped
+    positions = np.concatenate(qpos).astype(int)
+    state = queue["state"].to_numpy()[positions]
+    state_code = np.select([state == "RUNNING", state == "PENDING"], [0, 1], -1)
+    codes = 2 * np.repeat(np.arange(n), [len(q) for q in qpos]) + state_code
+    keep = state_code >= 0
+    order = np.argsort(codes[keep], kind="stable")
+    rows, codes = queue.take(positions[keep][order]), codes[keep][order]
+    bounds = np.searchsorted(codes, np.arange(2 * n + 1))
+
+    # Running and pending rows of a group share its capacity
+    resources = capacity_columns[(capacities != 0).any().to_numpy()]
+    aggregates = aggregate_groups(rows, codes, capacities[resources].iloc[np.repeat(np.arange(n), 2)])
+
+    return [{
+        "capacity": capacities.loc[i, capacity_columns].rename(None),
+        "RUNNING": (rows.iloc[bounds[2 * i]:bounds[2 * i + 1]], aggregates[2 * i]),
+        "PENDING": (rows.iloc[bounds[2 * i + 1]:bounds[2 * i + 2]], aggregates[2 * i + 1]),
+    } for i in range(n)]
+
+
+def _entry_groups(queue: pd.DataFrame, nodes_df: pd.DataFrame, node_partitions_df: pd.DataFrame, ag: dict) -> dict:
+    """
+    Return {value: (queue positions, node ids)} for each group a config entry defines: a single group
+    keyed by None for a plain entry, and one group per value (e.g. per partition) of the rows its
+    criteria select for a `group_by` template entry, from a single grouping pass over those rows.
+    """
+    qmask, node_mask = _entry_masks(queue, nodes_df, node_partitions_df, ag.get("criteria") or {})
+    qpos, node_ids = np.flatnonzero(qmask), np.flatnonzero(node_mask)
+
+    if "group_by" not in ag:
+        return {None: (qpos, node_ids)}
+    return GROUP_BY_SPLITTERS[ag["group_by"]](queue, nodes_df, node_partitions_df, qpos, node_ids)
+
+
+def _entry_selections(queue: pd.DataFrame, nodes_df: pd.DataFrame, node_partitions_df: pd.DataFrame, ag: dict):
+    """
+    Return (name, queue positions, node ids, grouped) for each group a config entry defines.
+
+    `grouped` is left None for a plain entry. For a template entry it holds each group's rows,
+    capacity and aggregates, computed for all of the template's groups at once (see _template_groups).
+    """
+    groups = _entry_groups(queue, nodes_df, node_partitions_df, ag)
+    if "group_by" not in ag:
+        return [(ag["name"], *groups[None], None)]
+    if not groups:
+        return []
+    return [(ag["name"].format(value=value), q, c, grouped)
+            for (value, (q, c)), grouped in zip(groups.items(), _template_groups(queue, nodes_df, groups))]
+
+
+def _plain_group(queue: pd.DataFrame, nodes_df: pd.DataFrame, qpos: np.ndarray, node_ids: np.ndarray) -> dict:
+    """Return the capacity and the running and pending rows of a group, to be aggregated by AnalysisGroup."""
+    queue_slice = queue.iloc[qpos]
+    return {
+        # Node ids are unique, so the group capacity is a plain masked sum over the node table
+        "capacity": nodes_df.iloc[node_ids].drop(columns="node").sum(),
+        "RUNNING": (queue_slice[queue_slice["state"] == "RUNNING"], None),
+        "PENDING": (queue_slice[queue_slice["state"] == "PENDING"], None),
+    }
+
+
+def _build_pair(queue: pd.DataFrame, nodes_df: pd.DataFrame, node_matrix: NodeAllocationMatrix, name: str,
+                qpos: np.ndarray, node_ids: np.ndarray, grouped: dict | None = None):
+    """Build the (running_group, pending_group) pair for the given queue rows and nodes."""
+    grouped = grouped or _plain_group(queue, nodes_df, qpos, node_ids)
+
+    group_nodes = node_matrix.select(node_ids)
+    running_group = AnalysisGroup(name, grouped["RUNNING"][0], grouped["capacity"], group_nodes,
+                                  aggregates=grouped["RUNNING"][1])
+    pending_group = AnalysisGroup(name, grouped["PENDING"][0], grouped["capacity"],
+                                  aggregates=grouped["PENDING"][1])
+
+    return running_group, pending_group
+
+
+def _group_selections(queue, nodes_df, node_partitions_df, config):
+    """Return (name, queue positions, node ids, grouped) of every group, with templates expanded, in config order."""
+    return [selection for ag in config.get("analysis_groups", [])
+            for selection in _entry_selections(queue, nodes_df, node_partitions_df, ag)]
+
+
+def sum_pending_groups(queue: pd.DataFrame, nodes_df: pd.DataFrame, node_partitions_df: pd.DataFrame,
+                       config: dict) -> dict:
+    """
+    Return the mergeable aggregates (see sum_groups) of the pending rows of every configured group,
+    coded by the group's position in config order with templates expanded, as built by
+    build_analysis_group_pairs. Used to reduce the queue chunk by chunk (see src/budget.py).
+    """
+    resources = list(nodes_df.columns.drop("node"))
+    pending = queue[queue["state"] == "PENDING"]
+    rows = [q for ag in config.get("analysis_groups", [])
+            for q, _ in _entry_groups(pending, nodes_df, node_partitions_df, ag).values()]
+
+    # Only the columns the aggregates read are gathered, once per group a row belongs to
+    columns = ["state", "user", "partition", "reason", "tasks", "pending_time", *resources]
+    positions = np.concatenate(rows).astype(int) if rows else np.array([], dtype=int)
+    return sum_groups(pending[columns].take(positions), np.repeat(np.arange(len(rows)), [len(q) for q in rows]),
+                      resources)
+
+
+def _with_pending_sums(queue: pd.DataFrame, nodes_df: pd.DataFrame, selections: list, pending_sums: dict) -> list:
+    """
+    Give every group the pending aggregates of sum_pending_groups (summed chunk by chunk) instead
+    of pending rows, for a queue that only holds the other rows. Medians are then read from the
+    pending time sketches.
+    """
+    groups = [grouped or _plain_group(queue, nodes_df, qpos, node_ids) for _, qpos, node_ids, grouped in selections]
+    capacities = pd.DataFrame([grouped["capacity"] for grouped in groups]).reset_index(drop=True)
+    resources = capacities.columns[(capacities != 0).any().to_numpy()]
+    aggregates = format_group_sums(pending_sums, capacities[resources])
+
+    return [(name, qpos, node_ids, {**grouped, "PENDING": (queue.iloc[:0], group_aggregates)})
+            for (name, qpos, node_ids, _), grouped, group_aggregates in zip(selections, groups, aggregates)]
+
+
+def fork_available() -> bool:
+    """Whether worker processes can be forked on this platform (parallel builds rely on it)."""
+    return "fork" in multiprocessing.get_all_start_methods()
+
+
+# Build inputs for forked workers. Set in the parent just before the pool is
+# created, so children inherit them with the address space instead of by pickling.
+_worker_inputs = None
+
+
+def _build_group_in_worker(i: int):
+    """Build the pair of group i in a worker; return each group's detached state and queue row positions."""
+    queue, nodes_df, selections, node_matrix = _worker_inputs
+    t0 = time.perf_counter()
+    pair = _build_pair(queue, nodes_df, node_matrix, *selections[i])
+    states = [(group.detached_state(), queue.index.get_indexer(group.queue.index)) for group in pair]
+    return states, time.perf_counter() - t0
+
+
+def _build_pairs_parallel(queue, nodes_df, selections, node_matrix, workers):
+    """
+    Build the pairs of all groups over a fork-based process pool, returning (pairs in config order,
+    summed build time). Templates are already expanded, so the groups of one template entry are
+    spread over the workers like any others.
+    """
+    global _worker_inputs
+    _worker_inputs = (queue, nodes_df, selections, node_matrix)
+
+    try:
+        with multiprocessing.get_context("fork").Pool(workers) as pool:
+            # imap keeps results in config order; chunks amortise per-task IPC
+            chunksize = max(1, len(selections) // (workers * 4))
+            results = list(pool.imap(_build_group_in_worker, range(len(selections)), chunksize=chunksize))
+    finally:
+        _worker_inputs = None
+
+    pairs = [tuple(AnalysisGroup.from_state(state, queue.iloc[pos]) for state, pos in states)
+             for states, _ in results]
+    return pairs, sum(elapsed for _, elapsed in results)
+
+
+def build_analysis_group_pairs(queue: pd.DataFrame, nodes_df: pd.DataFrame, node_partitions_df: pd.DataFrame,
+                               config: dict, workers: int = 1, pending_sums: dict | None = None):
     """
     Build paired AnalysisGroup objects for RUNNING and PENDING jobs based on configured filters.
 
     This function applies partition, user, GPU, node, and custom filters to both the job queue and 
     capacity data. For each analysis group defined in the config, it creates two AnalysisGroup instances:
     one containing only RUNNING jobs, and one containing only PENDING jobs. These are returned as tuples.
+    Config entries with a `group_by` template expand into one group per partition or GPU type.
 
     Args:
         queue (pd.DataFrame): The full job queue dataset.
-        capacity (pd.DataFrame): The resource capacity dataset.
+        nodes_df (pd.DataFrame): Unique node table with resource capacities.
+        node_partitions_df (pd.DataFrame): Node↔partition bridge table (node_id, partition).
         config (dict): Configuration dictionary specifying analysis group criteria.
+        workers (int): Number of worker processes. With more than one (and where the platform
+            supports fork), groups are built in parallel; results are still in config order.
+        pending_sums (dict): Aggregates of the pending rows of every group (see sum_pending_groups),
+            used instead of the pending rows of the queue when it was reduced chunk by chunk.
 
     Returns:
         List[Tuple[AnalysisGroup, AnalysisGroup]]: A list of (running_group, pending_group) pairs.
     """
 
+    # Per-node allocation is computed once for the whole cluster and sliced per group
+    node_matrix = NodeAllocationMatrix(queue, nodes_df)
 
+    selections = _group_selections(queue, nodes_df, node_partitions_df, config)
+    if pending_sums is not None:
+        selections = _with_pending_sums(queue, nodes_df, selections, pending_sums)
+    if workers > 1 and len(selections) > 1 and fork_available():
+        return _build_pairs_parallel(queue, nodes_df, selections, node_matrix, min(workers, len(selections)))[0]
 
-    analysis_group_pairs = []
-
-    for ag in config.get("analysis_groups", []):
-        name = ag["name"]
-        criteria = ag.get("criteria", {})
-
-        qmask = (
-            _apply_partition_filter(queue, criteria.get("partitions"))
-            & _apply_user_filter(queue, criteria.get("users"))
-            & _apply_gpu_filter(queue, criteria.get("gpu_types"))
-            & _apply_node_filter(queue, criteria.get("nodes"))
-            & _apply_custom_filter(queue, criteria.get("custom_queue_mask"), "queue")
-        )
+    return [_build_pair(queue, nodes_df, node_matrix, *selection) for selection in selections]
 
-        cmask = (
-            _apply_partition_filter(capacity, criteria.get("partitions"))
-            & _apply_gpu_filter(capacity, criteria.get("gpu_types"))
-            & _apply_node_filter(capacity, criteria.get("nodes"))
-            & _apply_custom_filter(capacity, criteria.get("custom_capacity_mask"), "capacity")
-        )
 
-        queue_slice = queue.loc[qmask]
+def compare_build_modes(queue: pd.DataFrame, nodes_df: pd.DataFrame, node_partitions_df: pd.DataFrame,
+                        config: dict, workers: int) -> pd.DataFrame:
+    """Time the serial and parallel group builds on the same inputs and report the speedup over serial."""
+    node_matrix = NodeAllocationMatrix(queue, nodes_df)
+    selections = _group_selections(queue, nodes_df, node_partitions_df, config)
 
-        capacity_slice = (
-            capacity.loc[cmask]
-            .drop_duplicates("node")
-            .drop(columns=["node", "partition"], errors="ignore")
-            .sum()
-        )
-        running_group = AnalysisGroup(name, queue_slice[queue_slice["state"] == "RUNNING"], capacity_slice)
-        pending_group = AnalysisGroup(name, queue_slice[queue_slice["state"] == "PENDING"], capacity_slice)
+    t0 = time.perf_counter()
+    for selection in selections:
+        _build_pair(queue, nodes_df, node_matrix, *selection)
+    serial = time.perf_counter() - t0
 
-        analysis_group_pairs.append((running_group, pending_group))
+    # Without fork (e.g. on Windows or macOS spawn-only builds) groups are always built serially
+    if not fork_available():
+        return pd.DataFrame({"mode": ["serial"], "workers": [1], "wall time (s)": [round(serial, 3)],
+                             "group build time (s)": [round(serial, 3)], "speedup": [1.0]})
 
+    t0 = time.perf_counter()
+    _, worker_time = _build_pairs_parallel(queue, nodes_df, selections, node_matrix, workers)
+    parallel = time.perf_counter() - t0
 
-    return analysis_group_pairs
+    return pd.DataFrame({
+        "mode": ["serial", "parallel"],
+        "workers": [1, workers],
+        "wall time (s)": np.round([serial, parallel], 3),
+        "group build time (s)": np.round([serial, worker_time], 3),
+        "speedup": np.round([1.0, serial / parallel], 2),
+    })
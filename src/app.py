@@ -1,14 +1,31 @@
 """
 Launches the Textual UI for HPC queue analysis using tabbed views.
+
+With a refresh interval, the app periodically reloads the queue snapshot in a
+background thread, feeds it to a ThroughputTracker and redraws the tabs.
+Tables are prepared for display once per snapshot version (see
+src.widgets.render_cache), so a refresh that fell back to the last good
+snapshot redraws without formatting any table again.
+
+Selecting a row of a drill-down table, or pressing `/`, opens a searchable
+list of the matching jobs, backed by the snapshot's JobIndex.
 """
 
+from textual import work
 from textual.app import App, ComposeResult
 from textual.widgets import TabbedContent
 from textual.binding import Binding
 from textual.widgets import DataTable
 
-from src.layout import compose_analysis_group_tab
-from typing import Sequence
+from src.drilldown import JobDrillDownScreen
+from src.job_index import JobIndex
+from src.layout import compose_analysis_group_tab, compose_fetch_tab, compose_history_tab, compose_throughput_tab
+from src.fetch import fetch_stats_df, snapshot_version, stale_snapshots
+from src.scontrol import gpu_attribution_df
+from src.snapshot import snapshot_ages, stale_snapshot_files
+from src.transitions import ThroughputTracker
+from src.widgets import render_cache
+from typing import Callable, Sequence
 
 
 class HPCQueueAnalyserApp(App):
@@ -18,15 +35,98 @@ class HPCQueueAnalyserApp(App):
     """
     BINDINGS = [
         Binding("q", "quit", "Quit the app"),
+        Binding("/", "search_jobs", "Search jobs"),
     ]
 
-    def __init__(self, analysis_groups: Sequence, **kwargs):
+    def __init__(self, analysis_groups: Sequence, wait_time_dfs: tuple | None = None,
+                 refresh_interval: float | None = None, load_snapshot: Callable | None = None,
+                 throughput_tracker: ThroughputTracker | None = None, job_index: JobIndex | None = None,
+                 **kwargs):
         super().__init__(**kwargs)
         self.analysis_groups = analysis_groups
+        self.wait_time_dfs = wait_time_dfs
+        self.refresh_interval = refresh_interval
+        self.load_snapshot = load_snapshot
+        self.throughput_tracker = throughput_tracker
+        self.job_index = job_index
+        render_cache.set_version(snapshot_version())
 
     def compose(self) -> ComposeResult:
         with TabbedContent():
-            for running_group, pending_group in self.analysis_groups:
-                yield from compose_analysis_group_tab(running_group, pending_group)
+            for position, (running_group, pending_group) in enumerate(self.analysis_groups):
+                yield from compose_analysis_group_tab(running_group, pending_group, position)
+            if self.throughput_tracker is not None:
+                yield from compose_throughput_tab(self.throughput_tracker.summary_df(),
+                                                  self.throughput_tracker.window_minutes())
+            if self.wait_time_dfs is not None:
+                yield from compose_history_tab(*self.wait_time_dfs)
+            yield from compose_fetch_tab(fetch_stats_df(), stale_snapshots() + stale_snapshot_files(),
+                                         gpu_attribution_df(), snapshot_ages())
+
+    def on_mount(self):
+        self.warn_if_stale()
+        if self.refresh_interval and self.load_snapshot is not None:
+            self.set_timer(self.refresh_interval, self.refresh_snapshot)
+
+    @work(thread=True, exclusive=True)
+    def refresh_snapshot(self):
+        """Load a new snapshot off the UI thread, redraw the tabs with it and schedule the next refresh."""
+        try:
+            queue_df, analysis_groups, job_index = self.load_snapshot()
+            version = snapshot_version()
+        except Exception as e:
+            self.call_from_thread(self.notify, str(e), title="Refresh failed", severity="error")
+        else:
+            if self.throughput_tracker is not None:
+                self.throughput_tracker.update(queue_df, analysis_groups)
+            self.call_from_thread(self.show_snapshot, analysis_groups, job_index, version)
+
+        # The next refresh is only scheduled once this one is displayed, so slow
+        # fetches or redraws never overlap
+        self.call_from_thread(self.warn_if_stale)
+        self.call_from_thread(self.set_timer, self.refresh_interval, self.refresh_snapshot)
+
+    def warn_if_stale(self):
+        """
+        Notify when any data shown comes from the last good snapshot after a failed fetch, or from
+        a snapshot file that is no longer being updated.
+        """
+        for warning in stale_snapshots() + stale_snapshot_files():
+            self.notify(warning, title="Stale data", severity="warning", timeout=30)
+
+    async def show_snapshot(self, analysis_groups: Sequence, job_index: JobIndex, version: tuple | None):
+        """Replace the displayed analysis groups, keeping the selected top-level tab."""
+        active = self.query_one(TabbedContent).active
+        self.analysis_groups = analysis_groups
+        self.job_index = job_index
+        render_cache.set_version(version)
+        await self.recompose()
+
+        # Pane ids are assigned in order, so the same id selects the same position once mounted
+        self.call_after_refresh(self._select_tab, active)
+
+    def _select_tab(self, pane_id: str):
+        try:
+            self.query_one(TabbedContent).active = pane_id
+        except ValueError:
+            pass    # fewer tabs than before (e.g. a group_by value disappeared)
+
+    def on_data_table_row_selected(self, event: DataTable.RowSelected):
+        """Open the jobs behind a selected row of a drill-down table."""
+        drilldown = getattr(event.data_table, "drilldown", None)
+        if drilldown is None or self.job_index is None:
+            return
+
+        group, key_columns = drilldown
+        labels = [str(column.label) for column in event.data_table.columns.values()]
+        row = event.data_table.get_row(event.row_key)
+        filters = {col: str(row[labels.index(col)]) for col in key_columns}
 
+        positions = self.job_index.select(within=self.job_index.positions_of(group.queue.index), **filters)
+        title = f"{group.name}: " + ", ".join(f"{col} {value}" for col, value in filters.items())
+        self.push_screen(JobDrillDownScreen(self.job_index, title, positions))
 
+    def action_search_jobs(self):
+        """Open a searchable list of every job in the queue."""
+        if self.job_index is not None and not isinstance(self.screen, JobDrillDownScreen):
+            self.push_screen(JobDrillDownScreen(self.job_index, "All jobs"))
@@ -0,0 +1,115 @@
+"""
+Memory budget mode for very large queues.
+
+Parsing and GPU assignment hold several full-width copies of the queue at
+once (the two squeue frames, their merge, the `.assign` chain and the
+row-wise GPU assignment), about 4 KB per job at peak. With hundreds of
+thousands of array tasks this can exceed the memory limit of a login node.
+
+In memory budget mode the squeue output is split into chunks by job ID (so
+the two squeue formats of a job end up in the same chunk), and each chunk is
+parsed and GPU-assigned before the next one is cut from the raw output:
+
+- its pending rows are reduced straight away to the aggregates of every
+  configured analysis group (see sum_pending_groups): job counts and
+  resource sums per group, user, partition and (partition, reason), and
+  pending time sketches per group and (partition, reason). The aggregates of
+  successive chunks are merged, so their size depends on the number of
+  groups, users, partitions and reasons, not on the number of jobs. Medians
+  are read from the sketches (within 1%); counts, sums and p90/p99 are
+  unchanged
+- its other rows are kept (one per job), since per-node allocation needs
+  the node lists of running jobs. Their number is bounded by the cluster
+  size, not by the queue length.
+
+Only the parsed frames are bounded: chunks are sized so that one chunk's
+parsing (PEAK_BYTES_PER_ROW per row) and the kept rows (KEPT_BYTES_PER_ROW
+each, counted from the raw output up front) fit in the budget, which
+tests/test_budget.py checks with tracemalloc. Chunks have at least
+MIN_CHUNK_ROWS rows, so a budget smaller than the kept rows is exceeded.
+The raw squeue output is still read whole, and src/fetch.py keeps its last
+good copy for the stale fallback; at about 160 bytes per job it is not part
+of the budget.
+
+Provides:
+- split_squeue_output: split the two squeue outputs into chunks by job ID
+- get_queue_data_within_budget: chunked alternative to get_queue_data,
+  returning the non-pending rows and the pending aggregates
+"""
+
+import re
+import zlib
+from array import array
+from collections.abc import Iterator
+
+import numpy as np
+import pandas as pd
+
+from src.analysis_group import merge_group_sums
+from src.analysis_group_builder import sum_pending_groups
+from src.queue import fetch_squeue_output, parse_squeue_output, preprocess_squeue_data
+
+# Peak memory of parsing and GPU assignment per squeue row, and of each kept (non-pending)
+# row including its final concatenation (measured, with a margin)
+PEAK_BYTES_PER_ROW = 5000
+KEPT_BYTES_PER_ROW = 2000
+MIN_CHUNK_ROWS = 1000
+
+
+def _index_lines(raw: str, sep: str | None, n_chunks: int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Return the start and end offsets of every line of an squeue output, and its chunk by job ID
+    (-1 for the header and blank lines).
+    """
+    # Typed arrays take 12 bytes per line, rather than a Python object per offset
+    ends, chunks = array("q"), array("i")
+    for match in re.finditer(r"[^\n]*\n|[^\n]+\Z", raw):
+        line = match.group()
+        ends.append(match.end())
+        chunks.append(zlib.crc32(line.split(sep, 1)[0].strip().encode()) % n_chunks if line.strip() else -1)
+    if chunks:
+        chunks[0] = -1
+    ends = np.frombuffer(ends, dtype=np.int64)
+    return np.r_[0, ends][:-1], ends, np.frombuffer(chunks, dtype=np.int32)
+
+
+def split_squeue_output(raw_long: str, raw_short: str, n_chunks: int) -> Iterator[tuple[str, str]]:
+    """
+    Split the long and short squeue outputs into n_chunks (long, short) pairs, each with its
+    header, such that all lines of a job ID are in the same pair. Pairs are generated one at a
+    time, from line offsets into the outputs.
+    """
+    if n_chunks <= 1:
+        yield raw_long, raw_short
+        return
+
+    outputs = [(raw, *_index_lines(raw, sep, n_chunks)) for raw, sep in [(raw_long, None), (raw_short, "|")]]
+    for chunk in range(n_chunks):
+        yield tuple(
+            raw[:raw.find("\n") + 1] + "".join(raw[start:end] for start, end in
+                                               zip(starts[chunks == chunk].tolist(), ends[chunks == chunk].tolist()))
+            for raw, starts, ends, chunks in outputs
+        )
+
+
+def get_queue_data_within_budget(nodes_df, node_partitions_df, config: dict, max_memory_mb: float,
+                                 expand_arrays: bool = True) -> tuple[pd.DataFrame, dict]:
+    """
+    Run squeue and return the enriched queue without its pending rows, and the aggregates of the
+    pending rows of every configured analysis group (for build_analysis_group_pairs), parsing at
+    most as many rows at once as fit in max_memory_mb.
+    """
+    raw_long, raw_short = fetch_squeue_output(expand_arrays)
+    n_rows = raw_short.count("\n")
+
+    # Kept rows accumulate over the chunks, so chunks get what is left of the budget
+    kept_bytes = (n_rows - raw_short.count("|PENDING|")) * KEPT_BYTES_PER_ROW
+    chunk_rows = max(MIN_CHUNK_ROWS, int((max_memory_mb * 1e6 - kept_bytes) / PEAK_BYTES_PER_ROW))
+
+    kept, pending_sums = [], None
+    for raw_chunk in split_squeue_output(raw_long, raw_short, -(-n_rows // chunk_rows)):
+        chunk = preprocess_squeue_data(parse_squeue_output(*raw_chunk), nodes_df, node_partitions_df)
+        kept.append(chunk[chunk["state"] != "PENDING"])
+        chunk_sums = sum_pending_groups(chunk, nodes_df, node_partitions_df, config)
+        pending_sums = chunk_sums if pending_sums is None else merge_group_sums(pending_sums, chunk_sums)
+    return pd.concat(kept, ignore_index=True), pending_sums
@@ -1,14 +1,33 @@
-import subprocess
+"""
+Cluster capacity data from `sinfo`.
+
+`sinfo -N` reports one row per node per partition, so nodes shared between
+partitions appear several times. The capacity model is therefore normalised
+into two tables:
+
+- nodes_df: one row per node (index = node id) with cpu, mem_gb and one
+  integer column per GPU type
+- node_partitions_df: a compact bridge of (node_id, partition) pairs, with
+  partition stored as a categorical
+
+Group capacity is then a masked sum over unique node ids, and the memory used
+stays flat however many partitions overlap on the same hardware.
+"""
+
 import io
 import pandas as pd
 import re
 import shlex
 
+from src.fetch import fetch_snapshot
+
 def extract_capacity_data() -> io.StringIO:
     """Run `sinfo` and return cleaned node capacity data as a stream."""
     cmd = shlex.split('sinfo -a --format=%N|%P|%c|%m|%G -N')
-    raw_output = subprocess.run(cmd, capture_output=True, text=True).stdout
+    return clean_sinfo_output(fetch_snapshot("sinfo", {"sinfo": cmd})["sinfo"])
 
+def clean_sinfo_output(raw_output: str) -> io.StringIO:
+    """Strip socket annotations and default partition flags from sinfo output."""
     # Remove (S:...) slot ranges and '*' flags
     cleaned = re.sub(r'\(S:[^)]*\)', '', raw_output)
     cleaned = cleaned.replace('*', '')
@@ -54,8 +73,28 @@ def process_capacity_data(raw_data_file) -> pd.DataFrame:
 
     return df
 
-def get_capacities() -> pd.DataFrame:
-    """Return processed Slurm node capacity data as a DataFrame."""
+def normalize_capacity_data(capacity_df: pd.DataFrame) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Split per (node, partition) capacity rows into a unique node table and a node↔partition bridge.
+    Node ids are the positions of nodes in the node table, in order of first appearance.
+    """
+    nodes_df = (capacity_df
+                .drop_duplicates("node")
+                .drop(columns="partition")
+                .reset_index(drop=True))
+
+    node_ids = pd.Index(nodes_df["node"]).get_indexer(capacity_df["node"])
+    node_partitions_df = (pd.DataFrame({
+                            "node_id": node_ids.astype("int32"),
+                            "partition": pd.Categorical(capacity_df["partition"]),
+                          })
+                          .drop_duplicates()
+                          .reset_index(drop=True))
+
+    return nodes_df, node_partitions_df
+
+def get_capacities() -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Return Slurm node capacity data as (nodes_df, node_partitions_df)."""
     raw_capacity_data = extract_capacity_data()
     processed_capacity_data = process_capacity_data(raw_capacity_data)
-    return processed_capacity_data
+    return normalize_capacity_data(processed_capacity_data)
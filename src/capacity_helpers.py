@@ -2,22 +2,26 @@
 Helper functions for working with cluster capacity DataFrames.
 
 This module provides convenience utilities for extracting GPU type information
-from the processed capacity data, and for building lookup maps such as:
+from the capacity tables (the unique node table and the node↔partition
+bridge, see src/capacities.py), and for building lookup maps such as:
 
 - get_gpu_types: returns a sorted list of GPU resource columns
 - get_node_to_gpu_map: maps each node to the GPU types it provides
 - get_partition_to_gpu_map: maps each partition to the GPU types available
   across its nodes
+- get_partition_to_node_ids: maps each partition to the ids of its nodes
+- get_partition_to_node_map: maps each partition to the nodes it contains
 
 These helpers are used by the queue preprocessing logic to assign jobs to
 specific GPU resources where possible.
 """
 
+import numpy as np
 import pandas as pd
 
 def get_gpu_types(capacity_df: pd.DataFrame) -> list[str]:
     """
-    Return a sorted list of GPU type columns from the processed capacity DataFrame.
+    Return a sorted list of GPU type columns from the node (or capacity) DataFrame.
     """
     non_gpu_cols = {"node", "partition", "cpu", "mem_gb"}
     return sorted([c for c in capacity_df.columns if c not in non_gpu_cols])
@@ -34,18 +38,29 @@ def get_node_to_gpu_map(capacity_df: pd.DataFrame) -> dict[str, list[str]]:
     }
 
 
-def get_partition_to_gpu_map(capacity_df: pd.DataFrame) -> dict[str, list[str]]:
+def get_partition_to_gpu_map(nodes_df: pd.DataFrame, node_partitions_df: pd.DataFrame) -> dict[str, list[str]]:
     """
     Map each partition to a list of GPU types present in any node in that partition.
     """
-    gpu_cols = get_gpu_types(capacity_df)
-    partition_map: dict[str, set[str]] = {}
+    gpu_cols = get_gpu_types(nodes_df)
+    has_gpu = pd.DataFrame(nodes_df[gpu_cols].to_numpy()[node_partitions_df["node_id"]] > 0, columns=gpu_cols)
+    present = has_gpu.groupby(node_partitions_df["partition"].to_numpy()).any()
+
+    return {p: [gpu for gpu in gpu_cols if row[gpu]] for p, row in present.iterrows()}
+
+
+def get_partition_to_node_ids(node_partitions_df: pd.DataFrame) -> dict[str, np.ndarray]:
+    """
+    Map each partition to the sorted ids of the nodes it contains.
+    """
+    node_ids = node_partitions_df["node_id"].to_numpy()
+    groups = pd.Series(node_ids).groupby(node_partitions_df["partition"].to_numpy()).indices
+    return {p: np.sort(node_ids[rows]) for p, rows in groups.items()}
 
-    for _, row in capacity_df.iterrows():
-        p = row["partition"]
-        partition_map.setdefault(p, set())
-        for gpu in gpu_cols:
-            if row[gpu] > 0:
-                partition_map[p].add(gpu)
 
-    return {p: sorted(types) for p, types in partition_map.items()}
+def get_partition_to_node_map(nodes_df: pd.DataFrame, node_partitions_df: pd.DataFrame) -> dict[str, list[str]]:
+    """
+    Map each partition to the list of nodes it contains.
+    """
+    names = nodes_df["node"].to_numpy()
+    return {p: list(names[ids]) for p, ids in get_partition_to_node_ids(node_partitions_df).items()}
@@ -57,3 +57,49 @@ def make_allocation_table(df, title, cmap):
         table.add_row(*map(str, styled_row))
 
     return table
+
+
+def print_history_block(wait_by_partition_df, wait_by_gpu_df):
+    """Print historical wait-time percentiles by partition and GPU type side by side."""
+    console.rule("[bold blue]HISTORICAL WAIT TIMES")
+    partition_table = make_table(wait_by_partition_df, "Wait Times by Partition")
+    gpu_table = make_table(wait_by_gpu_df, "Wait Times by GPU Type")
+    console.print(Columns([partition_table, gpu_table], equal=True, expand=True))
+
+
+def make_table(df, title):
+    """Convert a DataFrame into a Rich table (first column left-aligned, the others right-aligned)."""
+    table = Table(title=title, show_header=True, header_style="bold cyan")
+
+    for col in df.columns:
+        table.add_column(str(col), justify="left" if col == df.columns[0] else "right")
+
+    for row in df.itertuples(index=False):
+        table.add_row(*map(str, row))
+
+    return table
+
+
+def print_fetch_block(stats_df, stale_warnings, gpu_attribution_df=None):
+    """Print Slurm command latency/failure counts, a warning for each stale snapshot and GPU attribution counts."""
+    console.rule("[bold blue]SLURM COMMANDS")
+    for warning in stale_warnings:
+        console.print(f"[bold red]⚠ {warning}[/bold red]")
+    console.print(make_table(stats_df, "Fetch Latency and Failures"))
+    if gpu_attribution_df is not None and not gpu_attribution_df.empty:
+        console.print(make_table(gpu_attribution_df, "GPU Attribution (scontrol)"))
+
+
+def print_snapshot_block(snapshot_ages, stale_warnings):
+    """Print the age of each snapshot file read and a warning for each stale one."""
+    console.rule("[bold blue]SNAPSHOT FILE")
+    for path, age in snapshot_ages.items():
+        console.print(f"{path} written {age} ago")
+    for warning in stale_warnings:
+        console.print(f"[bold red]⚠ {warning}[/bold red]")
+
+
+def print_build_benchmark(df):
+    """Print serial vs. parallel analysis group build timings."""
+    console.rule("[bold blue]ANALYSIS GROUP BUILD")
+    console.print(make_table(df, "Serial vs. Parallel Build"))
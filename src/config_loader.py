@@ -5,6 +5,15 @@ This module:
 - Loads a YAML configuration file
 - Validates its structure and keys
 - Ensures analysis groups follow expected schema
+
+An analysis group is either a single group with a fixed name, or a template
+that expands into one group per value of a `group_by` key when the queue is
+analysed, e.g.
+
+    - name: "Partition {value}"
+      group_by: partition
+      criteria:              # optional, restricts the rows that are grouped
+        users: ["alice"]
 """
 
 import yaml
@@ -14,6 +23,8 @@ ALLOWED_CRITERIA_KEYS = {
     "custom_queue_mask", "custom_capacity_mask"
 }
 
+ALLOWED_GROUP_BY_KEYS = {"partition", "gpu_type"}
+
 def load_yaml(path="config.yaml"):
     """Load a YAML config file and return its contents as a dictionary."""
     try:
@@ -33,11 +44,26 @@ def validate_cfg(cfg):
     for idx, filt in enumerate(cfg["analysis_groups"], 1):
         if "name" not in filt:
             raise KeyError(f"analysis_groups[{idx}] is missing required key 'name'")
-        if "criteria" not in filt:
+
+        # Template groups expand into one group per value, so criteria are optional
+        # but the name must tell the generated groups apart
+        if "group_by" in filt:
+            if filt["group_by"] not in ALLOWED_GROUP_BY_KEYS:
+                raise ValueError(
+                    f"analysis_groups[{idx}] has unknown group_by key '{filt['group_by']}' "
+                    f"(expected one of {sorted(ALLOWED_GROUP_BY_KEYS)})"
+                )
+            try:
+                names_differ = str(filt["name"]).format(value="a") != str(filt["name"]).format(value="b")
+            except (KeyError, IndexError, ValueError):
+                raise ValueError(f"analysis_groups[{idx}] name may only use the '{{value}}' placeholder")
+            if not names_differ:
+                raise ValueError(f"analysis_groups[{idx}] uses group_by, so its name must contain '{{value}}'")
+        elif "criteria" not in filt:
             raise KeyError(f"analysis_groups[{idx}] is missing required key 'criteria'")
 
         # Check for unsupported criteria keys
-        unknown = set(filt["criteria"]) - ALLOWED_CRITERIA_KEYS
+        unknown = set(filt.get("criteria") or {}) - ALLOWED_CRITERIA_KEYS
 
         if unknown:
             raise ValueError(
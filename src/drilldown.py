@@ -0,0 +1,60 @@
+"""
+Drill-down screen listing the individual jobs behind an aggregate row.
+
+Selecting a row of a Users, Partitions or Queue Times table (Enter or click)
+opens this screen with the jobs of that row, and `/` opens it over every job
+in the queue. Typing in the search box filters the list by job ID prefix, or
+by user, reason or node substring, using the snapshot's JobIndex.
+"""
+
+import numpy as np
+from textual.app import ComposeResult
+from textual.binding import Binding
+from textual.screen import Screen
+from textual.widgets import DataTable, Footer, Input, Markdown, Static
+
+from src.job_index import JobIndex
+from src.widgets import prepare_table
+
+# Rows shown at once; the count line still reports every match
+MAX_ROWS = 500
+
+
+class JobDrillDownScreen(Screen):
+    """Searchable list of the jobs at the given positions of a JobIndex."""
+
+    BINDINGS = [
+        Binding("escape", "app.pop_screen", "Back"),
+    ]
+
+    def __init__(self, job_index: JobIndex, title: str, positions: np.ndarray | None = None):
+        super().__init__()
+        self.job_index = job_index
+        self.title_text = title
+        self.positions = np.arange(len(job_index)) if positions is None else positions
+
+    def compose(self) -> ComposeResult:
+        yield Markdown(f"# 🔎 {self.title_text}")
+        yield Input(placeholder="Search job ID, user, reason or node")
+        yield Static()
+        yield DataTable(zebra_stripes=True)
+        yield Footer()
+
+    def on_mount(self):
+        self.show_jobs(self.positions)
+        self.query_one(Input).focus()
+
+    def on_input_changed(self, event: Input.Changed):
+        self.show_jobs(self.job_index.search(event.value, within=self.positions))
+
+    def show_jobs(self, positions: np.ndarray):
+        """Replace the table contents with the jobs at `positions` (at most MAX_ROWS of them)."""
+        prepared = prepare_table(self.job_index.jobs_df(positions, limit=MAX_ROWS))
+
+        table = self.query_one(DataTable)
+        table.clear(columns=True)
+        table.add_columns(*prepared.columns)
+        table.add_rows(prepared.rows)
+
+        shown = f" (showing the first {MAX_ROWS:,})" if len(positions) > MAX_ROWS else ""
+        self.query_one(Static).update(f"{len(positions):,} of {len(self.positions):,} jobs{shown}")
@@ -0,0 +1,255 @@
+"""
+Fetch layer for Slurm commands (sinfo, squeue, sacct).
+
+When slurmctld is overloaded, commands can hang for minutes or fail with an
+empty stdout. Every command run through this module therefore gets:
+
+- a deadline (the command is killed when it runs past its timeout)
+- a bounded number of retries with exponential backoff
+- a check of the return code (and, where a header is always printed, of
+  empty output)
+
+Related commands that make up one snapshot (e.g. the two squeue formats) are
+fetched concurrently and succeed or fail together. The outputs of the last
+good snapshot are kept in memory and on disk, so that when a fetch fails the
+last good snapshot is served instead, marked stale with its age (up to a
+maximum age, after which the fetch fails).
+
+Latency and failure counts per command are kept for display in the CLI/TUI.
+
+Provides:
+- set_fetch_policy: set the default timeout, retries, backoff and maximum stale age
+- run_slurm_command: run one command with deadline and retries
+- fetch_snapshot: fetch a set of commands together, with stale fallback
+- snapshot_version: fetch times of the snapshots in use, to key caches of derived data
+- stale_snapshots: snapshots currently served from a stale copy
+- fetch_stats_df: latency and failure counts per command
+"""
+
+import json
+import os
+import subprocess
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "hpc-queue-analyser"
+
+# Defaults for every command; set from the command line with set_fetch_policy
+FETCH_POLICY = {
+    "timeout": 30.0,    # seconds before a command is killed
+    "retries": 2,       # additional attempts after the first failure
+    "backoff": 1.0,     # seconds before the first retry, doubled for each further retry
+    "max_age": 3600.0,  # seconds after which the last good snapshot is no longer served
+}
+
+
+class FetchError(RuntimeError):
+    """A Slurm command failed on every attempt."""
+
+
+class CommandStats:
+    """Call, failure and latency counts for one command."""
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.retries = 0
+        self.latencies = deque(maxlen=100)
+        self.last_error = ""
+
+
+_lock = threading.Lock()
+_command_stats: dict[str, CommandStats] = {}
+_last_good: dict[str, tuple[datetime, dict[str, str]]] = {}
+_stale: dict[str, tuple[datetime, str]] = {}
+
+
+def set_fetch_policy(timeout: float | None = None, retries: int | None = None, backoff: float | None = None,
+                     max_age: float | None = None):
+    """
+    Override the default timeout (seconds), number of retries, initial backoff (seconds) and
+    maximum age of a served last good snapshot (seconds).
+    """
+    for key, value in {"timeout": timeout, "retries": retries, "backoff": backoff, "max_age": max_age}.items():
+        if value is not None:
+            if value < 0:
+                raise ValueError(f"fetch {key} must not be negative")
+            FETCH_POLICY[key] = value
+
+
+def _record(name: str, latency: float | None = None, error: str | None = None, timed_out: bool = False,
+            retried: bool = False):
+    """Update the stats of a command after one attempt."""
+    with _lock:
+        stats = _command_stats.setdefault(name, CommandStats())
+        stats.calls += 1
+        stats.retries += retried
+        if latency is not None:
+            stats.latencies.append(latency)
+        if error is not None:
+            stats.failures += 1
+            stats.timeouts += timed_out
+            stats.last_error = error
+
+
+def run_slurm_command(cmd: list[str], name: str | None = None, require_output: bool = True,
+                      timeout: float | None = None, retries: int | None = None,
+                      backoff: float | None = None) -> str:
+    """
+    Run a command with a deadline and bounded retries and return its stdout.
+
+    An attempt fails if it times out, exits non-zero, or (with require_output) prints nothing.
+    Raises FetchError once all attempts have failed.
+    """
+    name = name or cmd[0]
+    timeout = FETCH_POLICY["timeout"] if timeout is None else timeout
+    retries = FETCH_POLICY["retries"] if retries is None else retries
+    backoff = FETCH_POLICY["backoff"] if backoff is None else backoff
+
+    error = ""
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+
+        t0 = time.perf_counter()
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            error = f"timed out after {timeout:g}s"
+            _record(name, error=error, timed_out=True, retried=attempt > 0)
+            continue
+        except OSError as e:
+            error = str(e)
+            _record(name, error=error, retried=attempt > 0)
+            continue
+        latency = time.perf_counter() - t0
+
+        if result.returncode != 0:
+            error = f"exit code {result.returncode}: {result.stderr.strip()[:200]}"
+        elif require_output and not result.stdout.strip():
+            error = "empty output"
+        else:
+            _record(name, latency=latency, retried=attempt > 0)
+            return result.stdout
+        _record(name, latency=latency, error=error, retried=attempt > 0)
+
+    raise FetchError(f"{name} failed after {retries + 1} attempts ({error})")
+
+
+def _snapshot_cache_path(cache_dir: Path, name: str) -> Path:
+    """Return the file holding the last good outputs of a snapshot."""
+    return cache_dir / "last_good" / f"{name}.json"
+
+
+def _save_last_good(name: str, fetched_at: datetime, outputs: dict[str, str], cache_dir: Path | None):
+    """Keep the outputs of a good snapshot in memory and (atomically) on disk."""
+    with _lock:
+        _last_good[name] = (fetched_at, outputs)
+        _stale.pop(name, None)
+
+    if cache_dir:
+        path = _snapshot_cache_path(cache_dir, name)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps({"fetched_at": fetched_at.isoformat(), "outputs": outputs}))
+            tmp_path.replace(path)
+        except OSError:
+            pass    # the in-memory copy still covers this process
+
+
+def _load_last_good(name: str, cache_dir: Path | None):
+    """Return (fetched_at, outputs) of the last good snapshot, from memory or disk, or None."""
+    with _lock:
+        if name in _last_good:
+            return _last_good[name]
+
+    path = _snapshot_cache_path(cache_dir, name) if cache_dir else None
+    if path and path.exists():
+        try:
+            cached = json.loads(path.read_text())
+            fetched_at, outputs = datetime.fromisoformat(cached["fetched_at"]), cached["outputs"]
+        except (OSError, ValueError, KeyError):
+            return None
+        with _lock:
+            _last_good[name] = (fetched_at, outputs)
+        return fetched_at, outputs
+    return None
+
+
+def fetch_snapshot(name: str, cmds: dict[str, list[str]], cache_dir: Path | None = DEFAULT_CACHE_DIR,
+                   **kwargs) -> dict[str, str]:
+    """
+    Run a set of commands concurrently and return their outputs by key.
+
+    If any command fails, the outputs of the last good snapshot with this name are returned
+    instead (all of them, so outputs from different points in time are never mixed) and the
+    snapshot is reported by stale_snapshots(). Raises FetchError when there is no good snapshot,
+    or when it is older than FETCH_POLICY["max_age"].
+    """
+    with ThreadPoolExecutor(max_workers=len(cmds)) as pool:
+        futures = {key: pool.submit(run_slurm_command, cmd, name=key, **kwargs) for key, cmd in cmds.items()}
+
+    try:
+        outputs = {key: future.result() for key, future in futures.items()}
+    except FetchError as e:
+        cached = _load_last_good(name, cache_dir)
+        if cached is None or cached[1].keys() != cmds.keys():
+            raise
+        fetched_at, outputs = cached
+        age = datetime.now() - fetched_at
+        if age > timedelta(seconds=FETCH_POLICY["max_age"]):
+            age = timedelta(seconds=int(age.total_seconds()))
+            raise FetchError(f"{e}; last good {name} data from {age} ago is too old to serve") from e
+        with _lock:
+            _stale[name] = (fetched_at, str(e))
+        return outputs
+
+    _save_last_good(name, datetime.now(), outputs, cache_dir)
+    return outputs
+
+
+def snapshot_version() -> tuple | None:
+    """
+    Identify the data currently served: the fetch time of every snapshot in use.
+
+    The version only changes when new data has been fetched, not when a failed fetch
+    served the last good snapshot again. None before anything has been fetched.
+    """
+    with _lock:
+        return tuple(sorted((name, fetched_at) for name, (fetched_at, _) in _last_good.items())) or None
+
+
+def stale_snapshots(now: datetime | None = None) -> list[str]:
+    """Return a warning for each snapshot currently served from its last good copy, with its age."""
+    now = now or datetime.now()
+    with _lock:
+        stale = dict(_stale)
+
+    warnings = []
+    for name, (fetched_at, error) in stale.items():
+        age = timedelta(seconds=int((now - fetched_at).total_seconds()))
+        warnings.append(f"STALE {name} data from {age} ago (fetch failed: {error})")
+    return warnings
+
+
+def fetch_stats_df() -> pd.DataFrame:
+    """Return calls, failures, timeouts, retries and median/max latency per command."""
+    columns = ["command", "calls", "failures", "timeouts", "retries", "p50 (s)", "max (s)", "last error"]
+    with _lock:
+        rows = [
+            [name, s.calls, s.failures, s.timeouts, s.retries,
+             round(float(np.median(s.latencies)), 2) if s.latencies else np.nan,
+             round(max(s.latencies), 2) if s.latencies else np.nan,
+             s.last_error or "—"]
+            for name, s in _command_stats.items()
+        ]
+    return pd.DataFrame(rows, columns=columns)
@@ -0,0 +1,335 @@
+"""
+Estimates when pending jobs are likely to start using an event-driven
+simulation of the cluster.
+
+Node state is held in NumPy arrays (one row per node, one column per resource:
+cpu, mem_gb and each GPU type) rather than DataFrame rows, so that placement
+checks stay cheap on clusters with thousands of nodes and queues with
+hundreds of thousands of pending jobs.
+
+The simulation:
+- starts from the capacity frame minus the resources held by running jobs
+- replays job completions (from time left / time limits) through a heap
+- places pending jobs in priority order at each completion event
+- lets lower priority jobs backfill, provided they do not delay the nodes
+  reserved for higher priority jobs that are blocked
+
+Pending jobs whose GPU type is unknown are left out of the simulation rather
+than being treated as CPU-only jobs.
+
+Provides:
+- ClusterSimulator: the array-backed simulation
+- estimate_start_times: estimated start offset for each pending job
+- add_start_estimates: adds an `est_start` column to the queue DataFrame
+"""
+
+import heapq
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from src.capacity_helpers import get_gpu_types, get_partition_to_node_ids
+from src.node_matrix import running_node_usage
+
+
+class ClusterSimulator:
+    """Array-backed model of free node resources used to replay completions and place pending jobs."""
+
+    def __init__(self, nodes_df: pd.DataFrame, node_partitions_df: pd.DataFrame, resolution: float = 300,
+                 max_job_test: int = 500, max_reservations: int = 50):
+        # Order nodes by the set of partitions they belong to, so that most partitions
+        # cover a contiguous block of node indices (cheap slices rather than gathers)
+        partition_sets = (node_partitions_df.astype({"partition": str})
+                          .groupby("node_id")["partition"].agg(lambda p: ",".join(sorted(p))))
+        order = np.argsort(partition_sets.reindex(nodes_df.index, fill_value="").to_numpy(), kind="stable")
+        position = np.empty(len(order), dtype=int)
+        position[order] = np.arange(len(order))
+        nodes_df = nodes_df.iloc[order]
+
+        self.gpu_types = get_gpu_types(nodes_df)
+        self.resources = ["cpu", "mem_gb", *self.gpu_types]
+        self.node_index = {node: i for i, node in enumerate(nodes_df["node"])}
+        self.capacity = nodes_df[self.resources].to_numpy(dtype=float)
+        self.free = self.capacity.copy()
+        self.node_ids = np.arange(len(self.capacity))
+
+        # Time at which each node will be completely free of its current allocations
+        self.busy_until = np.zeros(len(self.node_index))
+
+        self.partition_nodes = {
+            part: np.sort(position[node_ids])
+            for part, node_ids in get_partition_to_node_ids(node_partitions_df).items()
+        }
+
+        self.resolution = resolution
+        self.max_job_test = max_job_test
+        self.max_reservations = max_reservations
+        self.events = []        # heap of (end time, allocation id)
+        self.allocations = {}   # allocation id -> (node indices, per-node usage)
+        self._next_allocation = 0
+
+    def allocate(self, nodes: np.ndarray, usage: np.ndarray, end: float):
+        """Reserve resources on nodes until `end` (seconds from now; inf if never released)."""
+        self.free[nodes] -= usage
+        self.busy_until[nodes] = np.maximum(self.busy_until[nodes], end)
+        if np.isfinite(end):
+            self.allocations[self._next_allocation] = (nodes, usage)
+            heapq.heappush(self.events, (end, self._next_allocation))
+            self._next_allocation += 1
+
+    def release_until(self, t: float) -> float:
+        """Release all allocations ending at or before time t and return the last release time."""
+        last = -np.inf
+        while self.events and self.events[0][0] <= t:
+            last, allocation = heapq.heappop(self.events)
+            nodes, usage = self.allocations.pop(allocation)
+            self.free[nodes] += usage
+        return last
+
+    def load_running_jobs(self, queue: pd.DataFrame):
+        """Subtract resources held by running jobs and schedule their completions."""
+        running = queue[queue["state"] == "RUNNING"]
+        ends = (running["time_left"].dt.total_seconds().fillna(np.inf).to_numpy()
+                if "time_left" in running.columns else np.full(len(running), np.inf))
+
+        job_pos, node_idx, usage = running_node_usage(
+            running, pd.Index(list(self.node_index)), self.capacity, self.resources)
+
+        # One allocation per job: (job, node) pairs are grouped by job position
+        boundaries = np.flatnonzero(np.diff(job_pos)) + 1
+        starts = np.concatenate([[0], boundaries])
+        for first, nodes, job_usage in zip(starts, np.split(node_idx, boundaries), np.split(usage, boundaries)):
+            if len(nodes):
+                self.allocate(nodes, job_usage, ends[job_pos[first]])
+
+    def _candidate_nodes(self, partitions: tuple) -> np.ndarray | slice:
+        """Return the nodes belonging to any of the given partitions, as a slice when contiguous."""
+        arrays = [self.partition_nodes[p] for p in partitions if p in self.partition_nodes]
+        nodes = np.unique(np.concatenate(arrays)) if arrays else np.array([], dtype=int)
+        if len(nodes) and nodes[-1] - nodes[0] + 1 == len(nodes):
+            return slice(nodes[0], nodes[-1] + 1)
+        return nodes
+
+    def schedule(self, pending: pd.DataFrame, horizon: float) -> np.ndarray:
+        """
+        Simulate until every pending job has started or the horizon is reached.
+
+        Returns the estimated start time (seconds from now) of each pending row,
+        in the row order of `pending`, with NaN for jobs not started within the horizon.
+        For collapsed job arrays this is the start of the first task.
+        """
+        n_jobs = len(pending)
+        start = np.full(n_jobs, np.nan)
+        if n_jobs == 0:
+            return start
+
+        # Per-node requirements of each pending job
+        node_counts = pending["node"].clip(lower=1).to_numpy()
+        need = pending[self.resources].to_numpy(dtype=float) / node_counts[:, None]
+        need[:, 0] = np.ceil(need[:, 0])
+        limits = (pending["time_limit"].dt.total_seconds().fillna(np.inf).to_numpy()
+                  if "time_limit" in pending.columns else np.full(n_jobs, np.inf))
+        remaining = pending["tasks"].to_numpy().copy() if "tasks" in pending.columns else np.ones(n_jobs, dtype=int)
+
+        # Candidate nodes per distinct partition set, and a shape id for jobs with identical requirements
+        partition_keys = pending["partition_list"].map(tuple)
+        key_ids, keys = pd.factorize(partition_keys)
+        candidates = [self._candidate_nodes(key) for key in keys]
+        shape_ids = (pd.DataFrame(need)
+                     .assign(key=key_ids, nodes=node_counts, limit=limits)
+                     .groupby(list(range(need.shape[1])) + ["key", "nodes", "limit"], sort=False)
+                     .ngroup()
+                     .to_numpy())
+
+        # Highest priority first, then longest waiting
+        order = np.lexsort((
+            -pending["pending_time"].dt.total_seconds().fillna(0).to_numpy(),
+            -pending["priority"].to_numpy() if "priority" in pending.columns else np.zeros(n_jobs),
+        )).tolist()
+
+        # Full request per job (per-node resources, node count, time limit), and its
+        # component-wise minimum per candidate set (the smallest request that could start)
+        requests = np.column_stack([need, node_counts, limits])
+        smallest = pd.DataFrame(requests).groupby(key_ids).min().to_numpy()
+
+        # Jobs that can never run on their partitions (e.g. request exceeds node size) are never started
+        shapes, representatives = np.unique(shape_ids, return_index=True)
+        unplaceable = np.zeros(len(shapes), dtype=bool)
+        for shape, j in zip(shapes, representatives):
+            hosts = (self.capacity[candidates[key_ids[j]]] >= need[j]).all(axis=1).sum()
+            unplaceable[shape] = hosts < node_counts[j]
+        remaining[unplaceable[shape_ids]] = 0
+
+        # Resources each shape actually requests (the only ones that need checking)
+        requested_cols = [np.flatnonzero(need[j]).tolist() for j in representatives]
+
+        order = [j for j in order if remaining[j] > 0]
+        remaining = remaining.tolist()
+        jobs = (order, remaining, start, need, requests, smallest, node_counts.tolist(), limits.tolist(),
+                key_ids.tolist(), candidates, shape_ids.tolist(), requested_cols)
+
+        t = 0.0
+        waiting = len(order)
+        while waiting and t <= horizon:
+            started, scanned = self._schedule_pass(t, *jobs)
+            waiting -= started
+
+            # Drop started jobs from the scanned part of the order, so passes only walk waiting jobs
+            if started:
+                order[:scanned] = [j for j in order[:scanned] if remaining[j] > 0]
+            if not self.events:
+                break
+
+            # Coalesce completions that fall within one resolution step into a single event
+            t = max(t, self.release_until(self.events[0][0] + self.resolution))
+
+        start[start > horizon] = np.nan
+        return start
+
+    def _usable_nodes(self, nodes, need, requested, end, reserve_start) -> np.ndarray:
+        """Node indices with enough free resources now and no reservation starting before `end`."""
+        mask = reserve_start[nodes] >= end if reserve_start is not None else None
+        for r in requested:
+            fits = self.free[nodes, r] >= need[r]
+            mask = fits if mask is None else mask & fits
+        return self.node_ids[nodes] if mask is None else self.node_ids[nodes][mask]
+
+    def _schedule_pass(self, t, order, remaining, start, need, requests, smallest, node_counts,
+                       limits, key_ids, candidates, shape_ids, requested_cols) -> tuple[int, int]:
+        """
+        Start every job that fits at time t, reserving nodes for blocked jobs so backfill cannot delay them.
+
+        Returns the number of jobs that finished starting (all tasks placed, or found unplaceable)
+        and the number of positions of `order` that were scanned.
+        """
+        n_nodes = len(self.capacity)
+        reserve_start = np.full(n_nodes, np.inf)
+        reserve_end = np.zeros(n_nodes)
+
+        # Requests that failed this pass, per candidate set: any request at least as large
+        # (in every resource, node count and time limit) cannot fit either. Once the smallest
+        # request of a candidate set is covered, the whole set is exhausted for this pass.
+        failed = {}
+        failed_shapes = set()
+        exhausted = set()
+        n_keys = len(candidates)
+        reservations = 0
+        tested = 0
+        done = 0
+        position = 0
+
+        while position < len(order) and tested < self.max_job_test and len(exhausted) < n_keys:
+            j = order[position]
+            position += 1
+            if remaining[j] == 0:
+                continue
+            tested += 1
+
+            key = key_ids[j]
+            shape = shape_ids[j]
+            if key in exhausted or shape in failed_shapes:
+                continue
+            request = requests[j]
+            if key in failed and (failed[key] <= request).all(axis=1).any():
+                failed_shapes.add(shape)
+                continue
+
+            nodes = candidates[key]
+            end = t + limits[j]
+            k = node_counts[j]
+            usable_nodes = self._usable_nodes(nodes, need[j], requested_cols[shape], end,
+                                              reserve_start if reservations else None)
+
+            if k == 1 and len(usable_nodes):
+                # Consecutive jobs of the same shape (e.g. expanded array tasks) are placed together
+                batch = [j]
+                while position < len(order) and shape_ids[order[position]] == shape:
+                    if remaining[order[position]]:
+                        batch.append(order[position])
+                    position += 1
+                wanted = sum(remaining[b] for b in batch)
+
+                if wanted == 1:
+                    placed = 1
+                    self.allocate(usable_nodes[:1], need[j], end)
+                else:
+                    # Fill nodes in order with as many tasks as fit on each
+                    requested = need[j] > 0
+                    slots = (np.floor(self.free[usable_nodes][:, requested] / need[j][requested] + 1e-9).min(axis=1)
+                             if requested.any() else np.full(len(usable_nodes), wanted, dtype=float))
+                    per_node = np.clip(wanted - (np.cumsum(slots) - slots), 0, slots).astype(int)
+                    used = per_node > 0
+                    placed = int(per_node.sum())
+                    self.allocate(usable_nodes[used], per_node[used, None] * need[j], end)
+
+                for b in batch:
+                    if placed == 0:
+                        j = b
+                        break
+                    taken = min(remaining[b], placed)
+                    remaining[b] -= taken
+                    placed -= taken
+                    start[b] = t if np.isnan(start[b]) else start[b]
+                    done += remaining[b] == 0
+                    j = b
+            elif k > 1 and len(usable_nodes) >= k:
+                # Place tasks of a collapsed multi-node array until no k nodes fit another one
+                while remaining[j] and len(usable_nodes) >= k:
+                    self.allocate(usable_nodes[:k], need[j], end)
+                    remaining[j] -= 1
+                    usable_nodes = self._usable_nodes(usable_nodes, need[j], requested_cols[shape], end, None)
+                start[j] = t if np.isnan(start[j]) else start[j]
+                done += remaining[j] == 0
+
+            if remaining[j] == 0:
+                continue
+
+            failed[key] = np.vstack([failed[key], request]) if key in failed else request[None, :]
+            failed_shapes.add(shape)
+            if (request <= smallest[key]).all():
+                exhausted.add(key)
+
+            if reservations >= self.max_reservations:
+                continue
+
+            # Blocked: reserve the k nodes that become available earliest for this job
+            can_host = (self.capacity[nodes] >= need[j]).all(axis=1)
+            fits_now = (self.free[nodes] >= need[j]).all(axis=1)
+            available = np.where(fits_now, t, np.maximum(self.busy_until[nodes], t))
+            available = np.maximum(available, reserve_end[nodes])
+            available[~can_host] = np.inf
+            earliest = np.argpartition(available, k - 1)[:k]
+            shadow = available[earliest].max()
+            if np.isfinite(shadow):
+                reserved = self.node_ids[nodes][earliest]
+                reserve_start[reserved] = np.minimum(reserve_start[reserved], shadow)
+                reserve_end[reserved] = np.maximum(reserve_end[reserved], shadow + limits[j])
+                reservations += 1
+
+        return done, position
+
+
+def estimate_start_times(queue: pd.DataFrame, nodes_df: pd.DataFrame, node_partitions_df: pd.DataFrame,
+                         horizon: timedelta = timedelta(days=14), **kwargs) -> pd.Series:
+    """
+    Return the estimated time until each pending job starts (NaT if not within the horizon).
+
+    Pending jobs with GPUs of unknown type (`indeterminate_gpu`) are not simulated, since
+    their GPU request cannot be checked against any node, and are left NaT.
+    """
+    simulator = ClusterSimulator(nodes_df, node_partitions_df, **kwargs)
+    simulator.load_running_jobs(queue)
+
+    pending = queue[queue["state"] == "PENDING"]
+    if "indeterminate_gpu" in pending.columns:
+        pending = pending[pending["indeterminate_gpu"] == 0]
+    start = simulator.schedule(pending, horizon.total_seconds())
+    return (pd.Series(pd.to_timedelta(start, unit="s"), index=pending.index).dt.floor("s")
+            .reindex(queue.index[queue["state"] == "PENDING"]))
+
+
+def add_start_estimates(queue: pd.DataFrame, nodes_df: pd.DataFrame, node_partitions_df: pd.DataFrame,
+                        **kwargs) -> pd.DataFrame:
+    """Add an `est_start` column (estimated time until start) to the queue; NaT for non-pending jobs."""
+    return queue.assign(est_start=estimate_start_times(queue, nodes_df, node_partitions_df, **kwargs))
@@ -0,0 +1,188 @@
+"""
+Historical job records from SLURM accounting (`sacct`) for wait-time analysis.
+
+Pending-time figures derived from `squeue` only describe jobs that are still
+waiting, which biases them towards the current backlog. This module pulls
+completed jobs over a date range so that real queue waits (start - submit)
+can be summarised instead.
+
+The date range is split into fixed-size time windows which are queried in
+parallel. Windows that ended before the accounting settle margin can no
+longer change, so their raw `sacct` output is kept in a local cache and only
+the newest window is ever re-queried.
+
+Provides:
+- split_time_windows: split a date range into consecutive windows
+- extract_sacct_data: fetch (cached) raw sacct output for a date range
+- preprocess_sacct_data: parse raw records into a typed DataFrame
+- compute_wait_time_percentiles: wait-time percentiles grouped by a column
+- get_job_history: convenience wrapper used by main.py
+"""
+
+import io
+import shlex
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+from src.capacity_helpers import get_partition_to_gpu_map
+from src.fetch import DEFAULT_CACHE_DIR, run_slurm_command
+
+SACCT_FIELDS = ["JobID", "User", "Partition", "Submit", "Start", "End", "State", "Reason", "AllocTRES"]
+
+# Accounting records can still be written shortly after a job ends, so a window
+# is only treated as immutable once it closed at least this long ago.
+SETTLE_MARGIN = timedelta(minutes=10)
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def split_time_windows(start: datetime, end: datetime, window: timedelta) -> list[tuple[datetime, datetime]]:
+    """Split [start, end) into consecutive windows of at most `window` length."""
+    if window <= timedelta(0):
+        raise ValueError("window must be a positive duration")
+
+    windows = []
+    lower = start
+    while lower < end:
+        upper = min(lower + window, end)
+        windows.append((lower, upper))
+        lower = upper
+    return windows
+
+
+def _window_cache_path(cache_dir: Path, start: datetime, end: datetime) -> Path:
+    """Return the cache file path for a single sacct window."""
+    return cache_dir / "sacct" / f"{start:%Y%m%dT%H%M%S}_{end:%Y%m%dT%H%M%S}.txt"
+
+
+def _run_sacct_window(start: datetime, end: datetime) -> str:
+    """Run sacct for jobs that were active in [start, end) and return its raw output."""
+    cmd = shlex.split(
+        "sacct -a -X -n -P "
+        f"--starttime={start.strftime(TIME_FORMAT)} --endtime={end.strftime(TIME_FORMAT)} "
+        f"--format={','.join(SACCT_FIELDS)}"
+    )
+    # sacct -n prints no header, so empty output just means no jobs in the window
+    return run_slurm_command(cmd, name="sacct", require_output=False)
+
+
+def _fetch_window(start: datetime, end: datetime, now: datetime, cache_dir: Path | None) -> str:
+    """Return raw sacct output for one window, reading or populating the cache when it is immutable."""
+    immutable = end <= now - SETTLE_MARGIN
+    path = _window_cache_path(cache_dir, start, end) if cache_dir else None
+
+    if immutable and path and path.exists():
+        return path.read_text()
+
+    raw = _run_sacct_window(start, end)
+
+    if immutable and path:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(raw)
+        tmp_path.replace(path)
+
+    return raw
+
+
+def extract_sacct_data(
+    start: datetime,
+    end: datetime,
+    window: timedelta = timedelta(days=1),
+    workers: int = 4,
+    cache_dir: Path | None = DEFAULT_CACHE_DIR,
+    now: datetime | None = None,
+) -> pd.DataFrame:
+    """
+    Retrieve raw sacct records for jobs that ended in [start, end).
+
+    Windows are aligned to `window` boundaries so that cached windows are reused
+    across runs, and are fetched concurrently. Each job is kept only in the window
+    its end time falls into, so jobs spanning several windows are not duplicated.
+    """
+    now = now or datetime.now()
+
+    # Align to window boundaries (relative to midnight) so cache keys are stable between runs
+    midnight = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    aligned_start = midnight + ((start - midnight) // window) * window
+    windows = split_time_windows(aligned_start, end, window)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        raw_windows = list(pool.map(lambda w: _fetch_window(w[0], w[1], now, cache_dir), windows))
+
+    frames = []
+    for (lower, upper), raw in zip(windows, raw_windows):
+        df = pd.read_csv(io.StringIO(raw), sep="|", header=None, names=SACCT_FIELDS, dtype=str)
+        ended = pd.to_datetime(df["End"], format=TIME_FORMAT, errors="coerce")
+        frames.append(df[(ended >= max(lower, start)) & (ended < upper)])
+
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=SACCT_FIELDS)
+
+
+def preprocess_sacct_data(raw_data: pd.DataFrame, nodes_df: pd.DataFrame | None = None,
+                          node_partitions_df: pd.DataFrame | None = None) -> pd.DataFrame:
+    """
+    Transform raw sacct records into a typed job history DataFrame.
+
+    Jobs that never started (e.g. cancelled while pending) are dropped, since no
+    wait time can be measured for them. GPU type is taken from AllocTRES where
+    typed, falling back to the partition when it offers a single GPU type.
+    """
+    partition_to_gpu_map = {}
+    if nodes_df is not None and node_partitions_df is not None:
+        partition_to_gpu_map = {
+            part: gpus[0]
+            for part, gpus in get_partition_to_gpu_map(nodes_df, node_partitions_df).items()
+            if len(gpus) == 1
+        }
+
+    df = (raw_data.rename(columns=str.lower)
+            .rename(columns={"alloctres": "tres_alloc"})
+            .assign(submit=lambda df: pd.to_datetime(df["submit"], format=TIME_FORMAT, errors="coerce"),
+                    start=lambda df: pd.to_datetime(df["start"], format=TIME_FORMAT, errors="coerce"),
+                    end=lambda df: pd.to_datetime(df["end"], format=TIME_FORMAT, errors="coerce"),
+                    state=lambda df: df["state"].str.split().str[0],
+                    tres_alloc=lambda df: df["tres_alloc"].fillna(""),
+                    cpu=lambda df: df["tres_alloc"].str.extract(r"cpu=(\d+)")[0].fillna(0).astype(int),
+                    gpu=lambda df: df["tres_alloc"].str.extract(r"gres/gpu=(\d+)")[0].fillna(0).astype(int),
+                    wait_time=lambda df: df["start"] - df["submit"])
+            .dropna(subset=["submit", "start"]))
+
+    typed_gpu = df["tres_alloc"].str.extract(r"gres/gpu:([^=,]+)=")[0]
+    partition_gpu = df["partition"].map(partition_to_gpu_map)
+    df["gpu_type"] = (typed_gpu
+                      .fillna(partition_gpu)
+                      .fillna("indeterminate_gpu")
+                      .where(df["gpu"] > 0, "none"))
+
+    return df.drop(columns=["tres_alloc"]).reset_index(drop=True)
+
+
+def compute_wait_time_percentiles(history_df: pd.DataFrame, groupby_col: str,
+                                  percentiles=(0.5, 0.9, 0.99)) -> pd.DataFrame:
+    """Compute job counts and wait-time percentiles grouped by a column (e.g. 'partition', 'gpu_type')."""
+    columns = [groupby_col, "jobs", *(f"p{round(q * 100)} wait" for q in percentiles)]
+    if history_df.empty:
+        return pd.DataFrame(columns=columns)
+
+    grouped = history_df.groupby(groupby_col)["wait_time"]
+    quantiles = grouped.quantile(list(percentiles)).unstack()
+    quantiles.columns = [f"p{round(q * 100)} wait" for q in quantiles.columns]
+
+    return (quantiles
+            .apply(lambda col: col.dt.floor("s"))
+            .assign(jobs=grouped.size())
+            .sort_values("jobs", ascending=False)
+            .reset_index()
+            .loc[:, columns])
+
+
+def get_job_history(days: int, nodes_df: pd.DataFrame | None = None,
+                    node_partitions_df: pd.DataFrame | None = None, **kwargs) -> pd.DataFrame:
+    """Run sacct over the last `days` days and return the processed job history DataFrame."""
+    end = datetime.now().replace(microsecond=0)
+    raw_sacct_data = extract_sacct_data(end - timedelta(days=days), end, now=end, **kwargs)
+    return preprocess_sacct_data(raw_sacct_data, nodes_df, node_partitions_df)
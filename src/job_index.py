@@ -0,0 +1,117 @@
+"""
+Indexes over the jobs of one queue snapshot, for drill-down and search.
+
+The TUI tables only show aggregates (per user, partition or pending reason).
+A JobIndex is built once per snapshot and maps each user, partition, reason,
+state and node to the (sorted) row positions of its jobs, and keeps the job
+IDs sorted for prefix lookups. Filtering a 200k job queue is then a few array
+intersections rather than a scan of the DataFrame on every keystroke.
+
+Provides:
+- JobIndex: posting lists per key, with select (exact filters) and search
+  (search-as-you-type over job ID, user, reason and node)
+"""
+
+import numpy as np
+import pandas as pd
+
+INDEXED_COLUMNS = ["user", "partition", "reason", "state"]
+SEARCH_COLUMNS = ["user", "reason", "node"]
+
+JOB_COLUMNS = ["jobid", "state", "user", "partition", "reason", "tasks", "cpu", "mem_gb", "gpu",
+               "pending_time", "rank", "time_limit", "est_start", "nodelist"]
+
+
+class JobIndex:
+    """Posting lists of job row positions by user, partition, reason, state and node, plus sorted job IDs."""
+
+    def __init__(self, queue: pd.DataFrame, gpu_types: list[str]):
+        self.queue = queue
+        self.gpu_types = [gpu for gpu in gpu_types if gpu in queue.columns] + ["indeterminate_gpu"]
+        positions = np.arange(len(queue))
+
+        # A job is listed under every node it runs on (pending jobs have no nodes)
+        nodelists = queue["nodelist"].to_numpy()
+        lengths = np.fromiter((len(nodes) for nodes in nodelists), dtype=int, count=len(nodelists))
+        nodes = np.array([node for nodes in nodelists for node in nodes], dtype=str)
+        running = (nodes != "nan") & (nodes != "")
+
+        # (key per entry, position per entry) of each indexed column
+        entries = {col: (queue[col].astype(str).to_numpy(), positions) for col in INDEXED_COLUMNS}
+        entries["node"] = (nodes[running], np.repeat(positions, lengths)[running])
+
+        self.postings = {}
+        self.search_keys = {}
+        for col, (keys, entry_positions) in entries.items():
+            codes, uniques = pd.factorize(keys)
+            order = np.argsort(codes, kind="stable")
+            bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+            self.postings[col] = {key: entry_positions[order[bounds[i]:bounds[i + 1]]]
+                                  for i, key in enumerate(uniques)}
+            if col in SEARCH_COLUMNS:
+                # Lower-cased distinct keys for substring search, and the key code of every entry
+                self.search_keys[col] = (np.char.lower(uniques.astype(str)), codes, entry_positions)
+
+        jobids = queue["jobid"].astype(str).to_numpy()
+        self.jobid_order = np.argsort(jobids, kind="stable")
+        self.sorted_jobids = jobids[self.jobid_order]
+
+    def __len__(self):
+        return len(self.queue)
+
+    def positions_of(self, labels: pd.Index) -> np.ndarray:
+        """Return the sorted positions of the given queue index labels (e.g. an analysis group's queue)."""
+        positions = self.queue.index.get_indexer(labels)
+        return np.sort(positions[positions >= 0])
+
+    def select(self, within: np.ndarray | None = None, **filters) -> np.ndarray:
+        """
+        Return the sorted positions of jobs matching every filter (e.g. user="alice", state="PENDING"),
+        optionally restricted to the positions `within`.
+        """
+        result = within
+        for col, value in filters.items():
+            if value is None:
+                continue
+            if col not in self.postings:
+                raise KeyError(f"No index on '{col}'. Indexed: {', '.join(self.postings)}")
+            matches = self.postings[col].get(str(value), np.array([], dtype=int))
+            result = matches if result is None else np.intersect1d(result, matches, assume_unique=True)
+        return np.arange(len(self)) if result is None else result
+
+    def search(self, text: str, within: np.ndarray | None = None) -> np.ndarray:
+        """
+        Return the sorted positions of jobs whose ID starts with `text`, or whose user, reason or
+        node contains it (case-insensitive), optionally restricted to the positions `within`.
+        """
+        text = text.strip()
+        if not text:
+            return np.arange(len(self)) if within is None else within
+
+        matched = np.zeros(len(self), dtype=bool)
+
+        # Job ID prefix: a contiguous range of the sorted job IDs
+        start = np.searchsorted(self.sorted_jobids, text, side="left")
+        stop = np.searchsorted(self.sorted_jobids, text + "\uffff", side="left")
+        matched[self.jobid_order[start:stop]] = True
+
+        # Substring: test each distinct key once, then mark the entries of the matching keys
+        needle = text.lower()
+        for lower_keys, codes, entry_positions in self.search_keys.values():
+            key_matches = np.char.find(lower_keys, needle) >= 0
+            matched[entry_positions[key_matches[codes]]] = True
+
+        return np.flatnonzero(matched) if within is None else within[matched[within]]
+
+    def jobs_df(self, positions: np.ndarray, limit: int | None = None) -> pd.DataFrame:
+        """Return display columns of the jobs at the given positions (the first `limit` of them)."""
+        positions = positions[:limit]
+        jobs = self.queue.iloc[positions]
+        gpu_counts = jobs[self.gpu_types].to_numpy()
+
+        return (jobs
+                .loc[:, [c for c in JOB_COLUMNS if c in jobs.columns]]
+                .assign(gpu=[", ".join(f"{gpu}: {count:g}" for gpu, count in zip(self.gpu_types, row) if count > 0)
+                             or "—" for row in gpu_counts],
+                        nodelist=lambda df: [",".join(n for n in nodes if n not in {"nan", ""}) for nodes in df["nodelist"]])
+                .reset_index(drop=True))
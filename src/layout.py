@@ -2,14 +2,16 @@
 Defines the layout for the HPC queue analysis app using Textual.
 
 Each analysis group is rendered as a tabbed pane with summary, group-by, and raw views.
+Rows of the Users, Partitions and Queue Times tables can be selected to drill
+down into the matching jobs (see src/drilldown.py).
 """
 
 from textual.widgets import TabPane, TabbedContent, Markdown
 from textual.containers import Horizontal, Vertical
-from src.widgets import make_datatable, make_summary_datatable
+from src.widgets import make_datatable, make_summary_datatable, make_node_heatmap
 from src.styles import CMAP_RUNNING, CMAP_PENDING
 
-def compose_summary_tab(running_group, pending_group):
+def compose_summary_tab(running_group, pending_group, position: int):
     """Create a tab showing summary of allocations."""
     with TabPane("📊 Summary"):
         yield Horizontal(
@@ -20,7 +22,8 @@ def compose_summary_tab(running_group, pending_group):
                 make_datatable(
                     running_group.allocation_df,
                     highlight_col="Allocation %",
-                    cmap=CMAP_RUNNING
+                    cmap=CMAP_RUNNING,
+                    cache_key=(position, "running", "allocation")
                 )
             ),
             Vertical(
@@ -30,51 +33,79 @@ def compose_summary_tab(running_group, pending_group):
                 make_datatable(
                     pending_group.allocation_df,
                     highlight_col="Allocation %",
-                    cmap=CMAP_PENDING
+                    cmap=CMAP_PENDING,
+                    cache_key=(position, "pending", "allocation")
                 )
             )
         )
 
 
-def compose_user_allocation_tab(running_group, pending_group):
+def compose_user_allocation_tab(running_group, pending_group, position: int):
     """Create a tab showing user-level allocation stats side by side with spacing."""
     with TabPane("👥 Users"):
         yield Horizontal(
             Vertical(
                 Markdown("# 🏃 Running Jobs by User"),
                 make_datatable(
-                    running_group.grpby_user_df.sort_values(by="cpu", ascending=False)
+                    running_group.grpby_user_df,
+                    sort_by="cpu",
+                    cache_key=(position, "running", "users"),
+                    drilldown=(running_group, ["user"])
                 )
             ),
             Vertical(
                 Markdown("# 🕒 Pending Jobs by User"),
                 make_datatable(
-                    pending_group.grpby_user_df.sort_values(by="cpu", ascending=False)
-                )
+                    pending_group.grpby_user_df,
+                    sort_by="cpu",
+                    cache_key=(position, "pending", "users"),
+                    drilldown=(pending_group, ["user"])
+                ),
+                *compose_priority_by_user(pending_group, position)
             )
         )
 
 
+def compose_priority_by_user(pending_group, position: int):
+    """Return widgets for the per-user priority factor table (none when no sprio/sshare data was fetched)."""
+    if pending_group.priority_by_user_df.empty:
+        return []
+    return [
+        Markdown("# ⚖️ Priority Factors by User"),
+        make_datatable(
+            pending_group.priority_by_user_df,
+            cache_key=(position, "pending", "priority by user"),
+            drilldown=(pending_group, ["user"])
+        ),
+    ]
+
+
 
-def compose_partition_allocation_tab(running_group, pending_group):
+def compose_partition_allocation_tab(running_group, pending_group, position: int):
     """Create a tab showing resource usage grouped by partition, sorted by CPU."""
     with TabPane("📦 Partitions"):
         yield Horizontal(
             Vertical(
                 Markdown("# 🏃 Running Jobs by Partition"),
                 make_datatable(
-                    running_group.grpby_partition_df.sort_values(by="cpu", ascending=False),
+                    running_group.grpby_partition_df,
+                    sort_by="cpu",
+                    cache_key=(position, "running", "partitions"),
+                    drilldown=(running_group, ["partition"])
                 )
             ),
             Vertical(
                 Markdown("# 🕒 Pending Jobs by Partition"),
                 make_datatable(
-                    pending_group.grpby_partition_df.sort_values(by="cpu", ascending=False),
+                    pending_group.grpby_partition_df,
+                    sort_by="cpu",
+                    cache_key=(position, "pending", "partitions"),
+                    drilldown=(pending_group, ["partition"])
                 )
             )
         )
 
-def compose_queue_length_tab(pending_group):
+def compose_queue_length_tab(pending_group, position: int):
     """Create a tab with two sub-tabs: one for Priority/Resources, one for Other reasons."""
     with TabPane("🕒 Queue Times"):
         df = pending_group.pending_time_df
@@ -88,22 +119,97 @@ def compose_queue_length_tab(pending_group):
             with TabPane("⏰ Priority/Resources"):
                 yield Vertical(
                     Markdown("### ⏰ Priority/Resources"),
-                    make_datatable(top)
+                    make_datatable(top, cache_key=(position, "pending", "priority/resources"),
+                                   drilldown=(pending_group, ["partition", "reason"]))
                 )
 
             # Other reasons tab
             with TabPane("🚦 Other reasons"):
                 yield Vertical(
                     Markdown("### 🚦 Other reasons"),
-                    make_datatable(bottom)
+                    make_datatable(bottom, cache_key=(position, "pending", "other reasons"),
+                                   drilldown=(pending_group, ["partition", "reason"]))
                 )
 
+            # Start time estimates (only when the queue has been forecast)
+            if not pending_group.start_estimate_df.empty:
+                with TabPane("🔮 Start Estimates"):
+                    yield Vertical(
+                        Markdown("### 🔮 Estimated Start Times"),
+                        make_datatable(pending_group.start_estimate_df,
+                                       cache_key=(position, "pending", "start estimates"))
+                    )
+
+
+def compose_node_tab(running_group, position: int):
+    """Create a tab showing a per-node allocation heatmap and fragmentation of free capacity."""
+    with TabPane("🧩 Nodes"):
+        yield Vertical(
+            Markdown("# 🧩 Node Allocation"),
+            make_node_heatmap(running_group.node_allocation_df, cmap=CMAP_RUNNING),
+            Markdown("# Fragmentation of Free Capacity"),
+            make_datatable(running_group.fragmentation_df, cache_key=(position, "running", "fragmentation"))
+        )
+
+
+def compose_throughput_tab(throughput_df, window_minutes: float):
+    """Create a tab showing job starts, completions and reason changes per analysis group over recent refreshes."""
+    with TabPane("📈 Throughput"):
+        if throughput_df.empty:
+            yield Markdown("# 📈 Throughput\n\nWaiting for the next refresh to compare snapshots...")
+        else:
+            yield Vertical(
+                Markdown(f"# 📈 Throughput (last {window_minutes:.0f} min)"),
+                make_datatable(throughput_df)
+            )
+
+
+def compose_fetch_tab(stats_df, stale_warnings, gpu_attribution_df=None, snapshot_ages=None):
+    """
+    Create a tab showing Slurm command latency and failure counts (and the age of snapshot files
+    read with --snapshot), flagged when data is stale.
+    """
+    with TabPane("📡 Slurm ⚠" if stale_warnings else "📡 Slurm"):
+        attribution = []
+        if gpu_attribution_df is not None and not gpu_attribution_df.empty:
+            attribution = [Markdown("# 🎮 GPU Attribution (scontrol)"), make_datatable(gpu_attribution_df)]
+        snapshots = []
+        if snapshot_ages:
+            snapshots = [Markdown("# 💾 Snapshot File"),
+                         *(Markdown(f"`{path}` written {age} ago") for path, age in snapshot_ages.items())]
+        yield Vertical(
+            *snapshots,
+            Markdown("# 📡 Slurm Commands"),
+            *(Markdown(f"**⚠ {warning}**") for warning in stale_warnings),
+            make_datatable(stats_df),
+            *attribution
+        )
+
+
+def compose_history_tab(wait_by_partition_df, wait_by_gpu_df):
+    """Create a tab showing historical (sacct) wait-time percentiles by partition and GPU type."""
+    with TabPane("📜 History"):
+        yield Horizontal(
+            Vertical(
+                Markdown("# 📦 Wait Times by Partition"),
+                make_datatable(wait_by_partition_df)
+            ),
+            Vertical(
+                Markdown("# 🎮 Wait Times by GPU Type"),
+                make_datatable(wait_by_gpu_df)
+            )
+        )
+
 
-def compose_analysis_group_tab(running_group, pending_group):
-    """Create full tab layout for a pair of AnalysisGroup objects."""
+def compose_analysis_group_tab(running_group, pending_group, position: int):
+    """
+    Create full tab layout for a pair of AnalysisGroup objects. Cached tables are keyed by the
+    pair's position in the analysis groups, since group names need not be unique.
+    """
     with TabPane(running_group.name):
         with TabbedContent():
-            yield from compose_summary_tab(running_group, pending_group)
-            yield from compose_user_allocation_tab(running_group, pending_group)
-            yield from compose_partition_allocation_tab(running_group, pending_group)
-            yield from compose_queue_length_tab(pending_group)
+            yield from compose_summary_tab(running_group, pending_group, position)
+            yield from compose_user_allocation_tab(running_group, pending_group, position)
+            yield from compose_partition_allocation_tab(running_group, pending_group, position)
+            yield from compose_queue_length_tab(pending_group, position)
+            yield from compose_node_tab(running_group, position)
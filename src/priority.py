@@ -0,0 +1,133 @@
+"""
+Priority factors (`sprio`) and fairshare (`sshare`) of pending jobs.
+
+A pending job's reason (`Priority`, `Resources`) says that it is waiting, but
+not why other jobs come first. `sprio` breaks each pending job's priority
+into its weighted factors (age, fairshare, job size, partition, QOS), and
+`sshare` gives each user's fairshare factor and effective usage. Both are
+joined onto the queue, and every pending job gets its rank within its
+partition (1 = highest priority).
+
+sprio reports the numeric ID of each job record, not the `<array>_<task>`
+ID squeue shows for array tasks, so factors are joined on the record ID
+(squeue `%A`, the queue's `record_id` column). Pending tasks of an array
+that share one record get the same factors.
+
+A job submitted to several partitions is queued in each of them, so it is
+ranked in every partition of its `partition_list`, and its rank is the best
+of these. Ranks come from one lexsort of the pending queue with one row per
+(job, partition) per snapshot (by partition, then priority, then pending
+time), so ranking 100k jobs costs a sort rather than a lookup per job.
+
+Provides:
+- extract_priority_data: fetch sprio and sshare output (as one snapshot)
+- parse_sprio_output / parse_sshare_output: typed DataFrames
+- rank_within_partition: rank of each pending job within its partition
+- add_priority_factors: join factors and fairshare onto the queue and rank it
+- get_priority_data: convenience wrapper used by get_queue_data
+"""
+
+import io
+import shlex
+
+import numpy as np
+import pandas as pd
+
+from src.fetch import fetch_snapshot
+
+SPRIO_FIELDS = ["jobid", "partition", "user", "priority", "age", "fairshare", "jobsize", "partition_prio", "qos"]
+SSHARE_FIELDS = ["account", "user", "norm_shares", "effective_usage", "fairshare_factor"]
+
+# Factor columns added to the queue
+FACTOR_COLUMNS = ["age", "fairshare", "jobsize", "partition_prio", "qos"]
+
+
+def extract_priority_data() -> tuple[str, str]:
+    """Run sprio and sshare concurrently and return their raw outputs."""
+    cmds = {
+        "sprio": shlex.split('sprio -h -o "%i|%r|%u|%Y|%A|%F|%J|%P|%Q"'),
+        "sshare": shlex.split("sshare -a -P -n -o Account,User,NormShares,EffectvUsage,FairShare"),
+    }
+    raw = fetch_snapshot("priority", cmds)
+    return raw["sprio"], raw["sshare"]
+
+
+def parse_sprio_output(raw: str) -> pd.DataFrame:
+    """Parse `sprio -h` output into one row per job (in the partition where its priority is highest)."""
+    df = pd.read_csv(io.StringIO(raw), sep="|", header=None, names=SPRIO_FIELDS, dtype=str,
+                     skipinitialspace=True)
+    numeric = ["priority"] + FACTOR_COLUMNS
+    df[numeric] = df[numeric].apply(pd.to_numeric, errors="coerce")
+
+    # Jobs pending in several partitions have one row per partition
+    return (df.assign(jobid=lambda d: d["jobid"].str.strip())
+              .sort_values("priority", ascending=False, kind="stable")
+              .drop_duplicates("jobid")
+              .drop(columns=["partition", "user", "priority"])
+              .reset_index(drop=True))
+
+
+def parse_sshare_output(raw: str) -> pd.DataFrame:
+    """Parse `sshare -P -n` output into one row per user (their highest fairshare factor over accounts)."""
+    df = pd.read_csv(io.StringIO(raw), sep="|", header=None, names=SSHARE_FIELDS, dtype=str)
+    numeric = ["norm_shares", "effective_usage", "fairshare_factor"]
+    df[numeric] = df[numeric].apply(pd.to_numeric, errors="coerce")
+
+    # Account rows (no user) are association totals
+    return (df[df["user"].notna()]
+            .assign(user=lambda d: d["user"].str.strip())
+            .sort_values("fairshare_factor", ascending=False, kind="stable")
+            .drop_duplicates("user")
+            .loc[:, ["user", "fairshare_factor", "effective_usage"]]
+            .reset_index(drop=True))
+
+
+def rank_within_partition(queue: pd.DataFrame) -> pd.Series:
+    """
+    Rank each pending job within each partition of its partition_list: by priority (highest first),
+    then by pending time (longest first), and return its best rank. Array rows count as one position
+    per task. Non-pending jobs get NaN.
+    """
+    pending = np.flatnonzero((queue["state"] == "PENDING").to_numpy())
+    partition_lists = queue["partition_list"].to_numpy()[pending]
+
+    # One row per (pending job, partition); `job` maps each row back to its pending job
+    job = np.repeat(np.arange(len(pending)), [len(p) for p in partition_lists])
+    partitions, _ = pd.factorize(np.concatenate(partition_lists) if len(pending) else np.array([], dtype=object))
+    priority = queue["priority"].to_numpy()[pending][job]
+    waited = queue["pending_time"].dt.total_seconds().fillna(0).to_numpy()[pending][job]
+    tasks = queue["tasks"].to_numpy()[pending][job]
+
+    # Sort by partition, then priority and pending time descending (lexsort: last key is primary)
+    order = np.lexsort((-waited, -priority, partitions))
+    sorted_partitions = partitions[order]
+
+    # Position within the partition = tasks ahead of the job in its partition, plus one
+    ahead = np.cumsum(tasks[order]) - tasks[order]
+    starts = np.flatnonzero(np.r_[True, sorted_partitions[1:] != sorted_partitions[:-1]])
+    partition_start = np.repeat(ahead[starts], np.diff(np.r_[starts, len(order)]))
+
+    ranks = np.empty(len(order))
+    ranks[order] = ahead - partition_start + 1
+
+    best = np.full(len(pending), np.inf)
+    np.minimum.at(best, job, ranks)
+
+    result = pd.Series(np.nan, index=queue.index)
+    result.iloc[pending] = best
+    return result
+
+
+def add_priority_factors(queue: pd.DataFrame, sprio: pd.DataFrame, sshare: pd.DataFrame) -> pd.DataFrame:
+    """Return the queue with sprio factors (by job record ID), sshare fairshare (by user) and partition rank columns."""
+    return (queue
+            .merge(sprio.rename(columns={"jobid": "record_id"}), on="record_id", how="left")
+            .merge(sshare, on="user", how="left")
+            .set_axis(queue.index)
+            .assign(rank=rank_within_partition))
+
+
+def get_priority_data() -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Run sprio and sshare and return (sprio_df, sshare_df)."""
+    raw_sprio, raw_sshare = extract_priority_data()
+    return parse_sprio_output(raw_sprio), parse_sshare_output(raw_sshare)
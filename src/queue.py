@@ -2,31 +2,45 @@
 Handles SLURM queue data extraction, preprocessing, and GPU assignment logic.
 """
 
-import subprocess
 import io
 import pandas as pd
 import shlex
-from src.utils import expand_nodelist
+from src.utils import expand_nodelist, count_array_tasks
 from src.capacity_helpers import get_gpu_types, get_node_to_gpu_map, get_partition_to_gpu_map
+from src.fetch import fetch_snapshot
+from src.priority import add_priority_factors, get_priority_data
+from concurrent.futures import ThreadPoolExecutor
 
-def extract_squeue_data():
+def extract_squeue_data(expand_arrays: bool = True):
     """
     Retrieve and preprocess current SLURM queue data.
 
     Executes squeue in both long and short formats, which have different field options, 
     merges results, and applies preprocessing to produce a unified job queue DataFrame.
+
+    With expand_arrays=False, pending array tasks are left collapsed into a single
+    row per array (e.g. '123_[0-99999%50]') instead of one row per task.
     """
+    return parse_squeue_output(*fetch_squeue_output(expand_arrays))
 
+def fetch_squeue_output(expand_arrays: bool = True) -> tuple[str, str]:
+    """Run squeue in the long (--Format) and short (--format) formats and return both raw outputs."""
+    array_flag = '-r ' if expand_arrays else ''
 
     # slurm doesn't give all fields on either --Format or --format so both are needed
-    cmd_long = shlex.split('squeue -r -a --Format=JobArrayID,PendingTime,tres-alloc:100')
-    cmd_short = shlex.split('squeue -r -a --format=%i|%T|%r|%P|%u|%b|%N')
+    cmd_long = shlex.split(f'squeue {array_flag}-a --Format=JobArrayID,PendingTime,tres-alloc:100')
+    cmd_short = shlex.split(f'squeue {array_flag}-a --format=%i|%T|%r|%P|%u|%b|%N|%L|%l|%Q|%A')
 
-    raw_long = subprocess.run(cmd_long, capture_output=True, text=True).stdout
-    raw_short = subprocess.run(cmd_short, capture_output=True, text=True).stdout
+    # Both formats are fetched concurrently and fall back to the last good pair together
+    raw = fetch_snapshot("squeue" if expand_arrays else "squeue_collapsed",
+                         {"squeue (long)": cmd_long, "squeue (short)": cmd_short})
+    return raw["squeue (long)"], raw["squeue (short)"]
 
+def parse_squeue_output(raw_long: str, raw_short: str) -> pd.DataFrame:
+    """Parse the long (--Format) and short (--format) squeue outputs and merge them on JOBID."""
     df_long = pd.read_csv(io.StringIO(raw_long), sep=r'\s+').astype(str)
-    df_short = pd.read_csv(io.StringIO(raw_short), sep='|').astype(str)
+    # %A (the numeric ID of the job record, which sprio reports) has the same JOBID header as %i
+    df_short = pd.read_csv(io.StringIO(raw_short), sep='|').astype(str).rename(columns={"JOBID.1": "RECORD_ID"})
 
     return pd.merge(df_long, df_short, on='JOBID', how='outer')
 
@@ -67,23 +81,42 @@ def assign_gpus(row, gpu_types, node_to_gpu_map, partition_to_gpu_map):
     row["indeterminate_gpu"] += remaining_gpu
     return row
 
-def preprocess_squeue_data(raw_data: str, capacities_df) -> pd.DataFrame:
+def count_tasks(jobids: pd.Series) -> pd.Series:
+    """Return the number of array tasks represented by each job ID (1 unless a collapsed array)."""
+    tasks = pd.Series(1, index=jobids.index)
+    collapsed = jobids.str.contains('[', regex=False)
+    tasks[collapsed] = jobids[collapsed].map(count_array_tasks)
+    return tasks
+
+def parse_slurm_durations(durations: pd.Series) -> pd.Series:
+    """
+    Parse SLURM durations ('[days-]hours:minutes:seconds' or 'minutes:seconds') into timedeltas.
+
+    Non-durations such as 'UNLIMITED', 'NOT_SET' or 'INVALID' become NaT.
+    """
+    parts = (durations.astype(str)
+             .str.extract(r'^(?:(\d+)-)?(?:(\d+):)?(\d+):(\d+)$')
+             .astype(float))
+    seconds = parts[0].fillna(0) * 86400 + parts[1].fillna(0) * 3600 + parts[2] * 60 + parts[3]
+    return pd.to_timedelta(seconds, unit='s')
+
+def preprocess_squeue_data(raw_data: str, nodes_df, node_partitions_df) -> pd.DataFrame:
     """Transform raw squeue output into enriched job DataFrame with GPU assignments."""
 
-    gpu_types = get_gpu_types(capacities_df)
+    gpu_types = get_gpu_types(nodes_df)
     
     
     # get node_to_gpu_map, but keep only entries where gpu is uniquely defined by node
     node_to_gpu_map = {
         node: gpus[0]
-        for node, gpus in get_node_to_gpu_map(capacities_df).items()
+        for node, gpus in get_node_to_gpu_map(nodes_df).items()
         if len(gpus) == 1
     }
 
     # get partition_to_gpu_map, but keep only entries where gpu is uniquely defined by partition
     partition_to_gpu_map = {
         part: gpus[0]
-        for part, gpus in get_partition_to_gpu_map(capacities_df).items()
+        for part, gpus in get_partition_to_gpu_map(nodes_df, node_partitions_df).items()
         if len(gpus) == 1
     }
 
@@ -96,9 +129,14 @@ def preprocess_squeue_data(raw_data: str, capacities_df) -> pd.DataFrame:
                     gpu=lambda df: df['tres_alloc'].str.extract(r'gpu=(\d+)').fillna(0).astype(int),
                     gpu_per_node=lambda df: df["gpu"].div(df["node"]).fillna(0),
                     mem_gb=lambda df: df['tres_alloc'].str.extract(r'mem=(\d*\.?\d+)([KMGTP])')
-                        .apply(lambda x: float(x[0]) * {'K': 1/(1000**2), 'M': 1/1000, 'G': 1, 'T': 1000}.get(x[1], 1), axis=1).round(0).astype(int),
+                        .apply(lambda x: float(x[0]) * {'K': 1/(1000**2), 'M': 1/1000, 'G': 1, 'T': 1000}.get(x[1], 1), axis=1)
+                        .fillna(0).round(0).astype(int),
                     gpu_type_tres_per_node=lambda df: df['tres_per_node'].str.extract(r'gpu:([^:]+)').fillna('none'),
-                    pending_time=lambda df: pd.to_timedelta(pd.to_numeric(df['pending_time']),unit='s'),
+                    pending_time=lambda df: pd.to_timedelta(pd.to_numeric(df['pending_time'], errors='coerce'), unit='s'),
+                    tasks=lambda df: count_tasks(df['jobid']),
+                    time_left=lambda df: parse_slurm_durations(df['time_left']),
+                    time_limit=lambda df: parse_slurm_durations(df['time_limit']),
+                    priority=lambda df: pd.to_numeric(df['priority'], errors='coerce').fillna(0).astype(int),
                     partition_list=lambda df:df['partition'].str.split(","),
                     indeterminate_gpu=lambda df:pd.Series([0] * len(df), index=df.index),
                     reason=lambda df:df['reason'].str[:25]
@@ -109,9 +147,20 @@ def preprocess_squeue_data(raw_data: str, capacities_df) -> pd.DataFrame:
     return df
 
 
-def get_queue_data(capacities_df):
-    """Run squeue and return enriched job queue DataFrame with resource allocations."""
-    raw_squeue_data = extract_squeue_data()
-    preprocessed_squeue_data = preprocess_squeue_data(raw_squeue_data, capacities_df)
+def get_queue_data(nodes_df, node_partitions_df, expand_arrays: bool = True, priority: bool = False):
+    """
+    Run squeue and return enriched job queue DataFrame with resource allocations.
+
+    With priority=True, sprio and sshare are fetched concurrently with squeue, and their
+    priority factors, fairshare and each pending job's rank within its partition are added.
+    """
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        raw_future = pool.submit(extract_squeue_data, expand_arrays)
+        priority_future = pool.submit(get_priority_data) if priority else None
+    raw_squeue_data = raw_future.result()
+
+    preprocessed_squeue_data = preprocess_squeue_data(raw_squeue_data, nodes_df, node_partitions_df)
+    if priority_future is not None:
+        preprocessed_squeue_data = add_priority_factors(preprocessed_squeue_data, *priority_future.result())
     return preprocessed_squeue_data
 
@@ -0,0 +1,153 @@
+"""
+Per-node GPU attribution from `scontrol show job -d`.
+
+`assign_gpus` can only attribute a job's GPUs to a type when its nodes, its
+TRES request or its partition have a single GPU type. Running jobs on nodes
+with several GPU types (e.g. MIG slices), or in partitions mixing GPU types,
+end up in `indeterminate_gpu`. The detailed job view of scontrol lists the
+GRES allocated on each node, e.g.
+
+    Nodes=gpu[01-02] CPU_IDs=0-7 Mem=32000 GRES=gpu:a100:2(IDX:0-1)
+
+which gives the exact GPU types of a running job.
+
+Only running jobs with indeterminate GPUs are looked up. A running job's
+allocation does not change, so results are cached by job ID for as long as
+the job stays in the queue, and a refresh only queries jobs that started
+since the last one. Up to BATCH_THRESHOLD jobs are looked up with one
+`scontrol show job <jobid>` call each, a bounded number at a time. Above that
+(e.g. on a cold cache with thousands of such jobs), one RPC for the whole job
+table is cheaper for slurmctld than thousands of single-job RPCs, so a
+single `scontrol -d -o show job` is run instead. Its output is filtered to the
+requested jobs before anything is cached. The trade-off is one large response,
+which the client parses, in place of many small RPCs to slurmctld.
+
+Provides:
+- parse_scontrol_jobs: GPU counts per type from scontrol output
+- resolve_indeterminate_gpus: attribute indeterminate GPUs of running jobs
+- gpu_attribution_df: jobs resolved and still indeterminate after the last run
+"""
+
+import re
+import shlex
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from src.fetch import FetchError, run_slurm_command
+from src.utils import expand_nodelist
+
+# Above this many uncached jobs, one call for the whole job table replaces one call per job
+BATCH_THRESHOLD = 50
+
+_lock = threading.Lock()
+_resolved: dict[str, dict[str, int]] = {}
+_last_run: dict[str, int] = {}
+
+
+def _gres_counts(gres: str) -> dict[str, int]:
+    """Count GPUs per type in a per-node GRES string (e.g. 'gpu:a100:1(IDX:0),gpu:v100:1(IDX:2)')."""
+    counts = {}
+    for gpu_type, count in re.findall(r'gpu:([^:(,]+):(\d+)', gres):
+        counts[gpu_type] = counts.get(gpu_type, 0) + int(count)
+    return counts
+
+
+def parse_scontrol_jobs(raw: str) -> dict[str, dict[str, int]]:
+    """
+    Parse `scontrol -d show job` output (one or several jobs, multi-line or --oneliner) into the
+    number of GPUs per type allocated to each job, keyed by job ID (array tasks as '<array>_<task>').
+
+    Jobs without typed per-node GRES (e.g. pending jobs) map to an empty dict.
+    """
+    jobs = {}
+    for record in re.split(r'(?=(?<!\S)JobId=)', raw):
+        job_match = re.match(r'JobId=(\S+)', record)
+        if not job_match:
+            continue
+        jobid = job_match.group(1)
+        array_match = re.search(r'(?<!\S)ArrayJobId=(\d+)\s+ArrayTaskId=(\d+)(?!\S)', record)
+        if array_match:
+            jobid = f"{array_match.group(1)}_{array_match.group(2)}"
+
+        counts = {}
+        for nodes, gres in re.findall(r'(?<!\S)Nodes=(\S+)\s+CPU_IDs=\S*\s+Mem=\S*\s+GRES=(\S*)', record):
+            n_nodes = len(expand_nodelist(nodes).split(','))
+            for gpu_type, count in _gres_counts(gres).items():
+                counts[gpu_type] = counts.get(gpu_type, 0) + count * n_nodes
+        jobs[jobid] = counts
+    return jobs
+
+
+def _lookup_jobs(jobids: list[str], workers: int) -> dict[str, dict[str, int]]:
+    """
+    Query scontrol for the given jobs: one by one with at most `workers` calls at a time, or with
+    a single call for all jobs (filtered to the given ones) above BATCH_THRESHOLD. Jobs whose
+    lookup failed are missing from the result, so they are retried at the next refresh.
+    """
+    def lookup(cmd):
+        try:
+            return parse_scontrol_jobs(run_slurm_command(cmd, name="scontrol"))
+        except FetchError:
+            return {}
+
+    if len(jobids) > BATCH_THRESHOLD:
+        wanted = set(jobids)
+        return {jobid: counts for jobid, counts in lookup(shlex.split("scontrol -d -o show job")).items()
+                if jobid in wanted}
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = list(pool.map(lookup, [shlex.split(f"scontrol -d -o show job {jobid}") for jobid in jobids]))
+    return {jobid: counts for result in results for jobid, counts in result.items()}
+
+
+def resolve_indeterminate_gpus(queue: pd.DataFrame, gpu_types: list[str], workers: int = 8) -> pd.DataFrame:
+    """
+    Return the queue with the indeterminate GPUs of running jobs attributed to GPU types from
+    `scontrol -d show job`. GPUs of types not in `gpu_types`, or of jobs that cannot be resolved,
+    stay indeterminate.
+    """
+    candidates = queue[(queue["indeterminate_gpu"] > 0) & (queue["state"] == "RUNNING")]
+    jobids = candidates["jobid"].astype(str)
+
+    with _lock:
+        # Drop jobs that have left the queue, and reuse the rest
+        for jobid in set(_resolved) - set(queue["jobid"].astype(str)):
+            del _resolved[jobid]
+        uncached = [jobid for jobid in jobids if jobid not in _resolved]
+
+    looked_up = _lookup_jobs(uncached, workers) if uncached else {}
+    with _lock:
+        _resolved.update({jobid: looked_up[jobid] for jobid in uncached if jobid in looked_up})
+        resolved = {jobid: _resolved[jobid] for jobid in jobids if _resolved.get(jobid)}
+
+    is_resolved = jobids.isin(list(resolved)).to_numpy()
+    counts = (pd.DataFrame([resolved[jobid] for jobid in jobids[is_resolved]], index=candidates.index[is_resolved])
+              .reindex(columns=gpu_types)
+              .fillna(0)
+              .astype(int))
+
+    queue = queue.copy()
+    if not counts.empty:
+        queue.loc[counts.index, gpu_types] = counts.to_numpy()
+        queue.loc[counts.index, "indeterminate_gpu"] = (queue.loc[counts.index, "gpu"] - counts.sum(axis=1)).clip(lower=0)
+
+    left = queue["indeterminate_gpu"] > 0
+    with _lock:
+        _last_run.clear()
+        _last_run.update({
+            "running jobs to resolve": len(candidates),
+            "looked up": len(uncached),
+            "from cache": len(candidates) - len(uncached),
+            "resolved": int((queue.loc[candidates.index, "indeterminate_gpu"] == 0).sum()),
+            "jobs left indeterminate": int(left.sum()),
+            "GPUs left indeterminate": int((queue.loc[left, "indeterminate_gpu"] * queue.loc[left, "tasks"]).sum()),
+        })
+    return queue
+
+
+def gpu_attribution_df() -> pd.DataFrame:
+    """Return the counts of the last resolve_indeterminate_gpus run (empty before the first run)."""
+    with _lock:
+        return pd.DataFrame([_last_run]) if _last_run else pd.DataFrame()
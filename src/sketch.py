@@ -0,0 +1,186 @@
+"""
+Mergeable quantile sketch for pending times.
+
+Exact percentiles need all values sorted, so every update of a history or an
+incremental view would have to re-sort everything seen so far. A
+QuantileSketch instead keeps weighted counts in logarithmic buckets (the
+DDSketch scheme): a value x > 0 goes to bucket ceil(log(x) / log(gamma)),
+with gamma = (1 + a) / (1 - a) for a relative accuracy a.
+
+Error bound: for values of at least `min_value`, any quantile returned is
+within a relative error of `relative_accuracy` of the exact value at that
+rank (with the default 1%, a true p90 of 10 hours is reported as between
+9.9 and 10.1 hours). Values below `min_value` (e.g. jobs pending for less
+than a second) are counted in a zero bucket and reported as 0.
+
+Memory is bounded by `max_bins`: one bin covers a factor of gamma, so with
+the defaults 2048 bins span 1 s to far beyond any pending time. Should the
+limit be reached, the lowest bins are merged, which only loses accuracy for
+the lowest quantiles.
+
+Sketches with the same parameters can be merged (across snapshots, groups or
+clusters), and merging gives the same result as sketching all the values at
+once.
+
+Provides:
+- QuantileSketch: add weighted values, merge, query quantiles and the median, and
+  round values to their buckets
+- sketch_by_group: one sketch per group of a DataFrame, in a single pass
+"""
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+
+class QuantileSketch:
+    """Relative-error quantile sketch over weighted, non-negative values."""
+
+    def __init__(self, relative_accuracy: float = 0.01, max_bins: int = 2048, min_value: float = 1.0):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        if max_bins < 1 or min_value <= 0:
+            raise ValueError("max_bins must be at least 1 and min_value positive")
+
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = np.log(self.gamma)
+
+        self.keys = np.array([], dtype=np.int64)      # sorted bucket indexes
+        self.counts = np.array([], dtype=float)       # weight per bucket
+        self.zero_count = 0.0
+
+    @property
+    def count(self) -> float:
+        """Total weight of the values added."""
+        return self.zero_count + self.counts.sum()
+
+    def bucket_keys(self, values: np.ndarray) -> np.ndarray:
+        """Return the bucket index of each value (values must be >= min_value)."""
+        return np.ceil(np.log(values) / self.log_gamma).astype(np.int64)
+
+    def bucket_values(self, keys: np.ndarray) -> np.ndarray:
+        """Return the value reported for each bucket index (the bucket's midpoint in relative terms)."""
+        return 2 * self.gamma ** np.asarray(keys, dtype=float) / (self.gamma + 1)
+
+    def round(self, values) -> np.ndarray:
+        """
+        Round values (NaN kept) to the value they are reported as once sketched: the midpoint of
+        their bucket, or 0 below min_value. A sketch of rounded values equals a sketch of the originals.
+        """
+        values = np.asarray(values, dtype=float)
+        rounded = np.where(np.isnan(values), np.nan, 0.0)
+        keep = values >= self.min_value
+        rounded[keep] = self.bucket_values(self.bucket_keys(values[keep]))
+        return rounded
+
+    def add(self, values, weights=None) -> "QuantileSketch":
+        """Add values (NaN skipped), each with a weight (default 1)."""
+        values = np.asarray(values, dtype=float)
+        weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=float)
+
+        valid = ~np.isnan(values)
+        values, weights = values[valid], weights[valid]
+        if (values < 0).any():
+            raise ValueError("QuantileSketch only accepts non-negative values")
+
+        low = values < self.min_value
+        self.zero_count += weights[low].sum()
+        return self.add_buckets(self.bucket_keys(values[~low]), weights[~low])
+
+    def add_buckets(self, keys: np.ndarray, counts: np.ndarray) -> "QuantileSketch":
+        """Add weights to buckets (keys need not be sorted or unique)."""
+        all_keys, inverse = np.unique(np.concatenate([self.keys, keys]), return_inverse=True)
+        all_counts = np.zeros(len(all_keys))
+        np.add.at(all_counts, inverse, np.concatenate([self.counts, counts]))
+        self.keys, self.counts = all_keys, all_counts
+        self._collapse()
+        return self
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """Add the values of another sketch (with the same parameters) to this one."""
+        if (other.relative_accuracy, other.min_value) != (self.relative_accuracy, self.min_value):
+            raise ValueError("Only sketches with the same relative_accuracy and min_value can be merged")
+        self.zero_count += other.zero_count
+        return self.add_buckets(other.keys, other.counts)
+
+    def _collapse(self):
+        """Merge the lowest buckets into one while there are more than max_bins."""
+        excess = len(self.keys) - self.max_bins
+        if excess > 0:
+            self.counts[excess] += self.counts[:excess].sum()
+            self.keys, self.counts = self.keys[excess:], self.counts[excess:]
+
+    def quantiles(self, qs=DEFAULT_QUANTILES) -> list[float]:
+        """
+        Return the value at each quantile q in [0, 1] (NaN when empty). The rank of quantile q is
+        q * (count - 1), as for the lower value of pandas' linear interpolation.
+        """
+        return self._values_at_ranks(np.asarray(qs, dtype=float) * (self.count - 1))
+
+    def quantile(self, q: float) -> float:
+        return self.quantiles([q])[0]
+
+    def median(self) -> float:
+        """
+        Return the median as pandas computes it on the expanded values (NaN when empty): the mean
+        of the two middle values, each within the relative accuracy.
+        """
+        total = self.count
+        lower, upper = self._values_at_ranks(np.array([(total - 1) // 2, total // 2]))
+        return (lower + upper) / 2
+
+    def _values_at_ranks(self, ranks: np.ndarray) -> list[float]:
+        """Return the value at each rank (0-based position in the sorted values; NaN when empty)."""
+        if self.count == 0:
+            return [np.nan for _ in ranks]
+
+        # Cumulative weight at the end of the zero bucket and of each value bucket
+        cumulative = np.concatenate([[self.zero_count], self.zero_count + np.cumsum(self.counts)])
+        values = np.concatenate([[0.0], self.bucket_values(self.keys)])
+
+        positions = np.searchsorted(cumulative, ranks, side="right")
+        return values[np.minimum(positions, len(values) - 1)].tolist()
+
+
+def sketch_by_group(df: pd.DataFrame, keys: list[str], value_col: str, weight_col: str | None = None,
+                    **sketch_kwargs) -> dict:
+    """
+    Build one QuantileSketch of `value_col` per group of `keys` (timedeltas are sketched in seconds),
+    keyed by the tuple of key values.
+
+    Values are bucketed once for the whole frame, and each group's sketch is filled from a
+    single groupby over (keys, bucket), rather than sorting the values of every group.
+    """
+    template = QuantileSketch(**sketch_kwargs)
+    values = df[value_col]
+    if pd.api.types.is_timedelta64_dtype(values):
+        values = values.dt.total_seconds()
+    values = values.to_numpy(dtype=float)
+    weights = np.ones(len(df)) if weight_col is None else df[weight_col].to_numpy(dtype=float)
+
+    # Groups without any valid value get no sketch
+    valid = ~np.isnan(values)
+    values, weights = values[valid], weights[valid]
+    low = values < template.min_value
+    bucket = np.where(low, 0, template.bucket_keys(np.maximum(values, template.min_value)))
+
+    counts = (pd.DataFrame({**{k: df[k].to_numpy()[valid] for k in keys}, "low": low, "bucket": bucket,
+                            "weight": weights})
+              .groupby(keys + ["low", "bucket"], sort=False, dropna=False)["weight"].sum())
+
+    sketches = {}
+    levels = keys if len(keys) > 1 else keys[0]
+    for key, group in counts.groupby(level=levels, sort=False, dropna=False):
+        key = key if len(keys) > 1 else (key,)
+        is_low = group.index.get_level_values("low").to_numpy(dtype=bool)
+        buckets = group.index.get_level_values("bucket").to_numpy()
+        weight = group.to_numpy()
+
+        sketch = QuantileSketch(**sketch_kwargs)
+        sketch.zero_count = weight[is_low].sum()
+        sketches[key] = sketch.add_buckets(buckets[~is_low], weight[~is_low])
+    return sketches
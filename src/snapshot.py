@@ -0,0 +1,336 @@
+"""
+Binary snapshot files of an analysed queue, for instant reloads.
+
+Building a snapshot means running sinfo and squeue, parsing their text output,
+assigning GPUs and building every analysis group. A snapshot file keeps the
+result: the enriched queue, the capacity tables and the state of every
+analysis group (see AnalysisGroup.detached_state), so that another process (a
+TUI started by another admin, or the next run of a cron job) can start from
+it without touching Slurm.
+
+File layout:
+
+    MAGIC (8 bytes) | format version (uint32) | header length (uint32) | header (JSON) | buffers
+
+The header describes every table column by column, and points at the
+column's buffer (offset, dtype, length) in the buffer section. Buffers are
+contiguous typed arrays, aligned to 64 bytes. Reading maps the file with mmap
+and wraps the buffers with np.frombuffer, so numeric and timedelta columns
+are loaded without copying. String columns are dictionary-encoded (one int32
+code per row plus the distinct strings, NUL-separated), and are decoded with
+one split and one take per column.
+
+Files are written to a temporary file next to the target and renamed over it,
+so readers never see a partly written snapshot. The header records when the
+snapshot was written, so readers can show the age of what they display and
+warn when the writer has stopped updating it.
+
+Provides:
+- write_snapshot: save capacity tables, queue and analysis group pairs
+- read_snapshot: load them back (numeric columns memory-mapped)
+- snapshot_ages: age of each snapshot file read
+- stale_snapshot_files: snapshot files read that are older than STALE_AFTER
+"""
+
+import json
+import mmap
+import os
+import struct
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.analysis_group import AnalysisGroup
+from src.sketch import QuantileSketch
+
+MAGIC = b"HPCQSNAP"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+# Distinct strings of a column are stored joined by this character
+SEPARATOR = "\0"
+
+# MAGIC, format version, header length
+PREAMBLE = struct.Struct("<8sII")
+
+# A snapshot file older than this is reported as stale (e.g. its cron job has stopped)
+STALE_AFTER = timedelta(minutes=30)
+
+# Write time of each snapshot file read, by path
+_created: dict[str, datetime] = {}
+
+# Nullable (masked) pandas dtypes and their array classes
+MASKED_ARRAYS = {
+    "i": pd.arrays.IntegerArray,
+    "u": pd.arrays.IntegerArray,
+    "f": pd.arrays.FloatingArray,
+    "b": pd.arrays.BooleanArray,
+}
+
+
+class SnapshotWriter:
+    """Encode tables into a JSON header plus a list of aligned buffers."""
+
+    def __init__(self):
+        self.buffers = []
+        self.size = 0
+
+    def add_buffer(self, values: np.ndarray) -> dict:
+        """Queue an array for writing and return its location in the buffer section."""
+        values = np.ascontiguousarray(values)
+        offset = -(-self.size // ALIGNMENT) * ALIGNMENT
+        self.buffers.append((offset, values))
+        self.size = offset + values.nbytes
+        return {"offset": offset, "dtype": values.dtype.str, "count": len(values)}
+
+    def encode_strings(self, values: np.ndarray) -> dict:
+        """Dictionary-encode an object array of strings (missing values get code -1)."""
+        missing = pd.isna(values)
+        codes, uniques = pd.factorize(values)
+        text = SEPARATOR.join(uniques)
+        if text.count(SEPARATOR) != max(len(uniques) - 1, 0):
+            raise ValueError(f"Strings containing {SEPARATOR!r} cannot be stored in a snapshot")
+        return {
+            "kind": "str",
+            "missing": _encode_scalar(values[missing][0] if missing.any() else np.nan),
+            "size": len(uniques),
+            "codes": self.add_buffer(codes.astype(np.int32)),
+            "blob": self.add_buffer(np.frombuffer(text.encode(), dtype=np.uint8)),
+        }
+
+    def encode_values(self, col: pd.Series | pd.Index) -> dict:
+        """Encode the values of a column or index."""
+        dtype = col.dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            return {"kind": "category", "ordered": bool(dtype.ordered),
+                    "codes": self.add_buffer(col.cat.codes.to_numpy() if isinstance(col, pd.Series) else col.codes),
+                    "categories": self.encode_values(dtype.categories)}
+        if isinstance(dtype, pd.api.extensions.ExtensionDtype) and dtype.kind in MASKED_ARRAYS:
+            return {"kind": "masked", "dtype": dtype.name,
+                    "values": self.add_buffer(col.to_numpy(dtype=dtype.numpy_dtype, na_value=0)),
+                    "mask": self.add_buffer(np.asarray(pd.isna(col)))}
+        if isinstance(dtype, np.dtype) and dtype.kind in "biufmM":
+            return {"kind": "numpy", "values": self.add_buffer(col.to_numpy())}
+
+        values = np.asarray(col, dtype=object)
+        present = values[~pd.isna(values)] if len(values) else values
+        if all(isinstance(v, str) for v in present):
+            return self.encode_strings(values)
+        if all(isinstance(v, list) for v in values):
+            # e.g. nodelist: lists of node names (with NaN for pending jobs)
+            lengths = np.fromiter(map(len, values), dtype=np.int64, count=len(values))
+            flat = np.array([v for lst in values for v in lst] or [], dtype=object)
+            return {"kind": "list", "lengths": self.add_buffer(lengths),
+                    "items": self.encode_values(pd.Index(flat, dtype=object))}
+        # Small mixed columns (e.g. the summary table's values)
+        return {"kind": "json", "values": [_encode_scalar(v) for v in values]}
+
+    def encode_index(self, index: pd.Index) -> dict:
+        if isinstance(index, pd.MultiIndex):
+            raise ValueError("Snapshots do not support MultiIndex tables")
+        if isinstance(index, pd.RangeIndex):
+            return {"kind": "range", "start": index.start, "stop": index.stop, "step": index.step,
+                    "name": index.name}
+        return {**self.encode_values(index), "name": index.name}
+
+    def encode_frame(self, df: pd.DataFrame) -> dict:
+        return {
+            "type": "frame",
+            "index": self.encode_index(df.index),
+            "columns": [{"name": _encode_scalar(name), **self.encode_values(df[name])} for name in df.columns],
+        }
+
+    def encode(self, value) -> dict:
+        """Encode an analysis group attribute: a table, sketch, container or scalar."""
+        if isinstance(value, pd.DataFrame):
+            return self.encode_frame(value)
+        if isinstance(value, pd.Series):
+            return {"type": "series", "name": _encode_scalar(value.name), "index": self.encode_index(value.index),
+                    **self.encode_values(value)}
+        if isinstance(value, QuantileSketch):
+            return {"type": "sketch", "relative_accuracy": value.relative_accuracy, "max_bins": value.max_bins,
+                    "min_value": value.min_value, "zero_count": float(value.zero_count),
+                    "keys": self.add_buffer(value.keys), "counts": self.add_buffer(value.counts)}
+        if isinstance(value, dict):
+            return {"type": "dict", "items": [[self.encode(k), self.encode(v)] for k, v in value.items()]}
+        if isinstance(value, (list, tuple)):
+            return {"type": type(value).__name__, "items": [self.encode(v) for v in value]}
+        return {"type": "scalar", "value": _encode_scalar(value)}
+
+
+class SnapshotReader:
+    """Decode tables from a header, with buffers taken from a memory map."""
+
+    def __init__(self, buffer, data_offset: int):
+        self.buffer = buffer
+        self.data_offset = data_offset
+
+    def array(self, spec: dict) -> np.ndarray:
+        return np.frombuffer(self.buffer, dtype=np.dtype(spec["dtype"]), count=spec["count"],
+                             offset=self.data_offset + spec["offset"])
+
+    def decode_strings(self, spec: dict) -> np.ndarray:
+        strings = self.array(spec["blob"]).tobytes().decode().split(SEPARATOR) if spec["size"] else []
+        uniques = np.array(strings + [_decode_scalar(spec["missing"])], dtype=object)
+        return uniques[self.array(spec["codes"])]   # code -1 picks the missing value
+
+    def decode_values(self, spec: dict):
+        kind = spec["kind"]
+        if kind == "numpy":
+            return self.array(spec["values"])
+        if kind == "masked":
+            dtype = pd.api.types.pandas_dtype(spec["dtype"])
+            return MASKED_ARRAYS[dtype.kind](self.array(spec["values"]), self.array(spec["mask"]))
+        if kind == "category":
+            categories = pd.Index(self.decode_values(spec["categories"]))
+            return pd.Categorical.from_codes(self.array(spec["codes"]), categories, ordered=spec["ordered"])
+        if kind == "str":
+            return self.decode_strings(spec)
+        if kind == "list":
+            items = list(self.decode_values(spec["items"]))
+            bounds = np.cumsum(np.r_[0, self.array(spec["lengths"])]).tolist()
+            values = np.empty(len(bounds) - 1, dtype=object)
+            values[:] = [items[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+            return values
+        if kind == "json":
+            return np.array([_decode_scalar(v) for v in spec["values"]] or [], dtype=object)
+        raise ValueError(f"Unknown column kind '{kind}' in snapshot")
+
+    def decode_index(self, spec: dict) -> pd.Index:
+        if spec["kind"] == "range":
+            return pd.RangeIndex(spec["start"], spec["stop"], spec["step"], name=spec["name"])
+        return pd.Index(self.decode_values(spec), name=spec["name"], copy=False)
+
+    def decode_frame(self, spec: dict) -> pd.DataFrame:
+        columns = [_decode_scalar(col["name"]) for col in spec["columns"]]
+        values = {name: self.decode_values(col) for name, col in zip(columns, spec["columns"])}
+        return pd.DataFrame(values, index=self.decode_index(spec["index"]), columns=columns, copy=False)
+
+    def decode(self, spec: dict):
+        kind = spec["type"]
+        if kind == "frame":
+            return self.decode_frame(spec)
+        if kind == "series":
+            return pd.Series(self.decode_values(spec), index=self.decode_index(spec["index"]),
+                             name=_decode_scalar(spec["name"]), copy=False)
+        if kind == "sketch":
+            sketch = QuantileSketch(spec["relative_accuracy"], spec["max_bins"], spec["min_value"])
+            sketch.zero_count = spec["zero_count"]
+            sketch.keys, sketch.counts = self.array(spec["keys"]), self.array(spec["counts"])
+            return sketch
+        if kind == "dict":
+            return {self.decode(k): self.decode(v) for k, v in spec["items"]}
+        if kind == "list":
+            return [self.decode(v) for v in spec["items"]]
+        if kind == "tuple":
+            return tuple(self.decode(v) for v in spec["items"])
+        if kind == "scalar":
+            return _decode_scalar(spec["value"])
+        raise ValueError(f"Unknown value type '{kind}' in snapshot")
+
+
+def _encode_scalar(value):
+    """Encode a JSON scalar, keeping NaN, NaT and timedeltas apart from strings."""
+    if isinstance(value, np.timedelta64):
+        value = pd.Timedelta(value)
+    elif isinstance(value, np.generic):
+        value = value.item()
+    if value is pd.NaT:
+        return {"nat": True}
+    if isinstance(value, pd.Timedelta):
+        return {"timedelta": value.value}
+    if isinstance(value, float) and np.isnan(value):
+        return {"nan": True}
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    raise TypeError(f"Cannot store {type(value).__name__} values in a snapshot")
+
+
+def _decode_scalar(value):
+    if isinstance(value, dict):
+        if "timedelta" in value:
+            return pd.Timedelta(value["timedelta"])
+        return pd.NaT if value.get("nat") else np.nan
+    return value
+
+
+def write_snapshot(path, nodes_df: pd.DataFrame, node_partitions_df: pd.DataFrame, queue: pd.DataFrame,
+                   analysis_group_pairs: list) -> Path:
+    """Write the capacity tables, queue and analysis group pairs to a snapshot file (atomically)."""
+    path = Path(path)
+    writer = SnapshotWriter()
+
+    # Groups are stored without their queue slice, as row positions into the queue
+    pairs = [[{"state": writer.encode(group.detached_state()),
+               "positions": writer.add_buffer(queue.index.get_indexer(group.queue.index).astype(np.int64))}
+              for group in pair] for pair in analysis_group_pairs]
+    header = json.dumps({
+        "created": datetime.now().isoformat(),
+        "tables": {name: writer.encode_frame(df) for name, df in
+                   [("nodes", nodes_df), ("node_partitions", node_partitions_df), ("queue", queue)]},
+        "analysis_group_pairs": pairs,
+    }).encode()
+
+    data_offset = -(-(PREAMBLE.size + len(header)) // ALIGNMENT) * ALIGNMENT
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+            f.write(header)
+            for offset, values in writer.buffers:
+                f.seek(data_offset + offset)
+                f.write(values.tobytes())
+            f.truncate(data_offset + writer.size)
+            f.flush()
+            os.fsync(f.fileno())
+        tmp_path.replace(path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return path
+
+
+def read_snapshot(path):
+    """
+    Read a snapshot file. Returns (nodes_df, node_partitions_df, queue, analysis_group_pairs), as
+    load_snapshot in main.py does. Numeric columns are read-only views of the memory-mapped file.
+    """
+    with open(path, "rb") as f:
+        # The map stays open for as long as any array refers to it
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(buffer) < PREAMBLE.size:
+        raise ValueError(f"{path} is not a snapshot file")
+    magic, version, header_length = PREAMBLE.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a snapshot file")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"{path} has snapshot format {version}, expected {FORMAT_VERSION}")
+
+    header = json.loads(buffer[PREAMBLE.size:PREAMBLE.size + header_length])
+    _created[str(path)] = datetime.fromisoformat(header["created"])
+    reader = SnapshotReader(buffer, -(-(PREAMBLE.size + header_length) // ALIGNMENT) * ALIGNMENT)
+    tables = {name: reader.decode_frame(spec) for name, spec in header["tables"].items()}
+    queue = tables["queue"]
+
+    pairs = []
+    for pair in header["analysis_group_pairs"]:
+        pairs.append(tuple(AnalysisGroup.from_state(reader.decode(spec["state"]),
+                                                    queue.iloc[reader.array(spec["positions"])])
+                           for spec in pair))
+
+    return tables["nodes"], tables["node_partitions"], queue, pairs
+
+
+def snapshot_ages(now: datetime | None = None) -> dict[str, timedelta]:
+    """Return the age (to the second) of each snapshot file read by read_snapshot, by path."""
+    now = now or datetime.now()
+    return {path: timedelta(seconds=int((now - created).total_seconds())) for path, created in _created.items()}
+
+
+def stale_snapshot_files(now: datetime | None = None) -> list[str]:
+    """Return a warning for each snapshot file read that is older than STALE_AFTER, with its age."""
+    return [f"STALE snapshot file {path} written {age} ago"
+            for path, age in snapshot_ages(now).items() if age > STALE_AFTER]
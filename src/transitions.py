@@ -0,0 +1,192 @@
+"""
+Job transitions between consecutive queue snapshots.
+
+A single snapshot shows how many jobs are running or pending, but not how
+fast work is moving through the queue. Comparing two enriched queue
+snapshots (as returned by get_queue_data) tells how many jobs started,
+finished or changed pending reason in between, which is what shows whether
+a partition is draining.
+
+Snapshots are matched with a merge join on sorted `jobid` arrays
+(np.searchsorted), so a refresh costs two sorts rather than a Python lookup
+per job. With collapsed arrays (--collapse-arrays), the job ID of an array's
+pending row lists its remaining tasks (e.g. `123_[5-100]`) and changes every
+time one of them starts, so pending array rows are matched on their array ID
+(`123_[...]`) instead. The started task itself shows up as a new running job
+(`123_5`).
+
+Provides:
+- diff_snapshots: start, completion and reason change events between two snapshots
+- ThroughputTracker: per analysis group event counts and resource deltas over
+  a rolling window of refreshes
+"""
+
+from collections import deque
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+EVENT_COLUMNS = ["jobid", "event", "partition", "reason", "old_reason", "tasks", "gpu", "time_limit"]
+
+
+def _match_keys(jobids: pd.Series) -> np.ndarray:
+    """Job IDs to match snapshots on, with the task list of collapsed array rows dropped."""
+    return jobids.astype(str).str.replace(r"_\[.*\]$", "_[...]", regex=True).to_numpy(dtype=str)
+
+
+def _match_jobids(prev_ids: np.ndarray, curr_ids: np.ndarray) -> np.ndarray:
+    """
+    Merge join two jobid arrays. Returns, for each row of `prev_ids`, the row of the same
+    jobid in `curr_ids` (or -1 if absent).
+    """
+    order = np.argsort(curr_ids, kind="stable")
+    sorted_curr = curr_ids[order]
+
+    pos = np.searchsorted(sorted_curr, prev_ids)
+    found = pos < len(sorted_curr)
+    found[found] = sorted_curr[pos[found]] == prev_ids[found]
+
+    match = np.full(len(prev_ids), -1)
+    match[found] = order[pos[found]]
+    return match
+
+
+def diff_snapshots(prev: pd.DataFrame, curr: pd.DataFrame) -> pd.DataFrame:
+    """
+    Return one row per transition between two queue snapshots, with an `event` column of:
+
+    - "start": running now, and pending (or not yet submitted) before
+    - "completion": running before, and gone or no longer running now
+    - "reason change": pending in both, with a different pending reason
+
+    Start and reason change rows describe the job in `curr`, completion rows the job in `prev`.
+    """
+    match = _match_jobids(_match_keys(prev["jobid"]), _match_keys(curr["jobid"]))
+    matched = match >= 0
+    in_prev = np.zeros(len(curr), dtype=bool)
+    in_prev[match[matched]] = True
+
+    prev_state = prev["state"].to_numpy()
+    curr_state = curr["state"].to_numpy()
+
+    # State of each current job in the previous snapshot ("" for new jobs)
+    state_before = np.full(len(curr), "", dtype=object)
+    state_before[match[matched]] = prev_state[matched]
+    reason_before = np.full(len(curr), "", dtype=object)
+    reason_before[match[matched]] = prev["reason"].to_numpy()[matched]
+
+    started = (curr_state == "RUNNING") & (state_before != "RUNNING")
+    completed = (prev_state == "RUNNING") & ~(matched & (curr_state[np.maximum(match, 0)] == "RUNNING"))
+    reason_changed = (in_prev & (curr_state == "PENDING") & (state_before == "PENDING")
+                      & (curr["reason"].to_numpy() != reason_before))
+
+    columns = [c for c in EVENT_COLUMNS if c in curr.columns]
+    events = pd.concat([
+        curr.loc[started, columns].assign(event="start"),
+        prev.loc[completed, columns].assign(event="completion"),
+        curr.loc[reason_changed, columns].assign(event="reason change",
+                                                 old_reason=reason_before[reason_changed]),
+    ], ignore_index=True)
+
+    return events.reindex(columns=EVENT_COLUMNS)
+
+
+def _group_jobids(analysis_group_pairs) -> dict[str, np.ndarray]:
+    """Map each analysis group name to the jobids in its running and pending queues."""
+    return {
+        running.name: np.concatenate([running.queue["jobid"].to_numpy(dtype=str),
+                                      pending.queue["jobid"].to_numpy(dtype=str)])
+        for running, pending in analysis_group_pairs
+    }
+
+
+def _group_running_totals(analysis_group_pairs) -> dict[str, tuple[float, float]]:
+    """Map each analysis group name to the (cpus, GPUs) allocated to its running jobs."""
+    totals = {}
+    for running, _ in analysis_group_pairs:
+        allocated = running.weighted_resources.sum()
+        gpu_cols = [res for res in running.resource_list if res not in {"cpu", "mem_gb"}]
+        totals[running.name] = (allocated.get("cpu", 0), allocated[gpu_cols].sum())
+    return totals
+
+
+class ThroughputTracker:
+    """Accumulates per analysis group transitions over consecutive snapshots and reports rolling rates."""
+
+    def __init__(self, window: timedelta = timedelta(minutes=15)):
+        self.window = window
+        self.intervals = deque()    # (start time, end time, per-group counts DataFrame)
+        self.previous = None        # (time, queue, group jobids, group running totals)
+
+    def update(self, queue: pd.DataFrame, analysis_group_pairs, now: datetime | None = None):
+        """Record a new snapshot, diffing it against the previous one."""
+        now = now or datetime.now()
+        group_jobids = _group_jobids(analysis_group_pairs)
+        running_totals = _group_running_totals(analysis_group_pairs)
+
+        if self.previous is not None:
+            prev_time, prev_queue, prev_jobids, prev_totals = self.previous
+            events = diff_snapshots(prev_queue, queue)
+            counts = self._count_events(events, prev_jobids, group_jobids, prev_totals, running_totals)
+            self.intervals.append((prev_time, now, counts))
+
+        self.previous = (now, queue, group_jobids, running_totals)
+
+        while self.intervals and self.intervals[0][1] < now - self.window:
+            self.intervals.popleft()
+
+    @staticmethod
+    def _count_events(events, prev_jobids, group_jobids, prev_totals, running_totals) -> pd.DataFrame:
+        """Count events per analysis group (completions by previous membership, others by current)."""
+        event_ids = events["jobid"].to_numpy(dtype=str)
+        tasks = events["tasks"].to_numpy()
+        gpu_hours = (tasks * events["gpu"].to_numpy()
+                     * pd.to_timedelta(events["time_limit"]).dt.total_seconds().fillna(0).to_numpy() / 3600)
+        kinds = {kind: (events["event"] == kind).to_numpy() for kind in ["start", "completion", "reason change"]}
+
+        rows = []
+        for name, jobids in group_jobids.items():
+            in_group = np.isin(event_ids, jobids)
+            in_prev_group = np.isin(event_ids, prev_jobids.get(name, np.array([], dtype=str)))
+            started = kinds["start"] & in_group
+            cpu, gpu = running_totals[name]
+            prev_cpu, prev_gpu = prev_totals.get(name, (cpu, gpu))
+            rows.append({
+                "group": name,
+                "started": tasks[started].sum(),
+                "completed": tasks[kinds["completion"] & in_prev_group].sum(),
+                "reason changes": tasks[kinds["reason change"] & in_group].sum(),
+                "GPU-h started": gpu_hours[started].sum(),
+                "Δ cpu": cpu - prev_cpu,
+                "Δ gpu": gpu - prev_gpu,
+            })
+        return pd.DataFrame(rows).set_index("group")
+
+    def summary_df(self) -> pd.DataFrame:
+        """Per analysis group totals and rates over the rolling window."""
+        columns = ["group", "started", "completed", "reason changes", "starts/min", "completions/min",
+                   "GPU-h started", "Δ cpu", "Δ gpu"]
+        if not self.intervals:
+            return pd.DataFrame(columns=columns)
+
+        minutes = self.window_minutes()
+        totals = pd.concat([counts for _, _, counts in self.intervals]).groupby(level=0, sort=False).sum()
+
+        # Keep the current config order of the groups
+        totals = totals.reindex(self.previous[2].keys(), fill_value=0)
+        return (totals
+                .assign(**{"starts/min": lambda df: (df["started"] / minutes).round(2),
+                           "completions/min": lambda df: (df["completed"] / minutes).round(2),
+                           "GPU-h started": lambda df: df["GPU-h started"].round(1),
+                           "Δ cpu": lambda df: df["Δ cpu"].round().astype(int),
+                           "Δ gpu": lambda df: df["Δ gpu"].round().astype(int)})
+                .rename_axis("group")
+                .reset_index()
+                .loc[:, columns])
+
+    def window_minutes(self) -> float:
+        """Length in minutes of the period currently covered by the rolling window."""
+        if not self.intervals:
+            return 0.0
+        return (self.intervals[-1][1] - self.intervals[0][0]).total_seconds() / 60
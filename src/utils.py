@@ -4,32 +4,60 @@ Utility functions for parsing Slurm‑style strings.
 Currently includes:
 - expand_nodelist: expands compact nodelist syntax (e.g. 'node[01-03]')
   into explicit node names.
+- count_array_tasks: counts the tasks in a collapsed job array ID
+  (e.g. '123_[0-99%10]').
 """
 
 import re
 
 def expand_nodelist(nodelist: str) -> str:
-    """Expand SLURM-style nodelist (e.g. 'gpu[1-2]') into full node names."""
+    """Expand SLURM-style nodelist (e.g. 'gpu[01-02],smp3') into full node names."""
     # Return unchanged if there's no need for expansion
     if not nodelist or '[' not in nodelist:
         return nodelist
 
-    # Extract base name (e.g. node, gpu, smp) and numeric ranges
-    match = re.match(r'(\w+)\[([\d,-]+)\]', nodelist)
-    if not match:
+    # A nodelist is a comma separated list of names, each optionally followed by numeric ranges
+    entry = r'([\w.-]+)(?:\[([\d,-]+)\])?'
+    if not re.fullmatch(rf'{entry}(?:,{entry})*', nodelist):
         raise ValueError("Invalid nodelist format")
 
-    base_name, ranges = match.groups()
-
-    # Expand numeric ranges
     expanded_nodes = []
-    for part in ranges.split(','):
-        if '-' in part:
-            start, end = part.split('-')
-            for i in range(int(start), int(end) + 1):
-                expanded_nodes.append(f"{base_name}{i}")
-        else:
-            expanded_nodes.append(f"{base_name}{part}")
+    for base_name, ranges in re.findall(entry, nodelist):
+        if not ranges:
+            expanded_nodes.append(base_name)
+            continue
+
+        # Expand numeric ranges, keeping any zero padding (e.g. 'gpu[08-10]' -> gpu08, gpu09, gpu10)
+        for part in ranges.split(','):
+            if '-' in part:
+                start, end = part.split('-')
+                for i in range(int(start), int(end) + 1):
+                    expanded_nodes.append(f"{base_name}{i:0{len(start)}d}")
+            else:
+                expanded_nodes.append(f"{base_name}{part}")
 
     # Join expanded nodes into a final string
     return ','.join(expanded_nodes)
+
+
+def count_array_tasks(jobid: str) -> int:
+    """Count tasks in a collapsed SLURM job array ID (e.g. '123_[0-9,20-29:2%5]'); 1 for plain job IDs."""
+    # Plain jobs and individual array tasks (e.g. '123_4') count as a single task
+    match = re.fullmatch(r'\d+_\[([^\]]*)\]', jobid)
+    if not match:
+        return 1
+
+    # Drop the '%N' throttle, which limits concurrency but not the number of tasks
+    spec = match.group(1).split('%')[0]
+
+    count = 0
+    for part in spec.split(','):
+        range_match = re.fullmatch(r'(\d+)(?:-(\d+)(?::(\d+))?)?', part)
+        if not range_match:
+            raise ValueError(f"Invalid job array format: {jobid}")
+        start, end, step = range_match.groups()
+        if end is None:
+            count += 1
+        else:
+            count += len(range(int(start), int(end) + 1, int(step or 1)))
+    return count
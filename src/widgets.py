@@ -1,11 +1,17 @@
 """
 Utility functions for building Textual widgets used in the HPC Queue Analyser app.
 
-Includes Markdown summaries, color-coded tables, and DataFrame renderers.
+Includes Markdown summaries, color-coded tables, DataFrame renderers and
+per-node allocation heatmaps.
+
+DataFrames are formatted for display column by column (prepare_table), and
+the result can be kept in render_cache for the current snapshot, so tabs that
+are recomposed without new data do not format every cell again.
 """
 
-from textual.widgets import DataTable
+from textual.widgets import DataTable, Static
 from rich.text import Text
+import numpy as np
 import pandas as pd
 
 
@@ -22,6 +28,8 @@ def make_summary_datatable(df: pd.DataFrame) -> DataTable:
         "Users": "👥",
         "Jobs": "🔧", 
         "Pending Time (Median)": "⏳",
+        "Pending Time (p90)": "⏳",
+        "Pending Time (p99)": "⏳",
     }
 
     table = DataTable(zebra_stripes=False)
@@ -36,43 +44,133 @@ def make_summary_datatable(df: pd.DataFrame) -> DataTable:
     table.show_header = False
     return table
 
-def make_datatable(data, highlight_col: str = None, cmap: dict = None) -> DataTable:
-    """Convert a pandas DataFrame or Series into a Textual DataTable with optional row highlighting."""
-    table = DataTable()
+class PreparedTable:
+    """Column labels and rows of formatted, justified and styled cells, ready to add to a DataTable."""
+
+    def __init__(self, columns: list[str], rows: list[list[Text]]):
+        self.columns = columns
+        self.rows = rows
+
+
+class RenderCache:
+    """
+    Prepared tables of the current snapshot, keyed by a caller-chosen table key.
+
+    Setting a new snapshot version drops the tables of the previous one, so a table is
+    only prepared once per snapshot however often the tabs are recomposed. Without a
+    version (None), nothing is cached.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.tables: dict = {}
+
+    def set_version(self, version):
+        if version != self.version:
+            self.version = version
+            self.tables = {}
+
+    def get(self, key, prepare):
+        if self.version is None:
+            return prepare()
+        if key not in self.tables:
+            self.tables[key] = prepare()
+        return self.tables[key]
+
+
+render_cache = RenderCache()
+
+
+def get_row_colors(values: pd.Series, cmap: dict) -> np.ndarray:
+    """Vectorised get_row_color over a column ("" where the value is not a number)."""
+    thresholds = sorted(cmap.keys())
+    colors = np.array(["white"] + [cmap[t] for t in thresholds], dtype=object)
+
+    numbers = pd.to_numeric(values, errors="coerce").to_numpy(dtype=float)
+    valid = np.isfinite(numbers)
+    styles = np.full(len(values), "", dtype=object)
+    styles[valid] = colors[np.searchsorted(thresholds, np.trunc(numbers[valid]), side="right")]
+    return styles
 
-    df = data.to_frame().T if isinstance(data, pd.Series) else data.reset_index(drop=True)
-
-    table.add_columns(*df.columns.astype(str).tolist())
-
-    # Helper to wrap a cell in a Text object with correct justification and style
-    def format_cell(cell, dtype, style=""):
-        if pd.isna(cell):
-            text = "—"
-        elif pd.api.types.is_float_dtype(dtype):
-            text = f"{cell:,.2f}"   # format floats nicely
-        elif pd.api.types.is_integer_dtype(dtype):
-            text = f"{cell:,}"      # add thousands separator
-        else:
-            text = str(cell)
-
-        justify = "right" if pd.api.types.is_numeric_dtype(dtype) else "left"
-        return Text(text, style=style, justify=justify)
-
-    for row in df.itertuples(index=False, name=None):
-        row_style = None
-        if highlight_col and cmap and highlight_col in df.columns:
-            try:
-                idx = df.columns.get_loc(highlight_col)
-                row_style = get_row_color(int(row[idx]), cmap)
-            except Exception:
-                pass
-
-        styled_row = [
-            format_cell(cell, dtype, style=row_style or "")
-            for cell, dtype in zip(row, df.dtypes)
-        ]
-        table.add_row(*styled_row)
 
+def format_column(col: pd.Series) -> tuple[list[str], str]:
+    """Return the display text of every cell in a column, and the column's justification."""
+    if pd.api.types.is_float_dtype(col.dtype):
+        fmt = "{:,.2f}".format     # format floats nicely
+    elif pd.api.types.is_integer_dtype(col.dtype):
+        fmt = "{:,}".format        # add thousands separator
+    else:
+        fmt = str
+
+    # object dtype keeps pandas scalars (e.g. Timedelta) rather than numpy ones
+    values = col.to_numpy(dtype=object)
+    text = ["—" if missing else fmt(value) for value, missing in zip(values, pd.isna(values))]
+
+    justify = "right" if pd.api.types.is_numeric_dtype(col.dtype) else "left"
+    return text, justify
+
+
+def prepare_table(data, highlight_col: str = None, cmap: dict = None, sort_by: str = None) -> PreparedTable:
+    """
+    Format a pandas DataFrame or Series for a DataTable, optionally sorted (descending) by a column
+    and with rows coloured by the value of `highlight_col`.
+
+    Formatting, justification and row colours are worked out once per column rather than per cell.
+    """
+    df = data.to_frame().T if isinstance(data, pd.Series) else data
+    if sort_by is not None:
+        df = df.sort_values(by=sort_by, ascending=False)
+    df = df.reset_index(drop=True)
+
+    if highlight_col and cmap and highlight_col in df.columns:
+        row_styles = get_row_colors(df[highlight_col], cmap)
+    else:
+        row_styles = np.full(len(df), "", dtype=object)
+
+    columns = [format_column(df.iloc[:, i]) for i in range(df.shape[1])]
+    rows = [
+        [Text(texts[i], style=style, justify=justify) for texts, justify in columns]
+        for i, style in enumerate(row_styles)
+    ]
+    return PreparedTable(df.columns.astype(str).tolist(), rows)
+
+
+def make_datatable(data, highlight_col: str = None, cmap: dict = None, sort_by: str = None,
+                   cache_key=None, drilldown: tuple | None = None) -> DataTable:
+    """
+    Convert a pandas DataFrame or Series into a Textual DataTable with optional row highlighting.
+
+    With a `cache_key`, the prepared rows are reused from render_cache until the snapshot version changes.
+    With `drilldown` = (analysis group, key columns), rows can be selected to list the group's jobs
+    matching the row's values in the key columns.
+    """
+    if cache_key is None:
+        prepared = prepare_table(data, highlight_col, cmap, sort_by)
+    else:
+        prepared = render_cache.get(cache_key, lambda: prepare_table(data, highlight_col, cmap, sort_by))
+
+    table = DataTable()
+    table.add_columns(*prepared.columns)
+    table.add_rows(prepared.rows)
+
+    table.drilldown = drilldown
+    if drilldown is not None:
+        table.cursor_type = "row"
     return table
 
 
+def make_node_heatmap(df: pd.DataFrame, cmap: dict) -> Static:
+    """Render per-node allocation % as one row of coloured blocks per resource (one block per node)."""
+    text = Text()
+    for res in df.columns.drop("node"):
+        text.append(f"{res}\n", style="bold")
+        for value in df[res]:
+            if pd.isna(value):
+                text.append("·", style="dim")
+            else:
+                text.append("█", style=get_row_color(int(value), cmap))
+        text.append("\n\n")
+
+    if df.empty:
+        text.append("No nodes", style="dim")
+    return Static(text)
@@ -0,0 +1,219 @@
+"""
+Differential harness for the sinfo/squeue preprocessing pipeline.
+
+Speeding up process_capacity_data or preprocess_squeue_data is only safe if
+the new code gives exactly the same tables. This harness:
+
+- generates Slurm outputs (sinfo, squeue --Format, squeue --format), both a
+  fixed set of edge cases and randomised clusters of any size
+- runs every registered pipeline implementation on each of them
+- asserts that all implementations return identical node, bridge and queue
+  tables, and reports the time each one took
+
+The reference is compared with the chunked parsing of --max-memory
+(src/budget.py), which preprocesses each chunk separately. A new engine is
+compared against the reference by adding it to PIPELINES, or passing it to
+run_harness, with the same signature as reference_pipeline.
+
+Run `python -m tests.preprocess_harness --jobs 20000 --nodes 2000` for the
+timings on a larger cluster.
+"""
+
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from src.budget import split_squeue_output
+from src.capacities import clean_sinfo_output, normalize_capacity_data, process_capacity_data
+from src.queue import parse_squeue_output, preprocess_squeue_data
+
+SINFO_HEADER = "NODELIST|PARTITION|CPUS|MEMORY|GRES"
+SQUEUE_LONG_HEADER = "JOBID               PENDING_TIME        TRES_ALLOC"
+SQUEUE_SHORT_HEADER = "JOBID|STATE|REASON|PARTITION|USER|TRES_PER_NODE|NODELIST|TIME_LEFT|TIME_LIMIT|PRIORITY|JOBID"
+
+# Node kinds of the generated clusters: (name prefix, partitions, GRES)
+NODE_KINDS = [
+    ("cpu", ["hipri", "lowpri*", "medpri"], "(null)"),
+    ("smp", ["himem"], "(null)"),
+    ("gpu", ["gpu-a100", "gpu-any"], "gpu:a100:4(S:0-1)"),
+    ("gpu", ["gpu-h100", "gpu-any"], "gpu:h100:4(S:0-1)"),
+    ("mig", ["gpu-mig"], "gpu:nvidia_a100_1g.10gb:7(S:0),gpu:nvidia_a100_3g.40gb:2(S:1)"),
+    ("mix", ["gpu-mixed"], "gpu:v100:2(S:0),gpu:a100:2(S:1)"),
+]
+
+EDGE_CASE_OUTPUTS = {
+    "sinfo": "\n".join([
+        SINFO_HEADER,
+        "cpu01|hipri*|64|512000|(null)",
+        "cpu01|lowpri|64|512000|(null)",
+        "cpu02|hipri*|64|512000|(null)",
+        "gpu01|gpu-a100|48|256000|gpu:a100:4(S:0-1)",
+        "gpu02|gpu-a100|48|256000|gpu:a100:4(S:0-1)",
+        "mig01|gpu-mig|32|128000|gpu:nvidia_a100_1g.10gb:7(S:0),gpu:nvidia_a100_3g.40gb:2(S:1)",
+        "mix01|gpu-mixed|32|128000|gpu:v100:2(S:0),gpu:a100:2(S:1)",
+        "nogres01|gpu-untyped|16|64000|gpu:2",
+    ]) + "\n",
+    "squeue_long": "\n".join([
+        SQUEUE_LONG_HEADER,
+        "1                   10                  cpu=4,mem=16G,node=1,billing=4",
+        "2                   N/A                 cpu=8,mem=32G,node=2,billing=8,gres/gpu=8",
+        "3                   0                   N/A",
+        "4                   120                 cpu=2,node=1,gres/gpu=1",
+        "5                   3600                cpu=1,mem=500M,node=1,gres/gpu=1",
+        "6                   7200                cpu=16,mem=1.5T,node=1,gres/gpu=2",
+        "7_[0-9%2]           50                  cpu=1,mem=4G,node=1",
+        "8                   5                   cpu=4,mem=16G,node=1,gres/gpu=1",
+        "9                   60                  cpu=2,mem=8G,node=1,gres/gpu=1",
+        "10                  70                  cpu=2,mem=8G,node=1,gres/gpu=3",
+        "11                  80                  cpu=2,mem=8G,node=1",
+    ]) + "\n",
+    "squeue_short": "\n".join([
+        SQUEUE_SHORT_HEADER,
+        "1|RUNNING|None|hipri|alice|N/A|cpu[01-02]|1:00:00|2:00:00|100|1",
+        "2|RUNNING|None|gpu-a100|bob|gres/gpu:a100:4|gpu[01-02]|1-00:00:00|2-00:00:00|200|2",
+        "3|PENDING|Dependency|hipri|carol|N/A||INVALID|UNLIMITED|N/A|3",
+        "4|PENDING|Priority|gpu-a100,gpu-mig|alice|gres/gpu:1||2:00:00|2:00:00|300|4",
+        "5|PENDING|Resources|gpu-mig|bob|gres/gpu:nvidia_a100_1g.10gb:1||30:00|30:00|400|5",
+        "6|PENDING|Priority|gpu-mixed|carol|gres/gpu:b200:2||2:00:00|2:00:00|500|6",
+        "7_[0-9%2]|PENDING|JobArrayTaskLimit|lowpri|dave|N/A||10:00|10:00|50|7",
+        "8|RUNNING|None|gpu-mixed|dave|gres/gpu:1|mix01|1:00:00|2:00:00|600|8",
+        "9|RUNNING|None|gpu-untyped|erin|gres/gpu:1|nogres01|1:00:00|2:00:00|700|9",
+        "10|PENDING|ReqNodeNotAvail, UnavailableNodes:gpu01|gpu-a100|erin|gres/gpu:a100:3||1:00:00|1:00:00|800|10",
+        "12|COMPLETING|None|hipri|frank|N/A|cpu01|0:00|1:00:00|900|12",
+    ]) + "\n",
+}
+
+
+def generate_slurm_outputs(n_jobs: int, n_nodes: int, seed: int = 0) -> dict[str, str]:
+    """Generate sinfo and squeue outputs for a random cluster, mixing in the edge cases of EDGE_CASE_OUTPUTS."""
+    rng = random.Random(seed)
+
+    sinfo = [SINFO_HEADER]
+    nodes = []
+    for i in range(n_nodes):
+        prefix, partitions, gres = NODE_KINDS[i % len(NODE_KINDS)]
+        name = f"{prefix}{i:04d}"
+        nodes.append((name, [p.rstrip("*") for p in partitions], gres))
+        sinfo += [f"{name}|{p}|{rng.choice([32, 64, 128])}|{rng.choice([256000, 512000])}|{gres}"
+                  for p in partitions]
+
+    long, short = [SQUEUE_LONG_HEADER], [SQUEUE_SHORT_HEADER]
+    for j in range(n_jobs):
+        jobid = str(1000 + j)
+        name, partitions, gres = nodes[rng.randrange(len(nodes))]
+        gpu_types = [g.split(":")[1] for g in gres.split(",")] if gres != "(null)" else []
+        gpus = rng.choice([1, 2]) if gpu_types else 0
+        n_job_nodes = rng.choice([1, 1, 1, 2])
+        cpu = rng.choice([1, 4, 16])
+        mem = rng.choice(["4G", "500M", "1.5T", None])
+
+        tres = f"cpu={cpu}" + (f",mem={mem}" if mem else "") + f",node={n_job_nodes}"
+        tres += f",gres/gpu={gpus * n_job_nodes}" if gpus else ""
+        if rng.random() < 0.02:
+            tres = "N/A"
+
+        tres_per_node = "N/A"
+        if gpus:
+            gpu_type = rng.choice(gpu_types + ["", "unknown"])
+            tres_per_node = f"gres/gpu:{gpu_type}:{gpus}" if gpu_type else f"gres/gpu:{gpus}"
+
+        partition = ",".join(partitions[:rng.choice([1, len(partitions)])])
+        user = f"user{rng.randrange(20)}"
+        pending_time = "N/A" if rng.random() < 0.02 else str(rng.randrange(100000))
+
+        if rng.random() < 0.4:
+            first = nodes.index((name, partitions, gres))
+            nodelist = name if n_job_nodes == 1 else f"{name[:-4]}[{first:04d},{(first + 6) % n_nodes:04d}]"
+            state, reason = "RUNNING", "None"
+        else:
+            nodelist, state = "", "PENDING"
+            reason = rng.choice(["Priority", "Resources", "Dependency", "QOSMaxGRESPerUser"])
+            if rng.random() < 0.1:
+                jobid += f"_[0-{rng.randrange(1, 50)}%4]"
+
+        time_limit = rng.choice(["30:00", "2:00:00", "1-00:00:00", "UNLIMITED"])
+        long.append(f"{jobid:<20}{pending_time:<20}{tres}")
+        short.append(f"{jobid}|{state}|{reason}|{partition}|{user}|{tres_per_node}|{nodelist}|"
+                     f"{time_limit}|{time_limit}|{rng.randrange(1000, 5000)}|{1000 + j}")
+
+    return {
+        "sinfo": "\n".join(sinfo) + "\n" + EDGE_CASE_OUTPUTS["sinfo"].split("\n", 1)[1],
+        "squeue_long": "\n".join(long) + "\n" + EDGE_CASE_OUTPUTS["squeue_long"].split("\n", 1)[1],
+        "squeue_short": "\n".join(short) + "\n" + EDGE_CASE_OUTPUTS["squeue_short"].split("\n", 1)[1],
+    }
+
+
+def reference_pipeline(outputs: dict[str, str]) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """Process Slurm outputs with the current implementation into (nodes_df, node_partitions_df, queue_df)."""
+    nodes_df, node_partitions_df = normalize_capacity_data(process_capacity_data(clean_sinfo_output(outputs["sinfo"])))
+    raw = parse_squeue_output(outputs["squeue_long"], outputs["squeue_short"])
+    return nodes_df, node_partitions_df, preprocess_squeue_data(raw, nodes_df, node_partitions_df)
+
+
+def chunked_pipeline(outputs: dict[str, str], n_chunks: int = 4) -> tuple[pd.DataFrame, pd.DataFrame, pd.DataFrame]:
+    """
+    Process the squeue outputs in chunks split by job ID, as --max-memory does (before pending rows
+    are reduced), and restore the job order of the single merge.
+    """
+    nodes_df, node_partitions_df = normalize_capacity_data(process_capacity_data(clean_sinfo_output(outputs["sinfo"])))
+    chunks = [preprocess_squeue_data(parse_squeue_output(*chunk), nodes_df, node_partitions_df)
+              for chunk in split_squeue_output(outputs["squeue_long"], outputs["squeue_short"], n_chunks)]
+    queue = pd.concat(chunks, ignore_index=True).sort_values("jobid", kind="stable", ignore_index=True)
+    return nodes_df, node_partitions_df, queue
+
+
+PIPELINES = {
+    "reference": reference_pipeline,
+    "chunked": chunked_pipeline,
+}
+
+
+def compare_pipelines(outputs: dict[str, str], pipelines: dict | None = None) -> dict[str, float]:
+    """
+    Run each pipeline on the same outputs and assert that all of them return identical tables.
+
+    Returns the run time in seconds of each pipeline. The first pipeline is the one the others are
+    compared against.
+    """
+    pipelines = pipelines or PIPELINES
+    results, timings = {}, {}
+    for name, pipeline in pipelines.items():
+        t0 = time.perf_counter()
+        results[name] = pipeline(outputs)
+        timings[name] = time.perf_counter() - t0
+
+    reference_name, reference = next(iter(results.items()))
+    for name, result in results.items():
+        for table, expected, actual in zip(["nodes_df", "node_partitions_df", "queue_df"], reference, result):
+            try:
+                pd.testing.assert_frame_equal(actual, expected)
+            except AssertionError as e:
+                raise AssertionError(f"{name} differs from {reference_name} in {table}: {e}") from None
+    return timings
+
+
+def run_harness(pipelines: dict | None = None, n_jobs: int = 2000, n_nodes: int = 200,
+                seeds=range(3)) -> pd.DataFrame:
+    """Compare the pipelines on the edge cases and on one random cluster per seed, and return timings in ms."""
+    cases = {"edge cases": EDGE_CASE_OUTPUTS}
+    cases.update({f"random (seed {seed})": generate_slurm_outputs(n_jobs, n_nodes, seed) for seed in seeds})
+
+    rows = []
+    for case, outputs in cases.items():
+        timings = compare_pipelines(outputs, pipelines)
+        rows.append({"case": case, **{name: round(t * 1000, 1) for name, t in timings.items()}})
+    return pd.DataFrame(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare preprocessing pipeline implementations")
+    parser.add_argument("--jobs", type=int, default=2000, help="Jobs in each random cluster")
+    parser.add_argument("--nodes", type=int, default=200, help="Nodes in each random cluster")
+    parser.add_argument("--seeds", type=int, default=3, help="Number of random clusters")
+    args = parser.parse_args()
+
+    timings = run_harness(n_jobs=args.jobs, n_nodes=args.nodes, seeds=range(args.seeds))
+    print("All pipelines agree. Time per pipeline (ms):")
+    print(timings.to_string(index=False))
@@ -0,0 +1,125 @@
+import pickle
+
+import pandas as pd
+
+import src.analysis_group_builder as builder
+from src.analysis_group import AnalysisGroup
+from src.analysis_group_builder import build_analysis_group_pairs, compare_build_modes
+from src.capacities import normalize_capacity_data
+
+
+nodes, node_partitions = normalize_capacity_data(pd.DataFrame({
+    "node": ["node1", "node2", "gpu1"],
+    "partition": ["part1", "part2", "gpu"],
+    "cpu": [4, 4, 8],
+    "mem_gb": [16.0, 16.0, 32.0],
+    "a100": [0, 0, 4],
+}))
+
+queue = pd.DataFrame({
+    "jobid": ["1", "2", "3", "4"],
+    "state": ["RUNNING", "PENDING", "RUNNING", "PENDING"],
+    "user": ["alice", "bob", "alice", "carol"],
+    "partition": ["part1", "part2", "gpu", "gpu"],
+    "partition_list": [["part1"], ["part2"], ["gpu"], ["gpu"]],
+    "nodelist": [["node1"], ["nan"], ["gpu1"], ["nan"]],
+    "reason": ["None", "Priority", "None", "Resources"],
+    "cpu": [2, 4, 4, 8],
+    "mem_gb": [4.0, 8.0, 8.0, 16.0],
+    "a100": [0, 0, 2, 4],
+    "tasks": [1, 3, 1, 1],
+    "pending_time": pd.to_timedelta([0, 60, 0, 120], unit="s"),
+}, index=[10, 11, 12, 13])
+
+config = {"analysis_groups": [
+    {"name": "Cluster", "criteria": {}},
+    {"name": "GPU", "criteria": {"gpu_types": ["a100"]}},
+    {"name": "Part2", "criteria": {"partitions": ["part2"], "custom_queue_mask": "queue['cpu'] > 1"}},
+]}
+
+def test_parallel_build_matches_serial_build_in_config_order():
+    serial = build_analysis_group_pairs(queue, nodes, node_partitions, config)
+    parallel = build_analysis_group_pairs(queue, nodes, node_partitions, config, workers=2)
+
+    assert [r.name for r, _ in parallel] == ["Cluster", "GPU", "Part2"]
+    for serial_pair, parallel_pair in zip(serial, parallel):
+        for expected, group in zip(serial_pair, parallel_pair):
+            pd.testing.assert_frame_equal(group.queue, expected.queue)
+            for attr in ["summary_stats_df", "allocation_df", "grpby_user_df", "pending_time_df",
+                         "node_allocation_df", "fragmentation_df"]:
+                pd.testing.assert_frame_equal(getattr(group, attr), getattr(expected, attr))
+
+def test_group_by_template_matches_explicit_groups():
+    template = {"analysis_groups": [{"name": "GPU {value}", "group_by": "gpu_type"},
+                                    {"name": "{value}", "group_by": "partition"}]}
+    explicit = {"analysis_groups": [{"name": "GPU a100", "criteria": {"gpu_types": ["a100"]}},
+                                    *({"name": p, "criteria": {"partitions": [p]}} for p in ["gpu", "part1", "part2"])]}
+
+    generated = build_analysis_group_pairs(queue, nodes, node_partitions, template)
+    expected = build_analysis_group_pairs(queue, nodes, node_partitions, explicit)
+
+    assert [r.name for r, _ in generated] == ["GPU a100", "gpu", "part1", "part2"]
+    for generated_pair, expected_pair in zip(generated, expected):
+        for group, expected_group in zip(generated_pair, expected_pair):
+            pd.testing.assert_frame_equal(group.queue, expected_group.queue)
+            pd.testing.assert_series_equal(group.capacity, expected_group.capacity)
+            for attr in ["summary_stats_df", "allocation_df", "grpby_user_df", "grpby_partition_df",
+                         "pending_time_df"]:
+                pd.testing.assert_frame_equal(getattr(group, attr), getattr(expected_group, attr))
+
+def test_shared_node_counts_once_towards_group_capacity():
+    shared_nodes, shared_partitions = normalize_capacity_data(pd.DataFrame({
+        "node": ["node1", "node1", "node2"],
+        "partition": ["part1", "part2", "part2"],
+        "cpu": [4, 4, 8],
+        "mem_gb": [16.0, 16.0, 32.0],
+    }))
+    config = {"analysis_groups": [
+        {"name": "Both", "criteria": {"partitions": ["part1", "part2"]}},
+        {"name": "Custom", "criteria": {"custom_capacity_mask": "capacity['partition'] == 'part1'"}},
+    ]}
+
+    (both, _), (custom, _) = build_analysis_group_pairs(queue.iloc[:2], shared_nodes, shared_partitions, config)
+
+    assert both.capacity["cpu"] == 12
+    assert custom.capacity["cpu"] == 4
+
+def test_groups_pickle_with_their_queue_and_transfer_without_it():
+    (running, _), *_ = build_analysis_group_pairs(queue, nodes, node_partitions, config)
+
+    unpickled = pickle.loads(pickle.dumps(running))
+    pd.testing.assert_frame_equal(unpickled.queue, running.queue)
+
+    state = running.detached_state()
+    assert "queue" not in state and "weighted_resources" not in state
+    rebuilt = AnalysisGroup.from_state(state, queue.loc[running.queue.index])
+    pd.testing.assert_frame_equal(rebuilt.weighted_resources, running.weighted_resources)
+
+def test_build_benchmark_without_fork_reports_serial_only(monkeypatch):
+    monkeypatch.setattr(builder.multiprocessing, "get_all_start_methods", lambda: ["spawn"])
+    df = compare_build_modes(queue, nodes, node_partitions, config, workers=4)
+    assert list(df["mode"]) == ["serial"]
+
+def test_template_groups_are_spread_over_workers():
+    template = {"analysis_groups": [{"name": "{value}", "group_by": "partition"}]}
+
+    # One config entry, but one parallel task per generated group
+    selections = builder._group_selections(queue, nodes, node_partitions, template)
+    assert [selection[0] for selection in selections] == ["gpu", "part1", "part2"]
+
+    serial = build_analysis_group_pairs(queue, nodes, node_partitions, template)
+    parallel = build_analysis_group_pairs(queue, nodes, node_partitions, template, workers=2)
+
+    assert [r.name for r, _ in parallel] == ["gpu", "part1", "part2"]
+    for serial_pair, parallel_pair in zip(serial, parallel):
+        for expected, group in zip(serial_pair, parallel_pair):
+            pd.testing.assert_frame_equal(group.queue, expected.queue)
+            pd.testing.assert_frame_equal(group.allocation_df, expected.allocation_df)
+
+def test_template_name_may_repeat_another_group():
+    clashing = {"analysis_groups": [{"name": "part1", "criteria": {"partitions": ["part1", "part2"]}},
+                                    {"name": "{value}", "group_by": "partition"}]}
+    pairs = build_analysis_group_pairs(queue, nodes, node_partitions, clashing)
+
+    assert [r.name for r, _ in pairs] == ["part1", "gpu", "part1", "part2"]
+    assert pairs[0][0].capacity["cpu"] == 8 and pairs[2][0].capacity["cpu"] == 4
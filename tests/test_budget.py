@@ -0,0 +1,92 @@
+import tracemalloc
+
+import pandas as pd
+
+import src.budget as budget
+from src.analysis_group_builder import build_analysis_group_pairs
+from src.budget import get_queue_data_within_budget, split_squeue_output
+from src.capacities import clean_sinfo_output, normalize_capacity_data, process_capacity_data
+from src.queue import parse_squeue_output, preprocess_squeue_data
+from tests.preprocess_harness import generate_slurm_outputs
+
+RAW_LONG = """JOBID               PENDING_TIME        TRES_ALLOC
+1000                600                 cpu=1,mem=4G,node=1,billing=1
+1001                0                   cpu=16,mem=64G,node=1,billing=16
+1002_7              1200                cpu=2,mem=8G,node=1,billing=2
+"""
+
+RAW_SHORT = """JOBID|STATE|REASON|PARTITION|USER|TRES_PER_NODE|NODELIST|TIME_LEFT|TIME_LIMIT|PRIORITY|JOBID
+1001|RUNNING|None|cpu|bob|N/A|node01|1:00:00|2:00:00|900|1001
+1002_7|PENDING|Priority|cpu|alice|N/A||2:00:00|2:00:00|100|1002
+1000|PENDING|Resources|cpu|alice|N/A||1:00:00|2:00:00|500|1000
+"""
+
+CONFIG = {"analysis_groups": [
+    {"name": "Cluster", "criteria": {}},
+    {"name": "GPU", "criteria": {"gpu_types": ["a100", "h100"]}},
+    {"name": "{value}", "group_by": "partition"},
+]}
+
+
+def test_split_squeue_output_keeps_each_job_in_one_chunk():
+    chunks = split_squeue_output(RAW_LONG, RAW_SHORT, 3)
+    assert iter(chunks) is chunks    # generated one at a time
+    chunks = list(chunks)
+    assert len(chunks) == 3
+
+    for raw_long, raw_short in chunks:
+        assert raw_long.startswith("JOBID ") and raw_short.startswith("JOBID|")
+        long_ids = {line.split()[0] for line in raw_long.splitlines()[1:]}
+        short_ids = {line.split("|")[0] for line in raw_short.splitlines()[1:]}
+        assert long_ids == short_ids
+
+    all_ids = [line.split("|")[0] for _, raw_short in chunks for line in raw_short.splitlines()[1:]]
+    assert sorted(all_ids) == ["1000", "1001", "1002_7"]
+
+
+def budget_outputs(monkeypatch, n_jobs):
+    """Generated Slurm outputs, with squeue returning them, and the capacity tables of their cluster."""
+    outputs = generate_slurm_outputs(n_jobs, n_nodes=200)
+    monkeypatch.setattr(budget, "fetch_squeue_output",
+                        lambda expand_arrays: (outputs["squeue_long"], outputs["squeue_short"]))
+    return outputs, *normalize_capacity_data(process_capacity_data(clean_sinfo_output(outputs["sinfo"])))
+
+
+def test_budget_groups_match_full_queue_groups(monkeypatch):
+    outputs, nodes_df, node_partitions_df = budget_outputs(monkeypatch, n_jobs=3000)
+    queue = preprocess_squeue_data(parse_squeue_output(outputs["squeue_long"], outputs["squeue_short"]),
+                                   nodes_df, node_partitions_df)
+
+    # Small chunks, so that the aggregates of several chunks are merged
+    kept, pending_sums = get_queue_data_within_budget(nodes_df, node_partitions_df, CONFIG, max_memory_mb=1)
+    assert (kept["state"] != "PENDING").all()
+
+    expected = build_analysis_group_pairs(queue, nodes_df, node_partitions_df, CONFIG)
+    pairs = build_analysis_group_pairs(kept, nodes_df, node_partitions_df, CONFIG, pending_sums=pending_sums)
+    assert [r.name for r, _ in pairs] == [r.name for r, _ in expected]
+
+    for (_, pending), (_, expected_pending) in zip(pairs, expected):
+        assert pending.queue.empty
+        for attr in ["allocation_df", "grpby_user_df", "grpby_partition_df"]:
+            pd.testing.assert_frame_equal(getattr(pending, attr), getattr(expected_pending, attr))
+
+        # Medians come from the sketches, within 1% (and rounded down to the second)
+        exact = ["median pending time"]
+        pd.testing.assert_frame_equal(pending.pending_time_df.drop(columns=exact),
+                                      expected_pending.pending_time_df.drop(columns=exact))
+        difference = (pending.pending_time_df[exact[0]] - expected_pending.pending_time_df[exact[0]]).abs()
+        assert (difference <= expected_pending.pending_time_df[exact[0]] * 0.01 + pd.Timedelta(seconds=1)).all()
+
+
+def test_peak_memory_stays_within_budget(monkeypatch):
+    _, nodes_df, node_partitions_df = budget_outputs(monkeypatch, n_jobs=8000)
+    max_memory_mb = 12
+
+    tracemalloc.start()
+    try:
+        get_queue_data_within_budget(nodes_df, node_partitions_df, CONFIG, max_memory_mb)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert peak <= max_memory_mb * 1e6
@@ -0,0 +1,25 @@
+import pandas as pd
+
+from src.capacities import normalize_capacity_data
+
+
+capacity = pd.DataFrame({
+    "node": ["node1", "node1", "node2", "gpu1"],
+    "partition": ["part1", "part2", "part1", "gpu"],
+    "cpu": [4, 4, 8, 8],
+    "mem_gb": [16.0, 16.0, 32.0, 32.0],
+    "a100": [0, 0, 0, 4],
+})
+
+def test_node_table_has_one_row_per_node():
+    nodes, _ = normalize_capacity_data(capacity)
+
+    assert nodes["node"].tolist() == ["node1", "node2", "gpu1"]
+    assert nodes.columns.tolist() == ["node", "cpu", "mem_gb", "a100"]
+    assert nodes["cpu"].sum() == 20
+
+def test_bridge_maps_node_ids_to_partitions():
+    _, node_partitions = normalize_capacity_data(capacity)
+
+    pairs = list(zip(node_partitions["node_id"], node_partitions["partition"]))
+    assert pairs == [(0, "part1"), (0, "part2"), (1, "part1"), (2, "gpu")]
@@ -0,0 +1,19 @@
+import pytest
+
+from src.config_loader import validate_cfg
+
+
+def test_group_by_template_without_criteria_is_valid():
+    validate_cfg({"analysis_groups": [{"name": "Partition {value}", "group_by": "partition"}]})
+
+def test_unknown_group_by_key_raises():
+    with pytest.raises(ValueError, match="unknown group_by key"):
+        validate_cfg({"analysis_groups": [{"name": "{value}", "group_by": "account"}]})
+
+def test_group_by_name_without_placeholder_raises():
+    with pytest.raises(ValueError, match="must contain"):
+        validate_cfg({"analysis_groups": [{"name": "GPUs", "group_by": "gpu_type"}]})
+
+def test_plain_group_still_requires_criteria():
+    with pytest.raises(KeyError, match="criteria"):
+        validate_cfg({"analysis_groups": [{"name": "Cluster"}]})
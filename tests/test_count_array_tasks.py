@@ -0,0 +1,18 @@
+import pytest
+from src.utils import count_array_tasks
+
+def test_plain_job_counts_as_one_task():
+    assert count_array_tasks("12345") == 1
+
+def test_single_array_task_counts_as_one_task():
+    assert count_array_tasks("12345_7") == 1
+
+def test_collapsed_range_with_throttle():
+    assert count_array_tasks("123_[0-99999%50]") == 100000
+
+def test_collapsed_mixed_ranges_and_steps():
+    assert count_array_tasks("123_[1,3,10-19:3]") == 6
+
+def test_invalid_array_spec_raises_valueerror():
+    with pytest.raises(ValueError, match="Invalid job array format"):
+        count_array_tasks("123_[1-]")
@@ -13,3 +13,9 @@ def test_expand_nodelist_with_single_node():
 def test_expand_nodelist_with_invalid_format_raises_valueerror():
     with pytest.raises(ValueError, match="Invalid nodelist format"):
         expand_nodelist("node[1")
+
+def test_expand_nodelist_keeps_zero_padding():
+    assert expand_nodelist("gpu[08-10]") == "gpu08,gpu09,gpu10"
+
+def test_expand_nodelist_with_multiple_groups():
+    assert expand_nodelist("node[1-2],gpu[03,05],smp1") == "node1,node2,gpu03,gpu05,smp1"
@@ -0,0 +1,68 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+import src.fetch as fetch
+from src.fetch import FetchError, fetch_snapshot, run_slurm_command, set_fetch_policy, stale_snapshots
+
+
+@pytest.fixture(autouse=True)
+def restore_fetch_state():
+    """Keep the module's policy, stats and last good snapshots from leaking between tests."""
+    policy = dict(fetch.FETCH_POLICY)
+    state = [dict(fetch._command_stats), dict(fetch._last_good), dict(fetch._stale)]
+    yield
+    fetch.FETCH_POLICY.update(policy)
+    for current, saved in zip([fetch._command_stats, fetch._last_good, fetch._stale], state):
+        current.clear()
+        current.update(saved)
+
+
+def test_run_slurm_command_retries_then_fails():
+    with pytest.raises(FetchError, match="3 attempts"):
+        run_slurm_command(["sh", "-c", "exit 1"], name="failing", retries=2, backoff=0)
+
+
+def test_run_slurm_command_timeout():
+    with pytest.raises(FetchError, match="timed out"):
+        run_slurm_command(["sleep", "5"], name="hanging", timeout=0.1, retries=0)
+
+
+def test_run_slurm_command_empty_output():
+    assert run_slurm_command(["true"], require_output=False, retries=0) == ""
+    with pytest.raises(FetchError, match="empty output"):
+        run_slurm_command(["true"], retries=0)
+
+
+def test_fetch_snapshot_falls_back_to_last_good(tmp_path):
+    good = fetch_snapshot("test_snap", {"a": ["echo", "first"], "b": ["echo", "second"]}, cache_dir=tmp_path)
+    assert good == {"a": "first\n", "b": "second\n"}
+
+    served = fetch_snapshot("test_snap", {"a": ["echo", "new"], "b": ["sh", "-c", "exit 1"]},
+                            cache_dir=tmp_path, retries=0)
+    assert served == good
+    assert any(w.startswith("STALE test_snap") for w in stale_snapshots())
+
+    fetch_snapshot("test_snap", {"a": ["echo", "third"], "b": ["echo", "fourth"]}, cache_dir=tmp_path)
+    assert not any(w.startswith("STALE test_snap") for w in stale_snapshots())
+
+
+def test_fetch_snapshot_without_last_good(tmp_path):
+    with pytest.raises(FetchError):
+        fetch_snapshot("test_no_cache", {"a": ["sh", "-c", "exit 1"]}, cache_dir=tmp_path, retries=0)
+
+
+def test_fetch_snapshot_rejects_last_good_past_max_age(tmp_path):
+    fetched_at = datetime.now() - timedelta(hours=2)
+    path = tmp_path / "last_good" / "test_old.json"
+    path.parent.mkdir()
+    path.write_text(json.dumps({"fetched_at": fetched_at.isoformat(), "outputs": {"a": "old\n"}}))
+    failing = {"a": ["sh", "-c", "exit 1"]}
+
+    with pytest.raises(FetchError, match="too old"):
+        fetch_snapshot("test_old", failing, cache_dir=tmp_path, retries=0)
+    assert not any(w.startswith("STALE test_old") for w in stale_snapshots())
+
+    set_fetch_policy(max_age=3 * 3600)
+    assert fetch_snapshot("test_old", failing, cache_dir=tmp_path, retries=0) == {"a": "old\n"}
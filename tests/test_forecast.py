@@ -0,0 +1,72 @@
+import pandas as pd
+
+from src.capacities import normalize_capacity_data
+from src.forecast import estimate_start_times
+
+
+nodes, node_partitions = normalize_capacity_data(pd.DataFrame({
+    "node": ["node1", "node2"],
+    "partition": ["part1", "part2"],
+    "cpu": [4, 4],
+    "mem_gb": [64.0, 64.0],
+}))
+
+def make_job(jobid, state, cpu, partition="part1", nodelist=(), priority=100,
+             time_left=None, time_limit=3600, tasks=1):
+    return {
+        "jobid": jobid, "state": state, "cpu": cpu, "mem_gb": 1, "node": 1,
+        "partition": partition, "partition_list": [partition], "nodelist": list(nodelist),
+        "priority": priority, "tasks": tasks,
+        "pending_time": pd.Timedelta(0),
+        "time_left": pd.Timedelta(seconds=time_left or 0),
+        "time_limit": pd.Timedelta(seconds=time_limit),
+    }
+
+def estimate(jobs):
+    queue = pd.DataFrame(jobs)
+    est = estimate_start_times(queue, nodes, node_partitions, resolution=1)
+    return {queue.loc[i, "jobid"]: value for i, value in est.items()}
+
+def test_job_that_fits_starts_immediately():
+    est = estimate([make_job("1", "PENDING", cpu=2)])
+    assert est["1"] == pd.Timedelta(0)
+
+def test_blocked_job_starts_when_running_job_ends():
+    est = estimate([
+        make_job("1", "RUNNING", cpu=4, nodelist=["node1"], time_left=3600),
+        make_job("2", "PENDING", cpu=4),
+    ])
+    assert est["2"] == pd.Timedelta(hours=1)
+
+def test_short_job_backfills_without_delaying_higher_priority_job():
+    est = estimate([
+        make_job("1", "RUNNING", cpu=2, nodelist=["node1"], time_left=3600),
+        make_job("2", "PENDING", cpu=4, priority=300, time_limit=7200),
+        make_job("3", "PENDING", cpu=1, priority=200, time_limit=1800),
+        make_job("4", "PENDING", cpu=1, priority=100, time_limit=7200),
+    ])
+    assert est["2"] == pd.Timedelta(hours=1)
+    assert est["3"] == pd.Timedelta(0)
+    assert est["4"] == pd.Timedelta(hours=3)
+
+def test_job_array_tasks_fill_free_cpus():
+    est = estimate([make_job("1_[0-7]", "PENDING", cpu=1, tasks=8, partition="part2")])
+    assert est["1_[0-7]"] == pd.Timedelta(0)
+
+def test_job_larger_than_any_node_is_never_started():
+    est = estimate([make_job("1", "PENDING", cpu=8)])
+    assert pd.isna(est["1"])
+
+def test_collapsed_multi_node_array_places_every_task_that_fits():
+    array = make_job("1_[0-2]", "PENDING", cpu=2, tasks=3, priority=200)
+    array.update(node=2, partition_list=["part1", "part2"])
+    est = estimate([array, make_job("2", "PENDING", cpu=1, priority=100)])
+    assert est["1_[0-2]"] == pd.Timedelta(0)
+    assert est["2"] == pd.Timedelta(0)
+
+def test_pending_job_with_unknown_gpu_type_is_not_estimated():
+    jobs = [make_job("1", "PENDING", cpu=1), make_job("2", "PENDING", cpu=1)]
+    jobs[0]["indeterminate_gpu"], jobs[1]["indeterminate_gpu"] = 2, 0
+    est = estimate(jobs)
+    assert pd.isna(est["1"])
+    assert est["2"] == pd.Timedelta(0)
@@ -0,0 +1,63 @@
+import io
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from src.capacities import normalize_capacity_data
+from src.history import (
+    SACCT_FIELDS,
+    split_time_windows,
+    preprocess_sacct_data,
+    compute_wait_time_percentiles,
+)
+
+
+def make_raw(text):
+    return pd.read_csv(io.StringIO(text), sep="|", header=None, names=SACCT_FIELDS, dtype=str)
+
+
+def test_split_time_windows_covers_range_without_overlap():
+    windows = split_time_windows(datetime(2025, 1, 1), datetime(2025, 1, 3, 12), timedelta(days=1))
+    assert windows == [
+        (datetime(2025, 1, 1), datetime(2025, 1, 2)),
+        (datetime(2025, 1, 2), datetime(2025, 1, 3)),
+        (datetime(2025, 1, 3), datetime(2025, 1, 3, 12)),
+    ]
+
+def test_split_time_windows_rejects_non_positive_window():
+    with pytest.raises(ValueError):
+        split_time_windows(datetime(2025, 1, 1), datetime(2025, 1, 2), timedelta(0))
+
+def test_preprocess_drops_jobs_that_never_started():
+    raw = make_raw(
+        "1|alice|gpu|2025-01-01T10:00:00|2025-01-01T11:00:00|2025-01-01T12:00:00|COMPLETED|None|cpu=4,gres/gpu:a100=2,gres/gpu=2\n"
+        "2|bob|gpu|2025-01-01T10:00:00|None|2025-01-01T10:05:00|CANCELLED by 0|None|\n"
+    )
+    df = preprocess_sacct_data(raw)
+
+    assert df["jobid"].tolist() == ["1"]
+    assert df.loc[0, "wait_time"] == pd.Timedelta(hours=1)
+    assert df.loc[0, "gpu_type"] == "a100"
+
+def test_preprocess_falls_back_to_partition_gpu_type():
+    raw = make_raw(
+        "1|alice|gpu|2025-01-01T10:00:00|2025-01-01T10:10:00|2025-01-01T12:00:00|COMPLETED|None|cpu=4,gres/gpu=1\n"
+        "2|bob|cpu|2025-01-01T10:00:00|2025-01-01T10:20:00|2025-01-01T12:00:00|COMPLETED|None|cpu=4\n"
+    )
+    nodes, node_partitions = normalize_capacity_data(pd.DataFrame({
+        "node": ["g1", "c1"], "partition": ["gpu", "cpu"], "cpu": [8, 8], "mem_gb": [64, 64], "v100": [4, 0]}))
+    df = preprocess_sacct_data(raw, nodes, node_partitions)
+
+    assert df["gpu_type"].tolist() == ["v100", "none"]
+
+def test_wait_time_percentiles_per_partition():
+    history = pd.DataFrame({
+        "partition": ["a", "a", "b"],
+        "wait_time": pd.to_timedelta([60, 120, 30], unit="s"),
+    })
+    out = compute_wait_time_percentiles(history, "partition")
+
+    assert out["partition"].tolist() == ["a", "b"]
+    assert out["jobs"].tolist() == [2, 1]
+    assert out.loc[0, "p50 wait"] == pd.Timedelta(seconds=90)
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from src.job_index import JobIndex
+
+
+queue = pd.DataFrame({
+    "jobid": ["101", "102", "1100", "200_[0-3]", "201"],
+    "state": ["RUNNING", "PENDING", "RUNNING", "PENDING", "PENDING"],
+    "user": ["alice", "alice", "bob", "carol", "bob"],
+    "partition": ["gpu", "gpu", "cpu", "cpu", "gpu,cpu"],
+    "reason": ["None", "Priority", "None", "Resources", "Priority"],
+    "nodelist": [["gpu01", "gpu02"], ["nan"], ["cpu01"], ["nan"], ["nan"]],
+    "tasks": [1, 1, 1, 4, 1],
+    "cpu": [8, 8, 4, 1, 2],
+    "mem_gb": [32, 32, 16, 4, 8],
+    "gpu": [2, 1, 0, 0, 1],
+    "a100": [2, 1, 0, 0, 0],
+    "indeterminate_gpu": [0, 0, 0, 0, 1],
+}, index=[10, 11, 12, 13, 14])
+
+index = JobIndex(queue, ["a100"])
+
+
+def test_select():
+    assert index.select(user="alice").tolist() == [0, 1]
+    assert index.select(user="bob", state="PENDING").tolist() == [4]
+    assert index.select(partition="gpu", reason="Priority").tolist() == [1]
+    assert index.select(user="nobody").tolist() == []
+    assert index.select(within=index.positions_of(pd.Index([11, 14])), state="PENDING").tolist() == [1, 4]
+
+
+def test_search():
+    assert index.search("").tolist() == [0, 1, 2, 3, 4]
+    assert index.search("10").tolist() == [0, 1]          # job ID prefix, not substring
+    assert index.search("ALI").tolist() == [0, 1]         # user, case-insensitive
+    assert index.search("gpu02").tolist() == [0]          # node
+    assert index.search("prio").tolist() == [1, 4]        # reason
+    assert index.search("prio", within=np.array([0, 4])).tolist() == [4]
+
+
+def test_jobs_df():
+    jobs = index.jobs_df(np.array([0, 1, 4]), limit=2)
+    assert jobs["jobid"].tolist() == ["101", "102"]
+    assert jobs["nodelist"].tolist() == ["gpu01,gpu02", ""]
+    assert jobs["gpu"].tolist() == ["a100: 2", "a100: 1"]
+    assert index.jobs_df(np.array([4]))["gpu"].tolist() == ["indeterminate_gpu: 1"]
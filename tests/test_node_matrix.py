@@ -0,0 +1,39 @@
+import numpy as np
+import pandas as pd
+
+from src.capacities import normalize_capacity_data
+from src.node_matrix import NodeAllocationMatrix
+
+
+nodes, node_partitions = normalize_capacity_data(pd.DataFrame({
+    "node": ["node1", "node2", "gpu1", "gpu1"],
+    "partition": ["part1", "part1", "gpu", "part1"],
+    "cpu": [4, 4, 8, 8],
+    "mem_gb": [16.0, 16.0, 32.0, 32.0],
+    "a100": [0, 0, 4, 4],
+}))
+
+queue = pd.DataFrame({
+    "state": ["RUNNING", "RUNNING", "PENDING"],
+    "nodelist": [["node1", "gpu1"], ["node2"], ["nan"]],
+    "cpu": [4, 4, 2],
+    "mem_gb": [8.0, 16.0, 1.0],
+    "a100": [2, 0, 0],
+})
+
+def test_running_jobs_are_split_over_their_nodes():
+    matrix = NodeAllocationMatrix(queue, nodes)
+
+    assert list(matrix.nodes) == ["node1", "node2", "gpu1"]
+    np.testing.assert_array_equal(matrix.allocated, [
+        [2, 4, 0],      # cpu and memory spread evenly over both nodes
+        [4, 16, 0],
+        [2, 4, 2],      # GPUs only on the node that has them
+    ])
+
+def test_fragmentation_is_share_of_free_capacity_on_partial_nodes():
+    matrix = NodeAllocationMatrix(queue, nodes)
+
+    # cpu: node1 has 2 free, gpu1 has 6 free, node2 is full
+    np.testing.assert_allclose(matrix.fragmentation(), [1.0, 1.0, 1.0])
+    np.testing.assert_allclose(matrix.select([1]).fragmentation(), [0.0, 0.0, 0.0])
@@ -0,0 +1,36 @@
+import pandas as pd
+import pytest
+
+from tests.preprocess_harness import EDGE_CASE_OUTPUTS, PIPELINES, compare_pipelines, reference_pipeline, run_harness
+
+
+def test_pipelines_agree():
+    timings = run_harness(PIPELINES, n_jobs=300, n_nodes=30, seeds=range(2))
+    assert list(timings["case"]) == ["edge cases", "random (seed 0)", "random (seed 1)"]
+
+
+def test_edge_cases():
+    nodes_df, _, queue = reference_pipeline(EDGE_CASE_OUTPUTS)
+    jobs = queue.set_index("jobid")
+
+    # MIG slices are separate GPU types; untyped GRES is not counted
+    assert nodes_df.set_index("node").loc["mig01", ["nvidia_a100_1g.10gb", "nvidia_a100_3g.40gb"]].tolist() == [7, 2]
+    assert "gpu" not in nodes_df.columns
+
+    assert pd.isna(jobs.loc["2", "pending_time"])                 # N/A pending time
+    assert jobs.loc["3", ["cpu", "mem_gb", "gpu"]].tolist() == [0, 0, 0]    # missing TRES
+    assert jobs.loc["4", "mem_gb"] == 0                             # missing mem
+    assert jobs.loc["6", "mem_gb"] == 1500
+    assert jobs.loc["5", "nvidia_a100_1g.10gb"] == 1
+    assert jobs.loc["4", "indeterminate_gpu"] == 1                  # multi-partition job
+    assert jobs.loc["6", "indeterminate_gpu"] == 2                  # unknown GPU type
+    assert jobs.loc["7_[0-9%2]", "tasks"] == 10
+
+
+def test_mismatch_is_reported():
+    def off_by_one(outputs):
+        nodes_df, node_partitions_df, queue = reference_pipeline(outputs)
+        return nodes_df, node_partitions_df, queue.assign(cpu=queue["cpu"] + 1)
+
+    with pytest.raises(AssertionError, match="off_by_one differs from reference in queue_df"):
+        compare_pipelines(EDGE_CASE_OUTPUTS, {"reference": reference_pipeline, "off_by_one": off_by_one})
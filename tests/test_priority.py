@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+from src.priority import add_priority_factors, parse_sprio_output, parse_sshare_output, rank_within_partition
+
+SPRIO = """       101|gpu|alice|5000|1000|3000|100|900|0
+       101|cpu|alice|4000|1000|3000|100|-100|0
+       102|gpu|bob|2000|500|1000|100|400|0
+       106|cpu|dave|1500|700|500|100|200|0
+"""
+
+SSHARE = """root||1.000000|1.000000|1.000000
+acct1||0.500000|0.400000|
+acct1|alice|0.250000|0.300000|0.600000
+acct2|alice|0.250000|0.100000|0.800000
+acct1|bob|0.250000|0.500000|0.200000
+"""
+
+
+def make_queue():
+    partitions = ["gpu", "gpu", "gpu", "cpu", "gpu"]
+    return pd.DataFrame({
+        "jobid": ["101", "102", "103", "104", "105"],
+        "record_id": ["101", "102", "103", "104", "105"],
+        "user": ["alice", "bob", "bob", "carol", "alice"],
+        "state": ["PENDING", "PENDING", "PENDING", "PENDING", "RUNNING"],
+        "partition": partitions,
+        "partition_list": [[p] for p in partitions],
+        "priority": [5000, 2000, 2000, 100, 9000],
+        "pending_time": pd.to_timedelta([60, 60, 600, 10, np.nan], unit="s"),
+        "tasks": [1, 3, 2, 1, 1],
+    }, index=[10, 11, 12, 13, 14])
+
+
+def test_parse_sprio_output_keeps_highest_priority_partition():
+    df = parse_sprio_output(SPRIO)
+    assert list(df["jobid"]) == ["101", "102", "106"]
+    assert df.loc[0, "partition_prio"] == 900
+    assert list(df.columns) == ["jobid", "age", "fairshare", "jobsize", "partition_prio", "qos"]
+
+
+def test_parse_sshare_output_one_row_per_user():
+    df = parse_sshare_output(SSHARE).set_index("user")
+    assert sorted(df.index) == ["alice", "bob"]
+    assert df.loc["alice", "fairshare_factor"] == 0.8
+    assert df.loc["bob", "effective_usage"] == 0.5
+
+
+def test_rank_within_partition_counts_tasks_and_breaks_ties_by_pending_time():
+    ranks = rank_within_partition(make_queue())
+    # gpu: 101 (priority 5000), then 103 (same priority as 102 but pending longer, 2 tasks), then 102
+    assert ranks.loc[10] == 1
+    assert ranks.loc[12] == 2
+    assert ranks.loc[11] == 4
+    assert ranks.loc[13] == 1
+    assert np.isnan(ranks.loc[14])
+
+
+def test_add_priority_factors_joins_on_job_and_user():
+    queue = make_queue()
+    df = add_priority_factors(queue, parse_sprio_output(SPRIO), parse_sshare_output(SSHARE))
+
+    assert df.index.equals(queue.index)
+    assert df.loc[10, "age"] == 1000 and df.loc[11, "fairshare"] == 1000
+    assert np.isnan(df.loc[12, "age"])
+    assert df.loc[14, "fairshare_factor"] == 0.8
+    assert np.isnan(df.loc[13, "fairshare_factor"])
+    assert list(df["rank"].fillna(0)) == [1, 4, 2, 1, 0]
+
+
+def test_rank_within_partition_ranks_multi_partition_jobs_in_each_partition():
+    queue = pd.DataFrame({
+        "state": ["PENDING"] * 3,
+        "partition": ["cpu", "gpu,cpu", "gpu"],
+        "partition_list": [["cpu"], ["gpu", "cpu"], ["gpu"]],
+        "priority": [100, 200, 300],
+        "pending_time": pd.to_timedelta([60, 60, 60], unit="s"),
+        "tasks": [1, 1, 2],
+    })
+    # cpu: the gpu,cpu job first, then the cpu job; gpu: the 2 tasks of the gpu job, then gpu,cpu
+    assert rank_within_partition(queue).tolist() == [2, 1, 1]
+
+
+def test_add_priority_factors_joins_array_tasks_on_record_id():
+    queue = pd.concat([make_queue(), pd.DataFrame({
+        "jobid": ["106_3", "106_[4-9]"],
+        "record_id": ["106", "106"],
+        "user": ["dave", "dave"],
+        "state": ["PENDING", "PENDING"],
+        "partition": ["cpu", "cpu"],
+        "partition_list": [["cpu"], ["cpu"]],
+        "priority": [1500, 1500],
+        "pending_time": pd.to_timedelta([30, 30], unit="s"),
+        "tasks": [1, 6],
+    }, index=[15, 16])])
+    df = add_priority_factors(queue, parse_sprio_output(SPRIO), parse_sshare_output(SSHARE))
+
+    # sprio lists the array once, by the numeric ID of its record
+    assert df.loc[[15, 16], "age"].tolist() == [700, 700]
+    assert df.loc[[15, 16, 13], "rank"].tolist() == [1, 2, 8]
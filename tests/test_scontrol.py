@@ -0,0 +1,92 @@
+import pandas as pd
+
+import src.scontrol as scontrol
+from src.scontrol import parse_scontrol_jobs, resolve_indeterminate_gpus
+
+MULTI_LINE = """JobId=101 JobName=train
+   UserId=alice(1001) GroupId=users(100)
+   JobState=RUNNING Reason=None Dependency=(null)
+   NodeList=mix[01-02] NumNodes=2
+     Nodes=mix[01-02] CPU_IDs=0-7 Mem=32000 GRES=gpu:a100:1(IDX:0),gpu:v100:1(IDX:2)
+   TRES=cpu=16,mem=64000M,node=2,billing=16,gres/gpu=4
+
+JobId=102 JobName=sweep
+   ArrayJobId=100 ArrayTaskId=7 ArrayTaskThrottle=5
+   JobState=RUNNING Reason=None
+     Nodes=mig01 CPU_IDs=0-3 Mem=16000 GRES=gpu:nvidia_a100_1g.10gb:2(IDX:0-1)
+"""
+
+ONE_LINE = ("JobId=103 JobName=x JobState=RUNNING NodeList=gpu01 NumNodes=1 "
+            "Nodes=gpu01 CPU_IDs=0-3 Mem=16000 GRES=gpu:2(IDX:0-1)\n"
+            "JobId=104 JobName=y JobState=PENDING NodeList=(null) NumNodes=1\n")
+
+
+def test_parse_scontrol_jobs():
+    assert parse_scontrol_jobs(MULTI_LINE) == {
+        "101": {"a100": 2, "v100": 2},
+        "100_7": {"nvidia_a100_1g.10gb": 2},
+    }
+    assert parse_scontrol_jobs(ONE_LINE) == {"103": {}, "104": {}}
+
+
+def test_resolve_indeterminate_gpus(monkeypatch):
+    calls = []
+
+    def fake_run(cmd, **kwargs):
+        calls.append(cmd[-1])
+        return MULTI_LINE
+
+    monkeypatch.setattr(scontrol, "run_slurm_command", fake_run)
+    monkeypatch.setattr(scontrol, "_resolved", {})
+
+    queue = pd.DataFrame({
+        "jobid": ["101", "100_7", "105"],
+        "state": ["RUNNING", "RUNNING", "PENDING"],
+        "gpu": [4, 2, 1],
+        "tasks": [1, 1, 3],
+        "a100": [0, 0, 0],
+        "v100": [0, 0, 0],
+        "nvidia_a100_1g.10gb": [0, 0, 0],
+        "indeterminate_gpu": [4, 2, 1],
+    })
+    gpu_types = ["a100", "nvidia_a100_1g.10gb", "v100"]
+
+    resolved = resolve_indeterminate_gpus(queue, gpu_types)
+    assert resolved[gpu_types + ["indeterminate_gpu"]].values.tolist() == [[2, 0, 2, 0], [0, 2, 0, 0], [0, 0, 0, 1]]
+    assert sorted(calls) == ["100_7", "101"]    # only running jobs are looked up
+
+    # Cached for as long as the jobs are in the queue
+    resolve_indeterminate_gpus(queue, gpu_types)
+    assert len(calls) == 2
+    summary = scontrol.gpu_attribution_df().iloc[0]
+    assert summary["from cache"] == 2
+    assert summary["GPUs left indeterminate"] == 3
+
+
+def test_many_jobs_are_looked_up_with_one_call(monkeypatch):
+    calls = []
+    n_jobs = 200
+
+    def fake_run(cmd, **kwargs):
+        calls.append(cmd)
+        # The whole job table: the jobs to resolve plus another running job
+        return "".join(f"JobId={i} JobState=RUNNING Nodes=gpu01 CPU_IDs=0-3 Mem=16000 GRES=gpu:a100:1(IDX:0)\n"
+                       for i in range(n_jobs + 1))
+
+    monkeypatch.setattr(scontrol, "run_slurm_command", fake_run)
+    monkeypatch.setattr(scontrol, "_resolved", {})
+
+    queue = pd.DataFrame({
+        "jobid": [str(i) for i in range(n_jobs)],
+        "state": ["RUNNING"] * n_jobs,
+        "gpu": [1] * n_jobs,
+        "tasks": [1] * n_jobs,
+        "a100": [0] * n_jobs,
+        "indeterminate_gpu": [1] * n_jobs,
+    })
+
+    resolved = resolve_indeterminate_gpus(queue, ["a100"])
+    assert resolved["a100"].tolist() == [1] * n_jobs
+    assert calls == [["scontrol", "-d", "-o", "show", "job"]]
+    # Only the jobs looked up are cached
+    assert len(scontrol._resolved) == n_jobs
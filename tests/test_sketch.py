@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.sketch import QuantileSketch, sketch_by_group
+
+rng = np.random.default_rng(0)
+values = rng.lognormal(8, 2, 20000)
+weights = rng.integers(1, 5, len(values))
+
+
+@pytest.mark.parametrize("q", [0.5, 0.9, 0.99])
+def test_relative_error_bound(q):
+    sketch = QuantileSketch(relative_accuracy=0.01).add(values, weights)
+    exact = np.quantile(np.repeat(values, weights), q, method="lower")
+    assert abs(sketch.quantile(q) - exact) <= 0.01 * exact
+
+
+def test_median_averages_the_two_middle_values():
+    assert QuantileSketch().add([100, 1000]).median() == pytest.approx(550, rel=0.01)
+    assert QuantileSketch().add([100, 1000], [2, 1]).median() == pytest.approx(100, rel=0.01)
+    assert np.isnan(QuantileSketch().median())
+
+
+def test_merge_matches_single_sketch():
+    whole = QuantileSketch().add(values, weights)
+    merged = QuantileSketch().add(values[:5000], weights[:5000]).merge(QuantileSketch().add(values[5000:], weights[5000:]))
+    assert merged.quantiles() == whole.quantiles()
+    assert merged.count == weights.sum()
+
+    with pytest.raises(ValueError):
+        whole.merge(QuantileSketch(relative_accuracy=0.05))
+
+
+def test_small_values_empty_and_bounded_memory():
+    sketch = QuantileSketch(max_bins=10).add([0, 0.5, np.nan, 10, 1e3, 1e6])
+    assert sketch.count == 5
+    assert sketch.quantile(0) == 0
+    assert len(sketch.keys) <= 10
+    assert np.isnan(QuantileSketch().quantile(0.5))
+
+    # Collapsing the lowest bins keeps the high quantiles within the error bound
+    bounded = QuantileSketch(max_bins=400).add(values)
+    exact = np.quantile(values, 0.99, method="lower")
+    assert len(bounded.keys) == 400
+    assert abs(bounded.quantile(0.99) - exact) <= 0.01 * exact
+
+
+def test_sketch_by_group():
+    df = pd.DataFrame({
+        "partition": rng.choice(["a", "b"], len(values)),
+        "pending_time": pd.to_timedelta(values, unit="s"),
+        "tasks": weights,
+    })
+    df.loc[:10, "pending_time"] = pd.NaT
+
+    sketches = sketch_by_group(df, ["partition"], "pending_time", "tasks")
+    for (partition,), sketch in sketches.items():
+        group = df[df["partition"] == partition].dropna()
+        expected = QuantileSketch().add(group["pending_time"].dt.total_seconds(), group["tasks"])
+        assert sketch.quantiles() == expected.quantiles()
+        assert sketch.count == expected.count
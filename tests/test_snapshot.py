@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.analysis_group_builder import build_analysis_group_pairs
+from src.capacities import normalize_capacity_data
+from src.snapshot import read_snapshot, snapshot_ages, stale_snapshot_files, write_snapshot
+
+
+nodes, node_partitions = normalize_capacity_data(pd.DataFrame({
+    "node": ["node1", "node2", "gpu1"],
+    "partition": ["part1", "part2", "gpu"],
+    "cpu": [4, 4, 8],
+    "mem_gb": [16.0, 16.0, 32.0],
+    "a100": [0, 0, 4],
+}))
+
+queue = pd.DataFrame({
+    "jobid": ["1", "2", "3", "4"],
+    "state": ["RUNNING", "PENDING", "RUNNING", "PENDING"],
+    "user": ["alice", "bob", "alice", "carol"],
+    "partition": ["part1", "part2", "gpu", "gpu"],
+    "partition_list": [["part1"], ["part2"], ["gpu"], ["gpu"]],
+    "nodelist": [["node1"], [np.nan], ["gpu1"], [np.nan]],
+    "reason": ["None", "Priority", "None", "Resources"],
+    "cpu": [2, 4, 4, 8],
+    "mem_gb": [4.0, 8.0, 8.0, 16.0],
+    "a100": [0, 0, 2, 4],
+    "tasks": [1, 3, 1, 1],
+    "pending_time": pd.to_timedelta([0, 60, 0, 120], unit="s"),
+    "est_start": pd.to_timedelta([np.nan, 30, np.nan, np.nan], unit="s"),
+    "priority": [900, 500, 800, 700],
+    "rank": [np.nan, 1, np.nan, 1],
+    "fairshare_factor": [0.5, 0.25, 0.5, np.nan],
+    "effective_usage": [0.1, 0.4, 0.1, np.nan],
+}, index=[10, 11, 12, 13])
+
+config = {"analysis_groups": [
+    {"name": "Cluster", "criteria": {}},
+    {"name": "GPU", "criteria": {"gpu_types": ["a100"]}},
+]}
+
+
+def test_snapshot_round_trip(tmp_path):
+    pairs = build_analysis_group_pairs(queue, nodes, node_partitions, config)
+    path = write_snapshot(tmp_path / "queue.snap", nodes, node_partitions, queue, pairs)
+    assert [p.name for p in tmp_path.iterdir()] == ["queue.snap"]
+
+    nodes_read, node_partitions_read, queue_read, pairs_read = read_snapshot(path)
+    pd.testing.assert_frame_equal(nodes_read, nodes)
+    pd.testing.assert_frame_equal(node_partitions_read, node_partitions)
+    pd.testing.assert_frame_equal(queue_read, queue)
+
+    # Numeric columns are views of the (read-only) memory map
+    assert not queue_read["cpu"].to_numpy().flags.writeable
+
+    assert [r.name for r, _ in pairs_read] == ["Cluster", "GPU"]
+    for pair, pair_read in zip(pairs, pairs_read):
+        for group, group_read in zip(pair, pair_read):
+            pd.testing.assert_frame_equal(group_read.queue, group.queue)
+            pd.testing.assert_series_equal(group_read.capacity, group.capacity)
+            for attr in ["allocation_df", "grpby_user_df", "pending_time_df", "start_estimate_df",
+                         "priority_by_user_df", "node_allocation_df", "fragmentation_df"]:
+                pd.testing.assert_frame_equal(getattr(group_read, attr), getattr(group, attr))
+            assert group_read.summary_stats_df["Value"].tolist() == group.summary_stats_df["Value"].tolist()
+            assert group_read.pending_time_sketch.quantiles() == group.pending_time_sketch.quantiles()
+            assert group_read.pending_time_sketches.keys() == group.pending_time_sketches.keys()
+
+
+def test_read_snapshot_rejects_other_files(tmp_path):
+    path = tmp_path / "config.yaml"
+    path.write_text("analysis_groups: []\n")
+    with pytest.raises(ValueError, match="not a snapshot file"):
+        read_snapshot(path)
+
+
+def test_snapshot_age_and_staleness(tmp_path):
+    path = write_snapshot(tmp_path / "queue.snap", nodes, node_partitions, queue, [])
+    read_snapshot(path)
+
+    assert snapshot_ages()[str(path)] < timedelta(minutes=1)
+    assert not any(str(path) in w for w in stale_snapshot_files())
+
+    later = datetime.now() + timedelta(hours=1)
+    assert snapshot_ages(later)[str(path)] > timedelta(minutes=59)
+    assert [w for w in stale_snapshot_files(later) if str(path) in w] == [
+        f"STALE snapshot file {path} written {snapshot_ages(later)[str(path)]} ago"]
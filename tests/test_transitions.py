@@ -0,0 +1,106 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from src.analysis_group_builder import build_analysis_group_pairs
+from src.capacities import normalize_capacity_data
+from src.transitions import ThroughputTracker, diff_snapshots
+
+
+def make_snapshot(jobs):
+    return pd.DataFrame([
+        {"jobid": jobid, "state": state, "reason": reason, "partition": "part1",
+         "tasks": 1, "gpu": 1, "time_limit": pd.Timedelta(hours=2)}
+        for jobid, state, reason in jobs
+    ])
+
+prev = make_snapshot([
+    ("1", "RUNNING", "None"),
+    ("2", "PENDING", "Priority"),
+    ("3", "PENDING", "Resources"),
+    ("4", "RUNNING", "None"),
+    ("5", "PENDING", "Priority"),
+])
+curr = make_snapshot([
+    ("5", "PENDING", "Priority"),
+    ("4", "COMPLETING", "None"),
+    ("3", "PENDING", "Priority"),
+    ("2", "RUNNING", "None"),
+    ("6", "RUNNING", "None"),
+])
+
+def test_diff_snapshots_events():
+    events = diff_snapshots(prev, curr)
+    by_event = events.groupby("event")["jobid"].apply(sorted).to_dict()
+
+    assert by_event == {"start": ["2", "6"], "completion": ["1", "4"], "reason change": ["3"]}
+    assert events.loc[events["event"] == "reason change", "old_reason"].tolist() == ["Resources"]
+
+def test_identical_snapshots_have_no_events():
+    assert diff_snapshots(prev, prev).empty
+
+def test_collapsed_array_rows_match_on_array_id():
+    before = make_snapshot([("7_[1-10]", "PENDING", "Priority")])
+    after = make_snapshot([("7_1", "RUNNING", "None"), ("7_[2-10]", "PENDING", "Resources")])
+    events = diff_snapshots(before, after)
+
+    assert events[["jobid", "event"]].values.tolist() == [["7_1", "start"], ["7_[2-10]", "reason change"]]
+    assert events["old_reason"].iloc[1] == "Priority"
+
+
+nodes, node_partitions = normalize_capacity_data(pd.DataFrame({
+    "node": ["node1", "gpu1"],
+    "partition": ["part1", "gpu"],
+    "cpu": [4, 8],
+    "mem_gb": [16.0, 32.0],
+    "a100": [0, 4],
+}))
+
+config = {"analysis_groups": [
+    {"name": "Cluster", "criteria": {}},
+    {"name": "GPU", "criteria": {"gpu_types": ["a100"]}},
+]}
+
+# jobid: (partition, node, cpu, a100 per task, tasks, time limit in hours)
+JOBS = {
+    "1": ("part1", "node1", 2, 0, 1, 1),
+    "2": ("gpu", "gpu1", 4, 2, 1, 3),
+    "3": ("gpu", "gpu1", 2, 1, 2, 1),
+}
+
+def tracker_update(tracker, now, states):
+    queue = pd.DataFrame([
+        {"jobid": jobid, "state": state, "user": "alice", "partition": partition,
+         "partition_list": [partition], "nodelist": [node if state == "RUNNING" else "nan"],
+         "reason": "None" if state == "RUNNING" else "Priority", "cpu": cpu, "mem_gb": 1.0,
+         "a100": gpu, "gpu": gpu, "tasks": tasks, "pending_time": pd.Timedelta(0),
+         "time_limit": pd.Timedelta(hours=hours)}
+        for jobid, state in states.items()
+        for partition, node, cpu, gpu, tasks, hours in [JOBS[jobid]]
+    ])
+    tracker.update(queue, build_analysis_group_pairs(queue, nodes, node_partitions, config), now=now)
+
+def test_throughput_tracker_counts_per_group_over_rolling_window():
+    t0 = datetime(2024, 1, 1, 12)
+    tracker = ThroughputTracker()
+    tracker_update(tracker, t0, {"1": "RUNNING", "2": "PENDING", "3": "PENDING"})
+    assert tracker.summary_df().empty
+
+    tracker_update(tracker, t0 + timedelta(minutes=5), {"2": "RUNNING", "3": "PENDING"})
+    tracker_update(tracker, t0 + timedelta(minutes=10), {"2": "RUNNING", "3": "RUNNING"})
+    summary = tracker.summary_df().set_index("group")
+
+    assert tracker.window_minutes() == 10
+    # Job 1 only counts towards Cluster; started counts tasks (job 3 has 2)
+    assert summary.loc["Cluster", ["started", "completed"]].tolist() == [3, 1]
+    assert summary.loc["GPU", ["started", "completed"]].tolist() == [3, 0]
+    assert summary.loc["GPU", "starts/min"] == 0.3
+    # GPU-h: 1 task x 2 GPUs x 3 h (job 2) + 2 tasks x 1 GPU x 1 h (job 3)
+    assert summary.loc["GPU", "GPU-h started"] == 8.0
+    assert summary.loc["Cluster", ["Δ cpu", "Δ gpu"]].tolist() == [6, 4]
+
+    # Intervals that ended more than 15 minutes ago leave the window
+    tracker_update(tracker, t0 + timedelta(minutes=30), {"2": "RUNNING", "3": "RUNNING"})
+    summary = tracker.summary_df().set_index("group")
+    assert tracker.window_minutes() == 20
+    assert summary["started"].sum() == 0 and summary["GPU-h started"].sum() == 0
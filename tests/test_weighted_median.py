@@ -0,0 +1,21 @@
+import pandas as pd
+
+from src.analysis_group import weighted_median
+
+
+def test_weighted_median_matches_expanded_median():
+    values = pd.to_timedelta([10, 30, 20, 40], unit="s")
+    weights = pd.Series([3, 1, 2, 2])
+    expanded = pd.Series(values.repeat(weights))
+
+    assert weighted_median(pd.Series(values), weights) == expanded.median()
+
+def test_weighted_median_skips_missing_values():
+    values = pd.Series(pd.to_timedelta([10, None, 20], unit="s"))
+    weights = pd.Series([1, 5, 1])
+
+    assert weighted_median(values, weights) == pd.Timedelta(seconds=15)
+
+def test_weighted_median_of_empty_series_is_nat():
+    values = pd.Series([], dtype="timedelta64[ns]")
+    assert pd.isna(weighted_median(values, pd.Series([], dtype=int)))
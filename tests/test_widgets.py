@@ -0,0 +1,40 @@
+import numpy as np
+import pandas as pd
+
+from src.widgets import RenderCache, prepare_table
+
+CMAP = {0: "green", 50: "yellow", 90: "red"}
+
+
+def test_prepare_table_formats_columns():
+    df = pd.DataFrame({
+        "user": ["a", "b", None],
+        "cpu": [1200, 5, 40],
+        "Allocation %": [95.5, 49.9, np.nan],
+    })
+    prepared = prepare_table(df, highlight_col="Allocation %", cmap=CMAP, sort_by="cpu")
+
+    assert prepared.columns == ["user", "cpu", "Allocation %"]
+    cells = [[(cell.plain, cell.justify) for cell in row] for row in prepared.rows]
+    assert cells == [
+        [("a", "left"), ("1,200", "right"), ("95.50", "right")],
+        [("—", "left"), ("40", "right"), ("—", "right")],
+        [("b", "left"), ("5", "right"), ("49.90", "right")],
+    ]
+    assert [str(row[0].style) for row in prepared.rows] == ["red", "", "green"]
+
+
+def test_render_cache_is_keyed_by_version():
+    cache = RenderCache()
+    calls = []
+    prepare = lambda: calls.append(1) or len(calls)
+
+    assert cache.get("key", prepare) == 1
+    assert cache.get("key", prepare) == 2    # no version: nothing cached
+
+    cache.set_version(("squeue", 1))
+    assert cache.get("key", prepare) == 3
+    assert cache.get("key", prepare) == 3
+
+    cache.set_version(("squeue", 2))
+    assert cache.get("key", prepare) == 4